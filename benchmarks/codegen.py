@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    startup of a fresh process: compiled schemas, model classes and
+    endpoint tables of all resource types
+
+    before: the scheme files are read and resolved
+    after:  they are taken from the module generated by codegen
+
+    python benchmarks/codegen.py [runs]
+"""
+import sys
+import os
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+CHILD = '''
+import sys, time, logging
+logging.getLogger().addHandler(logging.NullHandler())
+from mock import Mock
+from salesking import resources
+from salesking.utils import loaders
+if sys.argv[1] == "json":
+    loaders._generated = None
+api = Mock()
+api.base_url = u"https://sk.example/"
+start = time.time()
+for name in sys.argv[2:]:
+    resources.get_model_class(name, api=api)
+    resources.get_endpoint_table(name, api.base_url)
+print time.time() - start
+'''
+
+
+def run(mode, names, runs):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    times = [float(subprocess.check_output([sys.executable, "-c", CHILD, mode] + names, env=env))
+             for x in xrange(runs)]
+    return min(times)
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    from salesking.utils import codegen
+    names = codegen.generate()
+    before = run("json", names, runs)
+    after = run("generated", names, runs)
+    print "%s resource types, best of %s processes" % (len(names), runs)
+    print "before: %8.1fms" % (before * 1000)
+    print "after:  %8.1fms (%.1fx)" % (after * 1000, before / after)
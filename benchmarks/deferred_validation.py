@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    building a client by appending addresses one assignment at a time
+    (warlock cannot validate against the invoice schema, so line items
+    of an invoice can't be compared)
+
+    before: every assignment validates the whole invoice (warlock)
+    after:  assignments are recorded, validate() runs once before save
+
+    python benchmarks/deferred_validation.py [addresses]
+"""
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mock import Mock
+
+from salesking import resources
+
+
+def build(cls, count):
+    start = time.time()
+    client = cls({"organisation": u"salesking", "gender": u"male"})
+    client.addresses = []
+    for x in xrange(count):
+        client.addresses = client.addresses + [
+            {"city": u"Berlin", "address1": u"Street %s" % x, "zip": u"10115", "order": x}]
+    if cls.deferred_validation:
+        client.validate()
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    clnt = Mock()
+    clnt.base_url = u"https://sk.example/"
+    deferred = resources.get_model_class("client", api=clnt)
+    class Eager(deferred):
+        deferred_validation = False
+    before = build(Eager, count)
+    after = build(deferred, count)
+    print "%s addresses" % count
+    print "before: %8.1fms" % (before * 1000)
+    print "after:  %8.1fms (%.1fx)" % (after * 1000, before / after)
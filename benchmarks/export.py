@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    rows/second of the export writers for invoices with 5 line items
+
+    before: materialized col.items, models written field by field
+            with csv.DictWriter
+    after:  export.CsvWriter / NdjsonWriter over property dicts,
+            batched writes
+
+    python benchmarks/export.py [invoices]
+"""
+import sys
+import os
+import csv
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mock import Mock
+
+from salesking import export, resources
+
+
+def make_invoice(x):
+    return {"id": u"i%s" % x, "number": u"R-%05d" % x, "title": u"Invoice %s" % x,
+            "status": u"open", "client_id": u"c%s" % (x % 50), "date": u"2013-01-01",
+            "lock_version": 0, "price_total": 100.5, "tag_list": u"",
+            "created_at": u"2013-01-01T10:00:00+01:00", "updated_at": u"2013-01-01T10:00:00+01:00",
+            "client": {"id": u"c%s" % (x % 50), "organisation": u"org"},
+            "line_items": [{"id": u"l%s-%s" % (x, y), "name": u"item %s" % y, "position": y,
+                            "quantity": 1.5, "price_single": 10.0} for y in xrange(5)]}
+
+
+def export_before(items, path):
+    clnt = Mock()
+    clnt.base_url = u"https://sk.example/"
+    cls = resources.get_model_class("invoice", api=clnt)
+    models = [resources.hydrate_model(cls, item) for item in items]
+    names = export.TableSpec("invoice", "invoice").column_names
+    with open(path, "wb") as f:
+        writer = csv.DictWriter(f, names, extrasaction='ignore')
+        writer.writeheader()
+        for model in models:
+            writer.writerow(dict((key, unicode(value).encode("utf-8"))
+                                 for key, value in model.iteritems() if key in names))
+    return len(models)
+
+
+def run(func, count):
+    start = time.time()
+    func()
+    return count / (time.time() - start)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    items = [make_invoice(x) for x in xrange(count)]
+    target = tempfile.mkdtemp()
+    try:
+        before = run(lambda: export_before(items, os.path.join(target, "before.csv")), count)
+        csv_rate = run(lambda: export.export(iter(items), export.CsvWriter(
+            "invoice", os.path.join(target, "invoices.csv"))), count)
+        ndjson_rate = run(lambda: export.export(iter(items), export.NdjsonWriter(
+            "invoice", os.path.join(target, "invoices.ndjson"))), count)
+        print "%s invoices, %s line items" % (count, count * 5)
+        print "before (models, no line items): %10.1f rows/s" % before
+        print "csv with child file:            %10.1f rows/s (%.1fx)" % (csv_rate, csv_rate / before)
+        print "ndjson:                         %10.1f rows/s (%.1fx)" % (ndjson_rate, ndjson_rate / before)
+    finally:
+        shutil.rmtree(target)
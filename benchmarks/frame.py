@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    monthly revenue per client over invoices
+
+    before: hydrated models, totals added up in a python loop
+    after:  frame.Frame from the property dicts, group_by on the columns
+
+    python benchmarks/frame.py [invoices]
+"""
+import sys
+import os
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mock import Mock
+
+from salesking import frame, resources
+
+
+def make_invoice(x):
+    return {"id": u"i%s" % x, "number": u"R-%05d" % x, "status": u"open",
+            "client_id": u"c%s" % (x % 200), "date": u"2013-%02d-01" % (x % 12 + 1),
+            "net_total": 100.0 + x % 7, "gross_total": 119.0 + x % 7, "tax_total": 19.0,
+            "line_items": [{"name": u"item %s" % y, "quantity": 1.5, "price_single": 10.0}
+                           for y in xrange(3)]}
+
+
+def report_before(items):
+    clnt = Mock()
+    clnt.base_url = u"https://sk.example/"
+    cls = resources.get_model_class("invoice", api=clnt)
+    totals = defaultdict(lambda: [0.0, 0.0, 0])
+    for model in (resources.hydrate_model(cls, item) for item in items):
+        row = totals[(model.client_id, model.date[:7])]
+        row[0] += model.net_total
+        row[1] += model.gross_total
+        row[2] += 1
+    return totals
+
+
+def run(func, *args):
+    start = time.time()
+    result = func(*args)
+    return time.time() - start, result
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    items = [make_invoice(x) for x in xrange(count)]
+    before, expected = run(report_before, items)
+    build, invoices = run(frame.Frame.from_items, "invoice", items,
+                          ("client_id", "month", "net_total", "gross_total"))
+    group, result = run(invoices.group_by, ("client_id", "month"), ("net_total", "gross_total"))
+    assert len(result) == len(expected)
+    print "%s invoices, %s groups, numpy: %s" % (count, len(result), frame.numpy is not None)
+    print "before (models):   %8.1fms" % (before * 1000)
+    print "after build frame: %8.1fms" % (build * 1000)
+    print "after group_by:    %8.1fms (%.1fx in total)" % (group * 1000, before / (build + group))
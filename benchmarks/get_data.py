@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    calls/second of BaseResource.get_data and of preparing a load call
+    for a client
+
+    before: json.dumps over the model wrapped by string formatting,
+            payload built for every call type
+    after:  the current get_data and _prepare_api_call
+
+    python benchmarks/get_data.py [rounds]
+"""
+import sys
+import os
+import time
+import logging
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mock import Mock
+
+from salesking import resources, api
+from salesking.utils import serializers
+
+CLIENT = {"id": "a2Ux6yswWr4RHCabxfpGMl", "number": "K-2012-001",
+          "organisation": "salesking", "last_name": "Jane", "first_name": "Dow",
+          "gender": "male", "email": "", "tag_list": "",
+          "created_at": "2012-12-19T00:39:49+01:00",
+          "updated_at": "2012-12-19T00:39:49+01:00", "currency": "EUR",
+          "lock_version": 0, "address_field": "salesking",
+          "addresses": [{"city": "Berlin", "address1": "Street 1", "zip": "10115"}]}
+
+
+def get_data_before(obj):
+    data = json.dumps(obj)
+    return u'{"%s":%s}' % (obj.schema['title'], data)
+
+
+def prepare_load_before(obj):
+    endpoint = obj.get_compiled_endpoint(u"self")
+    return endpoint.url(obj.id), endpoint.method, get_data_before(obj)
+
+
+def run(func, obj, rounds):
+    func(obj)
+    start = time.time()
+    for x in xrange(rounds):
+        func(obj)
+    return rounds / (time.time() - start)
+
+
+if __name__ == '__main__':
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    clnt = Mock()
+    clnt.base_url = u"https://sk.example/"
+    clnt.stats = api.RequestStats()
+    obj = resources.get_model_class("client", api=clnt)(CLIENT)
+    before = run(get_data_before, obj, rounds)
+    after = run(lambda o: o.get_data(), obj, rounds)
+    print "codec: %s" % ("ujson" if serializers.fast_json else json.__name__)
+    print "get_data before: %10.1f encodes/s (%s bytes)" % (before, len(get_data_before(obj)))
+    print "get_data after:  %10.1f encodes/s (%s bytes, %.1fx)" % (after, len(obj.get_data()), after / before)
+    before = run(prepare_load_before, obj, rounds)
+    after = run(lambda o: o._prepare_api_call(u"load", o.id), obj, rounds)
+    print "prepare load before: %10.1f calls/s" % before
+    print "prepare load after:  %10.1f calls/s (%.1fx)" % (after, after / before)
+    logging.basicConfig(level=logging.DEBUG, stream=open(os.devnull, "w"))
+    after = run(lambda o: o.get_data(), obj, rounds)
+    print "get_data debug stats: %10.1f encodes/s" % after
+    print clnt.stats
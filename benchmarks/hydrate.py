@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    parsing and hydrating a page of 100 invoices with 10 line items each
+
+    before: json.loads into the full tree, links included, then a copy of
+            every item without its null properties, models keep a
+            copy.deepcopy of their data
+    after:  serializers.loads_compact dropping nulls and links while decoding,
+            models keep a serializers.copy_json of their data
+
+    python benchmarks/hydrate.py [rounds]
+"""
+import sys
+import os
+import time
+import copy
+import json
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mock import Mock
+
+from salesking import collection, resources
+from salesking.utils import helpers, serializers
+
+LINKS = [{"rel": rel, "href": u"invoices/abc/%s" % rel}
+         for rel in (u"self", u"instances", u"destroy", u"update", u"create", u"attachments",
+                     u"payment_reminders", u"comments", u"emails", u"print")]
+
+
+def make_invoice(x):
+    return {"id": u"i%s" % x, "number": u"R-%03d" % x, "title": u"Invoice %s" % x,
+            "status": u"open", "notes_before": None, "notes_after": None, "tag_list": u"",
+            "client_id": u"c1", "date": u"2013-01-01", "due_days": None, "lock_version": 0,
+            "created_at": u"2013-01-01T10:00:00+01:00", "updated_at": u"2013-01-01T10:00:00+01:00",
+            "client": {"id": u"c1", "organisation": u"org", "email": u""},
+            "line_items": [{"id": u"l%s" % y, "name": u"item %s" % y, "description": None,
+                            "position": y, "quantity": 1.5, "price_single": 10.0, "tax": None}
+                           for y in xrange(10)]}
+
+
+def parse_before(content):
+    body = json.loads(content, encoding='utf-8')
+    return body['collection'], [helpers.remove_properties_containing_None(item["invoice"])
+                                for item in body["invoices"]]
+
+
+def parse_after(content):
+    body = serializers.loads_compact(content)
+    return body['collection'], [item["invoice"] for item in body["invoices"]]
+
+
+def hydrate_before(item_cls, data):
+    obj = item_cls(data)
+    obj.__dict__['__original__'] = copy.deepcopy(data)
+    obj.validate()
+    return obj
+
+
+def run(func, rounds):
+    func()
+    start = time.time()
+    for x in xrange(rounds):
+        func()
+    return (time.time() - start) / rounds
+
+
+if __name__ == '__main__':
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    content = json.dumps({"invoices": [{"invoice": make_invoice(x), "links": LINKS} for x in xrange(100)],
+                          "links": LINKS, "collection": {"current_page": 1, "per_page": 100,
+                                                         "total_entries": 100, "total_pages": 1}})
+    before = run(lambda: parse_before(content), rounds)
+    after = run(lambda: parse_after(content), rounds)
+    print "page: %s bytes" % len(content)
+    print "parse before: %8.2fms, %s bytes kept" % (before * 1000, len(json.dumps(json.loads(content))))
+    print "parse after:  %8.2fms, %s bytes kept (%.1fx)" % (
+        after * 1000, len(json.dumps(serializers.loads_compact(content))), before / after)
+    clnt = Mock()
+    clnt.base_url = u"https://sk.example/"
+    col = collection.get_collection_instance("invoice", clnt)
+    item_cls = resources.get_model_class("invoice", api=clnt)
+    before = run(lambda: [hydrate_before(item_cls, item) for item in parse_before(content)[1]], rounds)
+    after = run(lambda: col._parse_page(Mock(status_code=200, content=content)), rounds)
+    print "hydrate before: %8.2fms" % (before * 1000)
+    print "hydrate after:  %8.2fms (%.1fx)" % (after * 1000, before / after)
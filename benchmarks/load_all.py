@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    wall time of CollectionResource.load_all against an api stand-in
+    with a fixed latency per request
+
+    python benchmarks/load_all.py [pages] [latency in seconds] [items per page]
+
+    hydration is cpu bound (GIL), keep the items per page small to look
+    at the round trip wall time only
+"""
+import sys
+import os
+import time
+import urlparse
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from salesking import collection
+
+
+class Response(object):
+    status_code = 200
+
+    def __init__(self, page, total_pages, per_page):
+        clients = [{"client": {"id": "%s-%s" % (page, x), "number": "K-%s-%s" % (page, x)}}
+                   for x in xrange(per_page)]
+        self.content = json.dumps({"clients": clients,
+            "collection": {"current_page": page, "per_page": per_page,
+                           "total_entries": total_pages * per_page,
+                           "total_pages": total_pages}})
+
+
+class SlowApi(object):
+    base_url = u"https://sk.example/"
+
+    def __init__(self, total_pages, latency, per_page):
+        self.total_pages = total_pages
+        self.latency = latency
+        self.per_page = per_page
+
+    def request(self, url, *args, **kwargs):
+        time.sleep(self.latency)
+        page = int(urlparse.parse_qs(urlparse.urlparse(url).query).get('page', ['1'])[0])
+        return Response(page, self.total_pages, self.per_page)
+
+
+if __name__ == '__main__':
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+    per_page = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    for concurrency in (1, 4, 8, 16):
+        col = collection.get_collection_instance("client", SlowApi(pages, latency, per_page))
+        start = time.time()
+        col.load_all(concurrency=concurrency)
+        print "load_all %s pages concurrency %2s: %6.2fs (%s items)" % (
+            pages, concurrency, time.time() - start, len(col.items))
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    bulk load and read latency of the sqlite mirror
+
+    python benchmarks/mirror.py [invoices] [database file]
+"""
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from salesking import mirror
+
+
+def invoice(x):
+    return {"id": u"i%s" % x, "number": u"R-%06d" % x, "client_id": u"c%s" % (x % 500),
+            "date": u"2013-%02d-%02d" % (x % 12 + 1, x % 28 + 1), "lock_version": 0,
+            "title": u"Invoice %s" % x, "tag_list": u"paid" if x % 2 else u"",
+            "created_at": u"2013-01-01T10:00:00+01:00", "updated_at": u"2013-01-01T10:00:00+01:00",
+            "price_total": 100.0 + x,
+            "line_items": [{"id": u"l%s-%s" % (x, y), "name": u"item", "position": y,
+                            "quantity": 1, "price_single": 10.0} for y in xrange(3)]}
+
+
+def timed(label, func, rounds):
+    start = time.time()
+    for x in xrange(rounds):
+        result = func(x)
+    print "%-32s %8.3f ms" % (label, (time.time() - start) * 1000 / rounds)
+    return result
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    m = mirror.Mirror(sys.argv[2] if len(sys.argv) > 2 else u":memory:")
+    invoices = [invoice(x) for x in xrange(count)]
+    start = time.time()
+    for page in xrange(0, count, 100):
+        m.upsert("invoice", invoices[page:page + 100])
+    print "bulk load %s invoices %15.2f s" % (count, time.time() - start)
+    timed("get by id (with line items)", lambda x: m.get("invoice", u"i%s" % (x % count)), 1000)
+    timed("query number", lambda x: m.query("invoice", {"number": u"R-%06d" % (x % count)}), 1000)
+    timed("query client_ids", lambda x: m.query("invoice", {"client_ids": u"c%s" % (x % 500)}), 1000)
+    timed("query from/to", lambda x: m.query("invoice", {"from": u"2013-03-01", "to": u"2013-03-02"},
+                                              limit=20), 200)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    items/second for CollectionResource._post_load on a 100 item client page
+
+    before: the former per item get_model_class (new APIClient, schema and
+            model class for every single item)
+    after:  the current _post_load
+
+    python benchmarks/post_load.py [rounds]
+"""
+import sys
+import os
+import time
+import copy
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from warlock import model_factory
+from mock import Mock
+
+from salesking import api, resources, collection
+from salesking.utils import loaders, helpers
+
+CLIENT = {"id": "a2Ux6yswWr4RHCabxfpGMl", "number": "K-2012-001",
+          "organisation": "salesking", "last_name": "Jane", "first_name": "Dow",
+          "gender": "male", "notes": None, "email": "", "tag_list": "",
+          "created_at": "2012-12-19T00:39:49+01:00",
+          "updated_at": "2012-12-19T00:39:49+01:00", "currency": "EUR",
+          "lock_version": 0, "address_field": "salesking", "addresses": []}
+LINKS = [{"rel": "self", "href": "clients/a2Ux6yswWr4RHCabxfpGMl"},
+         {"rel": "instances", "href": "clients"}]
+
+
+class PageResponse(object):
+    status_code = 200
+
+    def __init__(self, items=100):
+        body = {"clients": [{"client": dict(CLIENT, number="K-%s" % x), "links": LINKS}
+                            for x in xrange(items)],
+                "collection": {"current_page": 1, "per_page": items,
+                               "total_entries": items, "total_pages": 1}}
+        self.content = json.dumps(body)
+
+
+def post_load_before(col, response):
+    """
+    the per item hydration as it was done before the model class cache
+    """
+    body = json.loads(response.content, encoding='utf-8')
+    items = []
+    for object in body[helpers.pluralize(col.resource_type)]:
+        clnt = api.APIClient()
+        schema = copy.deepcopy(loaders.load_schema(col.resource_type))
+        item_cls = model_factory(schema, base_class=resources.RemoteResource)
+        item_cls.__api__ = clnt
+        new_dict = helpers.remove_properties_containing_None(object[col.resource_type])
+        items.append(item_cls(new_dict))
+    return items
+
+
+def post_load_after(col, response):
+    col.items = []
+    col._post_load(response)
+    return col.items
+
+
+def run(func, col, response, rounds):
+    func(col, response)
+    start = time.time()
+    count = 0
+    for x in xrange(rounds):
+        count += len(func(col, response))
+    return count / (time.time() - start)
+
+
+if __name__ == '__main__':
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    response = PageResponse()
+    col = collection.get_collection_instance("client", Mock())
+    before = run(post_load_before, col, response, rounds)
+    after = run(post_load_after, col, response, rounds)
+    print "_post_load before: %10.1f items/s" % before
+    print "_post_load after:  %10.1f items/s (%.1fx)" % (after, after / before)
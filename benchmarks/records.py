@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    items/second and memory per item of collection hydration,
+    validated models versus readonly records
+
+    python benchmarks/records.py [rounds]
+"""
+import sys
+import os
+import gc
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mock import Mock
+
+from salesking import collection
+from post_load import PageResponse
+
+
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def run(readonly, response, rounds):
+    col = collection.get_collection_instance("client", Mock(), readonly=readonly)
+    col._parse_page(PageResponse())
+    start = time.time()
+    count = 0
+    for x in xrange(rounds):
+        # fresh response objects, parsed pages are memoized per response
+        count += len(col._parse_page(PageResponse())[1])
+    rate = count / (time.time() - start)
+    gc.collect()
+    before = rss()
+    items = []
+    for x in xrange(100):
+        items.extend(col._parse_page(PageResponse())[1])
+    gc.collect()
+    return rate, (rss() - before) / float(len(items))
+
+
+if __name__ == '__main__':
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    response = PageResponse()
+    readonly_rate, readonly_memory = run(True, response, rounds)
+    model_rate, model_memory = run(False, response, rounds)
+    print "models:  %10.1f items/s %8.0f bytes/item" % (model_rate, model_memory)
+    print "records: %10.1f items/s %8.0f bytes/item (%.1fx faster, %.1fx smaller)" % (
+        readonly_rate, readonly_memory, readonly_rate / model_rate, model_memory / readonly_memory)
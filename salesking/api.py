@@ -1,24 +1,180 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import time
 import logging
+import threading
 try:
     import simplejson as json
 except ImportError:
     import json
     
 from urllib import urlencode
+from collections import namedtuple
+from cookielib import DefaultCookiePolicy
 import requests
-from oauth_hook import OAuthHook
+from requests.adapters import HTTPAdapter
     
 from salesking.conf import settings
 from salesking import exceptions 
+from salesking.utils.retry import RetryPolicy, TokenBucket, RequestStats
+from salesking.utils.cache import LRUCache
 
 
 log = logging.getLogger(__name__)
 
 
+_transport_options = dict(settings.TRANSPORT)
+_sessions = dict()
+_sessions_lock = threading.Lock()
+_default_client = None
+_retry_policy = None
+_rate_limiters = dict()
+_conditional_caches = dict()
+
+def configure_transport(**options):
+    """
+    changes the shared transport options, see settings.TRANSPORT
+    the pooled sessions are closed and recreated with the new options
+    on the next request
+    """
+    unknown = set(options.keys()) - set(_transport_options.keys())
+    if unknown:
+        raise exceptions.SalesKingException("TRANSPORT_INVALIDOPTION",
+                                            "unknown transport options: %s" % ", ".join(unknown))
+    global _retry_policy
+    with _sessions_lock:
+        _transport_options.update(options)
+        sessions = _sessions.values()
+        _sessions.clear()
+        _rate_limiters.clear()
+        _conditional_caches.clear()
+        _retry_policy = None
+    for session in sessions:
+        session.close()
+
+def get_transport_options():
+    """
+    returns a copy of the current transport options
+    """
+    return dict(_transport_options)
+
+def get_session(base_url):
+    """
+    returns the pooled requests session shared by all clients of base_url
+    cookies are not kept, see RefuseCookiesPolicy
+    """
+    session = _sessions.get(base_url)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(base_url)
+            if session is None:
+                session = _create_session(_transport_options)
+                _sessions[base_url] = session
+    return session
+
+class RefuseCookiesPolicy(DefaultCookiePolicy):
+    """
+    a session is shared by all users of a host, a cookie set for the
+    credentials of one must not be sent with the requests of another
+    """
+    def set_ok(self, cookie, request):
+        return False
+
+def _create_session(options):
+    session = requests.Session()
+    session.cookies.set_policy(RefuseCookiesPolicy())
+    adapter = HTTPAdapter(pool_connections=options[u"pool_connections"],
+                          pool_maxsize=options[u"pool_maxsize"],
+                          pool_block=options[u"pool_block"])
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if not options[u"keep_alive"]:
+        session.headers["Connection"] = "close"
+    return session
+
+def get_retry_policy():
+    """
+    returns the RetryPolicy configured by the transport options
+    """
+    global _retry_policy
+    policy = _retry_policy
+    if policy is None:
+        policy = RetryPolicy(max_retries=_transport_options[u"max_retries"],
+                             backoff_factor=_transport_options[u"backoff_factor"],
+                             max_backoff=_transport_options[u"max_backoff"])
+        _retry_policy = policy
+    return policy
+
+def get_rate_limiter(base_url):
+    """
+    returns the TokenBucket shared by all clients of base_url,
+    None if the transport option rate_limit is not set
+    """
+    rate = _transport_options[u"rate_limit"]
+    if not rate:
+        return None
+    limiter = _rate_limiters.get(base_url)
+    if limiter is None:
+        with _sessions_lock:
+            limiter = _rate_limiters.get(base_url)
+            if limiter is None:
+                limiter = TokenBucket(rate, _transport_options[u"rate_burst"])
+                _rate_limiters[base_url] = limiter
+    return limiter
+
+def get_conditional_cache(base_url):
+    """
+    returns the LRUCache of stored representations shared by all clients
+    of base_url, None if the transport option conditional_cache_size is 0
+    """
+    size = _transport_options[u"conditional_cache_size"]
+    if not size:
+        return None
+    cache = _conditional_caches.get(base_url)
+    if cache is None:
+        with _sessions_lock:
+            cache = _conditional_caches.get(base_url)
+            if cache is None:
+                cache = LRUCache(size)
+                _conditional_caches[base_url] = cache
+    return cache
+
+
+class Representation(namedtuple('Representation', 'etag last_modified response')):
+    """
+    a stored GET response and its validators
+    """
+    __slots__ = ()
+
+    def conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers[u"If-None-Match"] = self.etag
+        if self.last_modified:
+            headers[u"If-Modified-Since"] = self.last_modified
+        return headers
+
+
+def get_default_client():
+    """
+    returns the process wide APIClient configured by the settings
+    resources and collection use it when no api client is passed
+    """
+    global _default_client
+    if _default_client is None:
+        with _sessions_lock:
+            if _default_client is None:
+                _default_client = APIClient()
+    return _default_client
+
+
 class SalesKingApiBase(object):
+    # transport errors worth a retry, see _get_retry_delay
+    retry_errors = ()
+    # True if request() is a coroutine, see resources.check_sync_api
+    is_async = False
+    
     def __init__(self):
         self.app_id = settings.API['app_id']
         self.app_secret = settings.API['app_secret']
@@ -31,7 +187,9 @@ class SalesKingApiBase(object):
         self.use_oauth = (self.sk_user is None or self.sk_pw is None) 
         self.access_token_url = u"%s%s" % (self.base_url,settings.ACCESS_TOKEN_URL)
         self.client = None
+        self.stats = RequestStats()
         if self.use_oauth:
+            from oauth_hook import OAuthHook
             OAuthHook.consumer_key = consumer_key
             OAuthHook.consumer_secret = consumer_secret
             self.oauth_hook = OAuthHook(access_token, access_token_secret, header_auth=True)
@@ -60,6 +218,7 @@ class SalesKingApiBase(object):
     def request(self, url, method = u"get", data = None, headers = None, **kwargs):
         """
         public method for doing the live request
+        failed requests are sent again as long as _get_retry_delay allows
         """
 
         url, method, data, headers, kwargs = self._pre_request(url, 
@@ -67,12 +226,73 @@ class SalesKingApiBase(object):
                                                                  data=data,
                                                                  headers=headers,
                                                                  **kwargs)
-        response = self._request(url, method=method, data=data, headers=headers, **kwargs)
-        response = self._post_request(response)
-        response = self._handle_response(response)
-        
+        stored = self._get_representation(url, method)
+        if stored is not None:
+            headers = dict(headers or {}, **stored.conditional_headers())
+        attempt = 0
+        while True:
+            self._throttle()
+            self.stats.incr(u"requests")
+            response = None
+            try:
+                response = self._request(url, method=method, data=data, headers=headers, **kwargs)
+            except self.retry_errors:
+                delay = self._get_retry_delay(method, attempt)
+                if delay is None:
+                    raise
+            else:
+                response = self._post_request(response)
+                delay = self._get_retry_delay(method, attempt, response)
+                if delay is None:
+                    response = self._handle_response(response)
+                    return self._store_representation(url, method, response, stored)
+            self._wait_for_retry(delay, response)
+            attempt += 1
+
+    def _throttle(self):
+        """
+        hook called before each request is sent
+        """
+        pass
+
+    def _get_representation(self, url, method):
+        """
+        hook returning the stored Representation of url for
+        conditional requests, None sends an unconditional request
+        """
+        return None
+
+    def _store_representation(self, url, method, response, stored=None):
+        """
+        hook called with the handled response
+        :param stored: the Representation returned by _get_representation
+        :returns the response passed to the caller
+        """
         return response
 
+    def _get_retry_delay(self, method, attempt, response=None):
+        """
+        hook deciding about retries
+        :param attempt: number of retries done so far
+        :param response: the response, None if a retry_errors was raised
+        :returns seconds to wait before sending again, None to not retry
+        """
+        return None
+
+    def _wait_for_retry(self, delay, response=None):
+        """
+        waits delay seconds and updates the stats
+        """
+        self._count_retry(delay, response)
+        time.sleep(delay)
+
+    def _count_retry(self, delay, response=None):
+        self.stats.incr(u"retries")
+        if response is not None and response.status_code == 429:
+            self.stats.incr(u"throttled_time", delay)
+        else:
+            self.stats.incr(u"backoff_time", delay)
+
     def _pre_request(self, url, method = u"get", data = None, headers=None, **kwargs):
         """
         hook for manipulating the _pre request data
@@ -110,6 +330,67 @@ class SalesKingApiBase(object):
 
 class APIClient(SalesKingApiBase):    
     access_token = None
+    # None uses the RetryPolicy of the transport options
+    retry_policy = None
+    # salesking.utils.cache.ObjectCache answering resource loads, None disables
+    object_cache = None
+    retry_errors = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+    _session_lock = threading.Lock()
+    
+    def _throttle(self):
+        """
+        waits for the rate limiter shared per base_url
+        """
+        limiter = get_rate_limiter(self.base_url)
+        if limiter is not None:
+            waited = limiter.acquire()
+            if waited:
+                self.stats.incr(u"throttled_time", waited)
+    
+    def _representation_key(self, url):
+        # the shared session is per base_url, the stored bodies are per user
+        return (self.sk_user, url)
+
+    def _get_representation(self, url, method):
+        """
+        the stored response of a previous GET of url, if any
+        """
+        if method.upper() != u"GET":
+            return None
+        cache = get_conditional_cache(self.base_url)
+        if cache is None:
+            return None
+        return cache.get(self._representation_key(url))
+
+    def _store_representation(self, url, method, response, stored=None):
+        """
+        a 304 answers with the stored response, so the caller gets the
+        already parsed objects (see resources.hydrate_response)
+        GET responses carrying an ETag or Last-Modified are stored,
+        writes to url drop the stored response
+        """
+        cache = get_conditional_cache(self.base_url)
+        if cache is None:
+            return response
+        key = self._representation_key(url)
+        if stored is not None and response.status_code == 304:
+            self.stats.incr(u"not_modified")
+            cache.set(key, stored)
+            return stored.response
+        if method.upper() != u"GET":
+            cache.pop(key)
+        elif response.status_code == 200:
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            if etag or last_modified:
+                cache.set(key, Representation(etag, last_modified, response))
+            else:
+                cache.pop(key)
+        return response
+
+    def _get_retry_delay(self, method, attempt, response=None):
+        policy = self.retry_policy or get_retry_policy()
+        return policy.get_delay(method, attempt, response)
     
     def _pre_request(self, url, method = u"get", data = None, headers=None, **kwargs):
         """
@@ -142,29 +423,41 @@ class APIClient(SalesKingApiBase):
         msg = "method: %s url:%s\nheaders:%s\ndata:%s" % (
                    method,url,headers,data)
         #print msg
+        kwargs.setdefault('timeout', _transport_options[u"timeout"])
         if not self.use_oauth:
             auth=(self.sk_user, self.sk_pw)
-            if not self.client:
-                self.client = requests.session()
-            r = self.client.request(method, url, headers=headers, data=data, auth=auth,**kwargs)
+            r = self._get_session().request(method, url, headers=headers, data=data, auth=auth,**kwargs)
         else:
-            if not self.client:
-                self.client = requests.session(hooks={'pre_request': oauth_hook})
-            r = self.client.request(method, url, headers=headers, data=data,**kwargs)
+            r = self._get_session().request(method, url, headers=headers, data=data,**kwargs)
         return r
     
+    def _get_session(self):
+        """
+        basic auth clients use the pooled session shared per base_url,
+        oauth clients lazily create their own session
+        """
+        if not self.use_oauth:
+            return get_session(self.base_url)
+        if not self.client:
+            with self._session_lock:
+                if not self.client:
+                    self.client = requests.session(hooks={'pre_request': oauth_hook})
+        return self.client
+    
     def _handle_response(self,response):
         status = response.status_code
         if status == 400:
-          raise exceptions.BadRequest(response)
+          raise exceptions.BadRequest("BAD_REQUEST", "Bad Request", response)
         elif status == 401:
-          raise exceptions.Unauthorized(response)
+          raise exceptions.Unauthorized("UNAUTHORIZED", "Unauthorized", response)
         elif status == 404:
           raise exceptions.NotFound()
         elif status == 422:
-          raise exceptions.BadRequest(response)
-        elif status in range(400, 500):
+          raise exceptions.UnprocessableEntity("UNPROCESSABLE_ENTITY", "Unprocessable Entity", response)
+        elif status == 429:
+          raise exceptions.TooManyRequests("Too Many Requests", response=response, content=response.content)
+        elif 400 <= status < 500:
           raise exceptions.HttpClientError("Client Error %s: " % (response.status_code), response=response, content=response.content)
-        elif status in range(500, 600):
-          raise exceptions.ServerError()
+        elif 500 <= status < 600:
+          raise exceptions.ServerError("Server Error %s" % status, response=response)
         return response
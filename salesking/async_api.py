@@ -0,0 +1,391 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    asyncio (trollius) transport
+
+    AsyncAPIClient runs the same _pre_request -> _request -> _post_request
+    -> _handle_response pipeline as the APIClient, but request() is a
+    coroutine, so many requests can share one event loop
+
+    >>> import trollius as asyncio
+    >>> from salesking import async_api, resources
+    >>> clnt = async_api.AsyncAPIClient()
+    >>> model = resources.get_model_class("client", api=clnt)
+    >>> loop = asyncio.get_event_loop()
+    >>> client = loop.run_until_complete(model().load_async(u"a8Ts8KsGar4OMPabxfpGMl"))
+
+    needs trollius: pip install salesking[async]
+"""
+
+import base64
+import logging
+import urlparse
+
+import trollius as asyncio
+from trollius import From, Return
+from requests.structures import CaseInsensitiveDict
+
+from salesking import resources
+from salesking.api import APIClient, get_transport_options, get_rate_limiter
+from salesking.utils import loaders
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_PORTS = {u"http": 80, u"https": 443}
+
+
+class ConnectionClosed(IOError):
+    """the server closed the connection before sending a response"""
+
+
+class AsyncResponse(object):
+    """
+    the parts of a requests response the sdk relies on
+    """
+    def __init__(self, url, status_code, reason, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+        self.encoding = u"utf-8"
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, "replace")
+
+    def __repr__(self):
+        return u"<AsyncResponse [%s]>" % self.status_code
+
+
+class ConnectionPool(object):
+    """
+    keep-alive connections per (scheme, host, port)
+    the number of parallel connections per host is bounded by a semaphore
+    """
+    def __init__(self, max_connections_per_host=10, loop=None):
+        self.max_connections_per_host = max_connections_per_host
+        self._loop = loop
+        self._idle = dict()
+        self._semaphores = dict()
+
+    def semaphore(self, key):
+        if key not in self._semaphores:
+            self._semaphores[key] = asyncio.Semaphore(self.max_connections_per_host,
+                                                      loop=self._loop)
+        return self._semaphores[key]
+
+    @asyncio.coroutine
+    def connect(self, key):
+        """
+        :returns tuple (reader, writer, reused)
+        """
+        idle = self._idle.get(key)
+        while idle:
+            reader, writer = idle.pop()
+            if not reader.at_eof():
+                raise Return((reader, writer, True))
+            writer.close()
+        scheme, host, port = key
+        reader, writer = yield From(asyncio.open_connection(
+            host, port, ssl=(scheme == u"https"), loop=self._loop))
+        raise Return((reader, writer, False))
+
+    def release(self, key, reader, writer):
+        self._idle.setdefault(key, []).append((reader, writer))
+
+    def close(self):
+        for connections in self._idle.values():
+            for reader, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+
+@asyncio.coroutine
+def read_response(reader, url, method):
+    """
+    reads a HTTP/1.x response
+    :returns tuple (AsyncResponse, keep_alive)
+    """
+    status_line = yield From(reader.readline())
+    if not status_line:
+        raise ConnectionClosed("no response from %s" % url)
+    version, status, reason = (status_line.rstrip("\r\n").split(" ", 2) + [""])[:3]
+    headers = CaseInsensitiveDict()
+    while True:
+        line = yield From(reader.readline())
+        if line in ("\r\n", "\n", ""):
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip()] = value.strip()
+    status = int(status)
+    keep_alive = (headers.get("connection", "").lower() != "close" and
+                  version != "HTTP/1.0")
+    if method.upper() == u"HEAD" or status in (204, 304) or 100 <= status < 200:
+        content = ""
+    elif "chunked" in headers.get("transfer-encoding", "").lower():
+        chunks = []
+        while True:
+            size = int((yield From(reader.readline())).split(";")[0].strip(), 16)
+            if size == 0:
+                # trailers end with an empty line
+                while (yield From(reader.readline())) not in ("\r\n", "\n", ""):
+                    pass
+                break
+            chunks.append((yield From(reader.readexactly(size))))
+            yield From(reader.readline())
+        content = "".join(chunks)
+    elif "content-length" in headers:
+        content = yield From(reader.readexactly(int(headers["content-length"])))
+    else:
+        content = yield From(reader.read())
+        keep_alive = False
+    raise Return((AsyncResponse(url, status, reason, headers, content), keep_alive))
+
+
+class AsyncAPIClient(APIClient):
+    """
+    APIClient with a coroutine request()
+    hooks and error mapping are the ones of the APIClient
+    timeout, keep-alive and connections per host follow the transport options
+    only the *_async methods of resources and collections accept it, the
+    blocking ones raise APIException API_ASYNC
+    """
+    retry_errors = (IOError, asyncio.TimeoutError)
+    is_async = True
+
+    def __init__(self, loop=None):
+        super(AsyncAPIClient, self).__init__()
+        options = get_transport_options()
+        self.timeout = options[u"timeout"]
+        self.keep_alive = options[u"keep_alive"]
+        self.max_connections_per_host = options[u"pool_maxsize"]
+        self.loop = loop
+        self.pool = ConnectionPool(self.max_connections_per_host, loop=loop)
+
+    @asyncio.coroutine
+    def request(self, url, method = u"get", data = None, headers = None, **kwargs):
+        """
+        public coroutine for doing the live request
+        failed requests are sent again as long as _get_retry_delay allows
+        """
+        url, method, data, headers, kwargs = self._pre_request(url,
+                                                                 method=method,
+                                                                 data=data,
+                                                                 headers=headers,
+                                                                 **kwargs)
+        stored = self._get_representation(url, method)
+        if stored is not None:
+            headers = dict(headers or {}, **stored.conditional_headers())
+        attempt = 0
+        while True:
+            yield From(self._throttle_async())
+            self.stats.incr(u"requests")
+            response = None
+            try:
+                response = yield From(self._request(url, method=method, data=data, headers=headers, **kwargs))
+            except self.retry_errors:
+                delay = self._get_retry_delay(method, attempt)
+                if delay is None:
+                    raise
+            else:
+                response = self._post_request(response)
+                delay = self._get_retry_delay(method, attempt, response)
+                if delay is None:
+                    response = self._handle_response(response)
+                    raise Return(self._store_representation(url, method, response, stored))
+            self._count_retry(delay, response)
+            yield From(asyncio.sleep(delay, loop=self.loop))
+            attempt += 1
+
+    @asyncio.coroutine
+    def _throttle_async(self):
+        """
+        waits for the rate limiter shared per base_url without blocking the loop
+        """
+        limiter = get_rate_limiter(self.base_url)
+        if limiter is not None:
+            wait = limiter.reserve()
+            if wait > 0:
+                self.stats.incr(u"throttled_time", wait)
+                yield From(asyncio.sleep(wait, loop=self.loop))
+
+    @asyncio.coroutine
+    def _request(self, url, method = u"get", data = None, headers=None, **kwargs):
+        """
+        does the request over a pooled keep-alive connection
+        - basic auth only
+        """
+        parts = urlparse.urlsplit(url)
+        scheme = parts.scheme.lower()
+        port = parts.port or DEFAULT_PORTS[scheme]
+        key = (scheme, parts.hostname, port)
+        path = parts.path or u"/"
+        if parts.query:
+            path = u"%s?%s" % (path, parts.query)
+        if isinstance(data, unicode):
+            data = data.encode("utf-8")
+        data = data or ""
+        lines = [u"%s %s HTTP/1.1" % (method.upper(), path),
+                 u"Host: %s" % parts.netloc,
+                 u"Connection: %s" % (u"keep-alive" if self.keep_alive else u"close"),
+                 u"Accept-Encoding: identity",
+                 u"Content-Length: %s" % len(data)]
+        if not self.use_oauth:
+            auth = base64.b64encode(("%s:%s" % (self.sk_user, self.sk_pw)).encode("utf-8"))
+            lines.append(u"Authorization: Basic %s" % auth)
+        for name, value in (headers or {}).items():
+            lines.append(u"%s: %s" % (name, value))
+        message = (u"\r\n".join(lines) + u"\r\n\r\n").encode("utf-8") + data
+        semaphore = self.pool.semaphore(key)
+        yield From(semaphore.acquire())
+        try:
+            response = yield From(asyncio.wait_for(self._send(key, message, url, method),
+                                                   self.timeout, loop=self.loop))
+        finally:
+            semaphore.release()
+        raise Return(response)
+
+    @asyncio.coroutine
+    def _send(self, key, message, url, method):
+        """
+        sends the message, a stale keep-alive connection is retried once
+        """
+        while True:
+            reader, writer, reused = yield From(self.pool.connect(key))
+            try:
+                writer.write(message)
+                response, keep_alive = yield From(read_response(reader, url, method))
+            except (IOError, asyncio.IncompleteReadError):
+                writer.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                writer.close()
+                raise
+            if keep_alive and self.keep_alive:
+                self.pool.release(key, reader, writer)
+            else:
+                writer.close()
+            raise Return(response)
+
+    def close(self):
+        """
+        closes all idle connections
+        the transports are closed by the event loop, so run it once more
+        before closing the loop
+        """
+        self.pool.close()
+
+
+@asyncio.coroutine
+def do_api_call(resource, call_type=u'', id=None, readonly=False):
+    """
+    coroutine variant of RemoteResource._do_api_call
+    """
+    cached = resource._get_cached(call_type, id, readonly)
+    if cached is not None:
+        raise Return(cached)
+    url, method, payload = resource._prepare_api_call(call_type, id)
+    try:
+        response = yield From(resource.__api__.request(url, method, data=payload))
+        result = resource._handle_api_response(call_type, response, readonly)
+        resource._update_cache(call_type, id, result)
+        raise Return(result)
+    except Return:
+        raise
+    except Exception, e:
+        log.error("Exception occoured %s" % e)
+        raise
+
+@asyncio.coroutine
+def load_resource(resource, id, readonly=False):
+    """
+    coroutine variant of Resource.load
+    """
+    resource._pre_load(id)
+    response = yield From(do_api_call(resource, call_type=u"load", id=id, readonly=readonly))
+    raise Return(resource._post_load(response))
+
+@asyncio.coroutine
+def save_resource(resource):
+    """
+    coroutine variant of Resource.save
+    """
+    resource._pre_save()
+    id = resource.get_id()
+    if id is not None and not resource.get_changed_properties():
+        raise Return(resource._post_save(resource))
+    call_type = u"update" if id is not None else u"create"
+    response = yield From(do_api_call(resource, call_type=call_type, id=id))
+    raise Return(resource._post_save(response))
+
+@asyncio.coroutine
+def delete_resource(resource):
+    """
+    coroutine variant of Resource.delete
+    """
+    resource._pre_delete()
+    response = yield From(do_api_call(resource, call_type=u"delete", id=resource.get_id()))
+    raise Return(resource._post_delete(response))
+
+@asyncio.coroutine
+def fetch_page(collection, page):
+    """
+    coroutine variant of CollectionResource._fetch_page
+    """
+    url = collection._pre_load(page)
+    collection._last_query_str = url
+    response = yield From(collection.__api__.request(url))
+    meta, items = collection._parse_page(response)
+    if collection.prefetch:
+        yield From(prefetch_related(collection, items))
+    raise Return((meta, items))
+
+@asyncio.coroutine
+def prefetch_related(collection, items):
+    """
+    coroutine variant of CollectionResource._prefetch_related,
+    all batches and loads run concurrently
+    """
+    for name in collection.prefetch:
+        ids = collection._get_prefetch_ids(items, name)
+        if not ids:
+            continue
+        batches = collection._get_prefetch_batches(name, ids)
+        if batches is not None:
+            pages = yield From(asyncio.gather(
+                *[fetch_page(collection._get_prefetch_collection(name, batch), 1) for batch in batches],
+                loop=collection.__api__.loop))
+            loaded = dict((item.get_id(), item) for meta, page_items in pages for item in page_items)
+        else:
+            resource_type = loaders.get_compiled_schema(collection.resource_type).references[name]
+            model_cls = resources.get_model_class(resource_type, api=collection.__api__)
+            results = yield From(asyncio.gather(
+                *[load_resource(model_cls(), id) for id in ids], loop=collection.__api__.loop))
+            loaded = dict(zip(ids, results))
+        collection._attach_related(items, name, loaded)
+
+@asyncio.coroutine
+def load_collection(collection, page=None):
+    """
+    coroutine variant of CollectionResource.load
+    with autoload the remaining pages are fetched concurrently
+    """
+    meta, items = yield From(fetch_page(collection, page))
+    collection._set_page_meta(meta)
+    # in case this obj gets reused to run another query reset the result
+    if collection.total_entries == 0 and collection.total_pages == 1:
+        collection.items = []
+    collection.items.extend(items)
+    if (collection.autoload == True and collection.total_pages > 1 and
+            collection.current_page == 1):
+        pages = yield From(asyncio.gather(
+            *[fetch_page(collection, x) for x in xrange(2, collection.total_pages + 1)],
+            loop=collection.__api__.loop))
+        for meta, items in pages:
+            collection._set_page_meta(meta)
+            collection.items.extend(items)
+    raise Return(collection)
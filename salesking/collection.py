@@ -1,27 +1,24 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import sys
 import logging
-try:
-    import simplejson as json
-except ImportError:
-    import json
+import time
+import threading
+import Queue
+from multiprocessing.pool import ThreadPool
 from urllib import urlencode
-from jsonschema import _flatten
 
-from salesking import resources, api
-from salesking.exceptions import SalesKingException
-from salesking.resources import API_BASE_PATH
-from salesking.utils import validators, loaders, helpers
+from salesking import resources, records
+from salesking.exceptions import SalesKingException, APIException
+from salesking.utils import validators, loaders, helpers, serializers
 
 
 
 
-DEFAULT_TYPES = {
-        "array" : list, "boolean" : bool, "integer" : int, "null" : type(None),
-        "number" : (int, float), "object" : dict, "string" : basestring,
-        
-}
+DEFAULT_TYPES = validators.JSON_TYPES
+# ids per filter[ids] request of prefetch_related, the max per_page
+PREFETCH_BATCH_SIZE = 100
 
 log=logging.getLogger(__name__)
 
@@ -38,7 +35,9 @@ class CollectionAttributesMixin(object):
             self.resource_type = resource_type['type']
         else:
             self.resource_type = resource_type
-        self.schema = loaders.load_schema_raw(self.resource_type) 
+        compiled = loaders.get_compiled_schema(self.resource_type)
+        self.schema = compiled.schema
+        self._filter_checkers = compiled.filter_checkers
         self.autoload = False
         self.filters = dict()
         self.items = []
@@ -48,8 +47,15 @@ class CollectionAttributesMixin(object):
         self.per_page = 100
         self.sort = u"ASC"
         self.sort_by = None
-        self._types = DEFAULT_TYPES # type mapping
+        self.page_latencies = dict()
         self._last_query_str = None
+        # items are records.Record instead of validated models
+        self.readonly = kwargs.get('readonly', False)
+        # resources.Endpoint replacing the instances link, e.g. the
+        # invoices link of a client, see RemoteResource.get_related
+        self.endpoint = kwargs.get('endpoint')
+        # names of the references loaded along with each page
+        self.prefetch = ()
 
     
     def get_sort(self):
@@ -115,7 +121,9 @@ class CollectionAttributesMixin(object):
         set type to load and load schema
         """
         self.resource_type = klass
-        self.schema = loaders.load_schema_raw(self.resource_type)
+        compiled = loaders.get_compiled_schema(self.resource_type)
+        self.schema = compiled.schema
+        self._filter_checkers = compiled.filter_checkers
 
     def set_filters(self, filters):
         """
@@ -140,21 +148,6 @@ class CollectionAttributesMixin(object):
         else:
             raise SalesKingException("FILTER_INVALID",'Invalid filter value: filter:%s value:%s' % (key,filter_value))
     
-    def _is_type(self, instance, type):
-        """
-        Check if an ``instance`` is of the provided (JSON Schema) ``type``.
-        """
-        if type not in self._types:
-            raise UnknownType(type)
-        type = self._types[type]
-
-        # bool inherits from int, so ensure bools aren't reported as integers
-        if isinstance(instance, bool):
-            type = _flatten(type)
-            if int in type and bool not in type:
-                return False
-        return isinstance(instance, type)
-    
     def validate_filter(self,key,filter_value):
         """
         validate the filter key and value
@@ -163,43 +156,70 @@ class CollectionAttributesMixin(object):
         :param filter_value: value of the filter
         :returns True if all is ok otherwise False
         """
-        ok = False
-        seek = u"filter[%s]" % key
-        schema = None
-        value  = None
-        is_string_with_format = False
-        string_format = None
-        for link in self.schema['links']:
-            if link['rel'] == 'instances':
-               for property in link['properties']:
-                   if seek == property:
-                       value = link['properties'][property]
-                       ok = True
-        if not ok:
+        checker = self._filter_checkers.get(key)
+        if checker is None:
             return False
-        ok = self._is_type(filter_value, value['type'])
-        # if string with type add validation
-        if ok == True and value['type'] == 'string' and 'format' in value.keys():
-            ok = self._validate_json_format(filter_value, value)
-            
-        return ok
+        return checker(filter_value)
+    
+    def get_filters(self):
+        return self.filters
     
-    def _validate_json_format(self,filter_value, schema_validation_type):
+    def prefetch_related(self, *names):
+        """
+        loads the resources referenced by the <name>_id property of the items
+        along with each page, e.g. prefetch_related(u"client") for invoices
+        afterwards item.get_reference(name) answers without a request
+        :returns self
+        :raises APIException for unknown references or readonly collections
+        """
+        references = loaders.get_compiled_schema(self.resource_type).references
+        for name in names:
+            if name not in references:
+                raise APIException("REFERENCE_NOTFOUND", "%s has no reference %s" % (self.resource_type, name))
+        if names and self.readonly:
+            raise APIException("PREFETCH_READONLY", "records can't hold related resources")
+        self.prefetch = tuple(names)
+        return self
+    
+    def _get_prefetch_ids(self, items, name):
         """
-        adds the type:string format:schema_validation_type
-        :param filter_value: value of the filter
-        :param schema_validation_type: format description of the json schema entry
+        :returns sorted distinct ids of the <name>_id property of items
         """
-        ok = False
-        try:
-            validators.json_schema_validation_format(filter_value, schema_validation_type)
-            ok = True
-        except ValueError as e:
-            pass
-        return ok
+        key = u"%s_id" % name
+        return sorted(set(id for id in (dict.get(item, key) for item in items) if id is not None))
     
-    def get_filters(self):
-        return self.filters
+    def _get_prefetch_batches(self, name, ids):
+        """
+        splits ids into the filter[ids] values of one page each
+        :returns list of id lists or None if the referenced type has no ids filter
+        """
+        resource_type = loaders.get_compiled_schema(self.resource_type).references[name]
+        if u"ids" not in loaders.get_compiled_schema(resource_type).filters:
+            return None
+        return [ids[x:x + PREFETCH_BATCH_SIZE] for x in xrange(0, len(ids), PREFETCH_BATCH_SIZE)]
+    
+    def _get_prefetch_collection(self, name, ids):
+        """
+        collection loading the referenced resources with ids in one page
+        """
+        resource_type = loaders.get_compiled_schema(self.resource_type).references[name]
+        col = get_collection_instance(resource_type, self.__api__)
+        col.add_filter(u"ids", u",".join(ids))
+        col.per_page = PREFETCH_BATCH_SIZE
+        return col
+    
+    def _attach_related(self, items, name, loaded):
+        """
+        hands the loaded resources to the items referring to them
+        :param loaded: dict id -> resource
+        """
+        resource_type = loaders.get_compiled_schema(self.resource_type).references[name]
+        key = u"%s_id" % name
+        for item in items:
+            id = dict.get(item, key)
+            if id in loaded:
+                proxy = resources.ResourceProxy(resource_type, id, self.__api__, loaded[id])
+                item.__dict__.setdefault('related', {})[(name, id)] = proxy
     
     def _pre_load(self, page = None):
         """
@@ -213,7 +233,8 @@ class CollectionAttributesMixin(object):
 #            value = urlencode(value)
 #            query_str = u"%s=%s" % (afilter, value)
         if len(self.filters) > 0:
-            query.append(urlencode(self.filters))
+            query.append(urlencode([(u"filter[%s]" % key, self.filters[key])
+                                    for key in sorted(self.filters.keys())]))
         if self.sort:
             query_str = u"%s=%s" % (u"sort", self.sort)
             query.append(query_str)
@@ -227,8 +248,7 @@ class CollectionAttributesMixin(object):
             query_str = u"%s=%s" % (u"page", page)
             query.append(query_str)
         query = u"?%s" % (u"&".join(query))
-        url = u"%s%s" % (self.get_list_endpoint()['href'],query)
-        url = u"%s%s%s" % (self.__api__.base_url, API_BASE_PATH,url)
+        url = u"%s%s" % (self.get_compiled_list_endpoint().url(), query)
         msg = "_pre_load: url:%s" % url
         log.debug(msg)
         #print msg
@@ -241,14 +261,25 @@ class CollectionAttributesMixin(object):
         :returns the value
         :raises APIException
         """
-        schema_loaded = not self.schema is None
-        links_present = "links" in self.schema.keys()
-        if (schema_loaded and links_present):
-             for row in self.schema['links']:
-                  if row['rel'] == rel:
-                      #print "row %s" % row
-                      return row
-        raise APIException("ENDPOINT_NOTFOUND","invalid endpoint")
+        try:
+            return loaders.get_compiled_schema(self.resource_type).links[rel]
+        except KeyError:
+            raise APIException("ENDPOINT_NOTFOUND","invalid endpoint")
+    
+    def get_compiled_list_endpoint(self, rel=u"instances"):
+        """
+        get the precompiled list endpoint for the schema.type and api
+        :param rel: lookup rel: value inside the links section
+        :returns resources.Endpoint
+        :raises APIException
+        """
+        if self.endpoint is not None and rel == u"instances":
+            return self.endpoint
+        table = resources.get_endpoint_table(self.resource_type, self.__api__.base_url)
+        try:
+            return table[rel]
+        except KeyError:
+            raise APIException("ENDPOINT_NOTFOUND","invalid endpoint")
     
     def _load(self,url):
         raise Exception("implemnt in subclass please")
@@ -257,30 +288,81 @@ class CollectionAttributesMixin(object):
         """
         post load processing
         """
-        if response is not None and response.status_code == 200:
-            types = helpers.pluralize(self.resource_type)
-            body = json.loads(response.content, encoding='utf-8')
-            self.total_entries = body['collection']['total_entries']
-            self.total_pages = body['collection']['total_pages']
-            self.current_page = body['collection']['current_page']
-            # in case this obj gets reused to run another query reset the result
-            if self.total_entries == 0 and self.total_pages == 1:
-                self.items = []
-            ## now get the items from the class factory
-            for object in body[types]:
-                item_cls = resources.get_model_class(self.resource_type)
-                properties_dict = object[self.resource_type]
-                new_dict = helpers.remove_properties_containing_None(properties_dict)
-                item = item_cls(new_dict)
-                ## add the items
-                self.items.append(item)
-            #autoload is true, so lets fetch all the other pages recursivly
-            if(self.autoload == True and self.total_pages > 1 and page == None):
-                for x in xrange(2,self.total_pages):
-                    self.load(x)
-            return self
+        meta, items = self._parse_page(response)
+        if self.prefetch:
+            self._prefetch_related(items)
+        self._set_page_meta(meta)
+        # in case this obj gets reused to run another query reset the result
+        if self.total_entries == 0 and self.total_pages == 1:
+            self.items = []
+        ## add the items
+        self.items.extend(items)
+        #autoload is true, so lets fetch all the other pages
+        if(self.autoload == True and self.total_pages > 1 and self.current_page == 1):
+            for x in xrange(2,self.total_pages + 1):
+                self.load(x)
+        return self
+    
+    def _parse_page(self, response):
+        """
+        parses a collection response without touching the collection state
+        :param response: the api response of a page
+        :returns tuple (collection meta data dict, list of items)
+        :raises SalesKingException
+        """
+        if response is None or response.status_code != 200:
+            raise SalesKingException("LOAD_ERROR","Fetching failed, an error happend",response)
+        if self.readonly:
+            record_cls = records.get_record_class(self.resource_type)
+            def hydrate_records(response):
+                meta, data = self._parse_page_data(response)
+                return meta, map(record_cls.from_dict, data)
+            # records are immutable and handed out as they are
+            meta, items = resources.hydrate_response(response, hydrate_records,
+                                                     lambda page: page, key='records')
         else:
+            ## now get the items from the class factory
+            item_cls = resources.get_model_class(self.resource_type, api=self.__api__)
+            def hydrate(response):
+                meta, data = self._parse_page_data(response)
+                return meta, [self._hydrate_item(properties, item_cls) for properties in data]
+            def reuse(page):
+                meta, items = page
+                return meta, [resources.copy_model(item, item_cls) for item in items]
+            meta, items = resources.hydrate_response(response, hydrate, reuse)
+        # the page kept on the response is handed out again on a 304,
+        # load_all and iter_pages must not extend it
+        return dict(meta), list(items)
+    
+    def _parse_page_data(self, response):
+        """
+        parses a collection response into plain dicts, nothing is hydrated
+        null properties and links are dropped while decoding
+        :returns tuple (collection meta data dict, list of property dicts)
+        :raises SalesKingException
+        """
+        if response is None or response.status_code != 200:
             raise SalesKingException("LOAD_ERROR","Fetching failed, an error happend",response)
+        types = helpers.pluralize(self.resource_type)
+        body = serializers.loads_compact(response.content)
+        return body['collection'], [object[self.resource_type] for object in body[types]]
+    
+    def _hydrate_item(self, properties_dict, item_cls=None):
+        """
+        turns the property dict of a record as parsed by _parse_page_data
+        into an item
+        """
+        if item_cls is None:
+            item_cls = resources.get_model_class(self.resource_type, api=self.__api__)
+        return resources.hydrate_model(item_cls, properties_dict)
+    
+    def _set_page_meta(self, meta):
+        """
+        takes over the paging information of a parsed page
+        """
+        self.total_entries = meta['total_entries']
+        self.total_pages = meta['total_pages']
+        self.current_page = meta['current_page']
     
 
 class CollectionResource(CollectionAttributesMixin):
@@ -307,23 +389,194 @@ class CollectionResource(CollectionAttributesMixin):
         :return response
         :raises SaleskingException with the corresponding http errors
         """
+        resources.check_sync_api(self.__api__)
         msg = "_load: %s" % url
         self._last_query_str = url
         log.debug(msg)
         #print msg
         response = self.__api__.request(url)
         return response
-        
+    
+    def load_async(self, page = None):
+        """
+        coroutine variant of load, needs an async_api.AsyncAPIClient
+        with autoload the remaining pages are fetched concurrently
+        """
+        from salesking import async_api
+        return async_api.load_collection(self, page)
+    
+    def _fetch_page(self, page):
+        """
+        loads and parses a single page
+        :returns tuple (collection meta data dict, list of items)
+        """
+        url = self._pre_load(page)
+        meta, items = self._parse_page(self._load(url))
+        if self.prefetch:
+            self._prefetch_related(items)
+        return meta, items
+    
+    def _prefetch_related(self, items, concurrency=4):
+        """
+        loads the references named in self.prefetch for the items of a page
+        the distinct ids are fetched with filter[ids], 100 per request,
+        types without that filter are loaded one by one in parallel
+        """
+        for name in self.prefetch:
+            ids = self._get_prefetch_ids(items, name)
+            if not ids:
+                continue
+            batches = self._get_prefetch_batches(name, ids)
+            if batches is not None:
+                loaded = dict()
+                for batch in batches:
+                    col = self._get_prefetch_collection(name, batch)
+                    col.load_all()
+                    loaded.update((item.get_id(), item) for item in col.items)
+            else:
+                resource_type = loaders.get_compiled_schema(self.resource_type).references[name]
+                model_cls = resources.get_model_class(resource_type, api=self.__api__)
+                load = lambda id: model_cls().load(id)
+                if concurrency > 1 and len(ids) > 1:
+                    pool = ThreadPool(min(concurrency, len(ids)))
+                    try:
+                        loaded = dict(zip(ids, pool.map(load, ids)))
+                    finally:
+                        pool.close()
+                        pool.join()
+                else:
+                    loaded = dict((id, load(id)) for id in ids)
+            log.debug("prefetched %s %s of %s items" % (len(loaded), name, len(items)))
+            self._attach_related(items, name, loaded)
+    
+    def _fetch_page_data(self, page):
+        """
+        loads a single page without hydrating the items
+        :returns tuple (collection meta data dict, list of property dicts)
+        """
+        url = self._pre_load(page)
+        return self._parse_page_data(self._load(url))
+    
+    def _fetch_page_timed(self, page):
+        """
+        _fetch_page recording the latency in self.page_latencies
+        """
+        start = time.time()
+        result = self._fetch_page(page)
+        self.page_latencies[page] = time.time() - start
+        return result
+    
+    def load_all(self, concurrency=4):
+        """
+        loads all pages into self.items
+        page 1 is fetched first to learn total_pages, the remaining pages
+        are fetched in parallel and added in page order
+        the latency of each page is kept in self.page_latencies
+        :param concurrency: max number of parallel requests
+        :returns self
+        :raises the SalesKingException of the first failed page
+        """
+        self.page_latencies = dict()
+        meta, items = self._fetch_page_timed(1)
+        self._set_page_meta(meta)
+        self.items = items
+        pages = range(2, self.total_pages + 1)
+        if not pages:
+            return self
+        if concurrency > 1:
+            pool = ThreadPool(min(concurrency, len(pages)))
+            try:
+                results = pool.map(self._fetch_page_timed, pages)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [self._fetch_page_timed(page) for page in pages]
+        for meta, items in results:
+            self._set_page_meta(meta)
+            self.items.extend(items)
+        log.debug("load_all: %s pages, latencies: %s" % (self.total_pages, self.page_latencies))
+        return self
+    
+    def iter_pages(self, read_ahead=0):
+        """
+        generator yielding the list of items of each page, page after page
+        self.items is left untouched, so memory is bound by the page size
+        :param read_ahead: number of pages fetched in a background thread
+                           while the current page is processed,
+                           0 fetches each page on demand
+        """
+        meta, items = self._fetch_page(1)
+        self._set_page_meta(meta)
+        yield items
+        pages = xrange(2, self.total_pages + 1)
+        if read_ahead > 0:
+            fetched = _read_ahead(self._fetch_page, pages, read_ahead)
+        else:
+            fetched = (self._fetch_page(page) for page in pages)
+        for meta, items in fetched:
+            self._set_page_meta(meta)
+            yield items
+    
+    def iter_items(self, read_ahead=0):
+        """
+        generator yielding the items of all pages
+        :param read_ahead: see iter_pages
+        """
+        for items in self.iter_pages(read_ahead=read_ahead):
+            for item in items:
+                yield item
+
+
+def _read_ahead(fetch, pages, size):
+    """
+    generator yielding fetch(page) for each page in order
+    a background thread fetches ahead, buffering up to size results
+    exceptions of fetch are re-raised in the consumer
+    """
+    queue = Queue.Queue(maxsize=size)
+    stop = threading.Event()
+    
+    def worker():
+        for page in pages:
+            try:
+                result = (fetch(page), None)
+            except Exception:
+                result = (None, sys.exc_info())
+            while not stop.is_set():
+                try:
+                    queue.put(result, timeout=0.1)
+                    break
+                except Queue.Full:
+                    pass
+            if stop.is_set() or result[1] is not None:
+                return
+    
+    thread = threading.Thread(target=worker, name="salesking-read-ahead")
+    thread.daemon = True
+    thread.start()
+    try:
+        for page in pages:
+            value, exc_info = queue.get()
+            if exc_info is not None:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            yield value
+    finally:
+        # consumer is done or gave up, let the worker go
+        stop.set()
+
 def get_collection_instance(klass, api_client = None, request_api=True, **kwargs):
     """
     instatiates the collection lookup of json type klass
     :param klass: json file name
     :param api_client: transportation api
-    :param request_api: if True uses the default APIClient
+    :param request_api: if True uses the shared default APIClient
     """
     _type = klass
     if api_client is None and request_api:
-        api_client = api.APIClient()
+        # the transport is imported with the first use of the default client
+        from salesking.api import get_default_client
+        api_client = get_default_client()
     if isinstance(klass, dict):
         _type = klass['type']
     obj = CollectionResource(_type, api_client,**kwargs)
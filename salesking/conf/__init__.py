@@ -0,0 +1,12 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    paths of the package, importable without the local settings
+    the api settings are in salesking.conf.settings
+"""
+import os
+
+# root of this package
+SK_ROOT = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+# abspath where the schemes are stored
+SCHEMA_ROOT = os.path.join(SK_ROOT, "schemes")
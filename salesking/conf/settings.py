@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import os
 import sys
 try:
     from salesking.conf.local_settings import SALESKING_API
@@ -9,10 +8,8 @@ except ImportError,e:
     raise e
     raise Exception("please create a salesking.conf.local_settings")
 
-# root of this packag
-SK_ROOT = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
-# abspath where the schemes ares stored
-SCHEMA_ROOT = os.path.join(SK_ROOT, "schemes")  
+# root of this package and the abspath where the schemes are stored
+from salesking.conf import SK_ROOT, SCHEMA_ROOT
 
 AUTH_URL = u"/oauth/authorize"
 ACCESS_TOKEN_URL = u"/oauth/token"
@@ -34,6 +31,30 @@ API = {
        u"sk_pw": SALESKING_API['SK_PASSWORD']
 }
 
+# http transport shared by all api clients with the same base url
+# see salesking.api.configure_transport
+TRANSPORT = {
+       # number of hosts with pooled connections
+       u"pool_connections": 10,
+       # max connections kept per host
+       u"pool_maxsize": 10,
+       # block instead of opening extra connections once pool_maxsize is reached
+       u"pool_block": False,
+       u"keep_alive": True,
+       # seconds, None waits forever
+       u"timeout": 30,
+       # retries of failed requests, see salesking.utils.retry.RetryPolicy
+       u"max_retries": 3,
+       u"backoff_factor": 0.5,
+       u"max_backoff": 30,
+       # client side limit in requests per second per base url, None disables
+       u"rate_limit": None,
+       u"rate_burst": 10,
+       # GET responses with an ETag or Last-Modified kept per base url for
+       # conditional requests, 0 disables
+       u"conditional_cache_size": 256,
+}
+
 #
 #App ID
 #    355db80d9de64051
@@ -27,9 +27,34 @@ class BadHttpStatus(HttpError):
         super(BadHttpStatus, self).__init__(message, response=response)
         
 class ClientError(Exception): pass
-class ServerError(Exception): pass
+
+class HttpClientError(ClientError):
+    """4xx response"""
+
+    def __init__(self, message, response=None, content=None):
+        super(HttpClientError, self).__init__(message)
+        self.response = response
+        self.content = content
+
+class TooManyRequests(HttpClientError):
+    """429 response, the request quota is exceeded"""
+
+class ServerError(Exception):
+    """5xx response"""
+
+    def __init__(self, message=None, response=None):
+        super(ServerError, self).__init__(message)
+        self.response = response
+
 class BadRequest(SalesKingException): pass
 class UnprocessableEntity(BadRequest): pass
 class Unauthorized(SalesKingException): pass
 class NotFound(ClientError): pass
-class Unavailable(Exception): pass
\ No newline at end of file
+class Unavailable(Exception): pass
+
+class ValidationError(SalesKingException, ValueError):
+    """
+    invalid model data, errors lists every problem found
+    """
+    def __str__(self):
+        return self.msg.encode("utf-8") if isinstance(self.msg, unicode) else self.msg
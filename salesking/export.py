@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    streaming export of collections to CSV and NDJSON files
+
+    >>> col = collection.get_collection_instance("invoice")
+    >>> export(col, CsvWriter("invoice", "invoices.csv"))
+    120
+
+    writes invoices.csv and invoices_line_items.csv
+
+    columns follow the scheme files, like the tables of mirror.Mirror:
+    * scalar properties become columns in the order of the names
+    * nested arrays (line_items, addresses) are exploded into a child file
+      per property, with the parent id and the position in the array
+    * other objects and arrays are written as json text
+    NDJSON keeps the nesting and writes one object per line
+
+    collections are read page by page without hydrating models and rows
+    are written batch_size at a time, so memory stays bound by the page
+    and batch size no matter how many items are exported
+"""
+import os
+import csv
+import logging
+
+from salesking import collection
+from salesking.mirror import TableSpec
+from salesking.utils import serializers
+
+
+log = logging.getLogger(__name__)
+
+# write buffer of the files, rows are handed over in batches anyway
+FILE_BUFFER_SIZE = 1 << 16
+
+
+class ExportWriter(object):
+    """
+    base of the writers, keeps the rows of each file and writes them
+    batch_size at a time
+    :param resource_type: type of the exported resources
+    :param path: main file, the child files are named <root>_<property><ext>
+    :param batch_size: rows kept per file before they are written
+    """
+    # nested arrays go to child files
+    explode = False
+
+    def __init__(self, resource_type, path, batch_size=1000):
+        self.resource_type = resource_type
+        self.path = path
+        self.batch_size = batch_size
+        self.spec = TableSpec(resource_type, resource_type)
+        # number of items written
+        self.rows = 0
+        self._files = {}
+        self._pending = {}
+        self._closed = False
+        # all files are created, even if they stay without rows
+        self._files[None] = self._open(None, self.spec)
+        if self.explode:
+            for property, child in self.spec.children.iteritems():
+                self._files[property] = self._open(property, child)
+
+    def get_path(self, property=None):
+        """
+        :param property: nested array with a child file, None for the main file
+        """
+        if property is None:
+            return self.path
+        root, extension = os.path.splitext(self.path)
+        return u"%s_%s%s" % (root, property, extension)
+
+    def _open(self, property, spec):
+        """
+        opens the file of property, header included
+        """
+        raise NotImplementedError()
+
+    def _write_rows(self, property, rows):
+        """
+        writes a batch of rows to the file of property
+        """
+        raise NotImplementedError()
+
+    def _to_rows(self, item):
+        """
+        :returns list of (property, row) the item is written as
+        """
+        raise NotImplementedError()
+
+    def write(self, items):
+        """
+        :param items: iterable of dicts, models or records.Record of resource_type
+        """
+        for item in items:
+            for property, row in self._to_rows(item):
+                pending = self._pending.setdefault(property, [])
+                pending.append(row)
+                if len(pending) >= self.batch_size:
+                    self.flush(property)
+            self.rows += 1
+
+    def flush(self, property=None):
+        """
+        writes the kept rows of property, all files if property is None
+        """
+        properties = self._pending.keys() if property is None else [property]
+        for property in properties:
+            rows = self._pending.get(property)
+            if rows:
+                self._write_rows(property, rows)
+                self._pending[property] = []
+
+    def close(self):
+        """
+        writes what is left and closes the files
+        """
+        if self._closed:
+            return
+        self.flush()
+        for file in self._files.values():
+            file.close()
+        self._closed = True
+        log.debug("exported %s %s to %s" % (self.rows, self.resource_type, self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class CsvWriter(ExportWriter):
+    """
+    utf-8 CSV with a header row, nested arrays go to child files
+    booleans are written as true / false, missing values as empty fields
+    """
+    explode = True
+
+    def __init__(self, resource_type, path, batch_size=1000):
+        self._writers = {}
+        super(CsvWriter, self).__init__(resource_type, path, batch_size)
+
+    def _open(self, property, spec):
+        file = open(self.get_path(property), "wb", FILE_BUFFER_SIZE)
+        writer = csv.writer(file)
+        header = list(spec.column_names)
+        if property is not None:
+            header = [u"_parent_id", u"_index"] + header
+        writer.writerow([name.encode("utf-8") for name in header])
+        self._writers[property] = writer
+        return file
+
+    def _write_rows(self, property, rows):
+        self._writers[property].writerows(rows)
+
+    def _to_rows(self, item):
+        rows = [(None, to_csv_row(self.spec, item))]
+        id = to_csv_value(item.get(u"id"))
+        for property, child in self.spec.children.iteritems():
+            for index, nested in enumerate(item.get(property) or []):
+                rows.append((property, [id, index] + to_csv_row(child, nested)))
+        return rows
+
+
+class NdjsonWriter(ExportWriter):
+    """
+    one json object per line holding the scheme properties which are set,
+    nested arrays stay inside their object
+    """
+    def _open(self, property, spec):
+        return open(self.get_path(property), "wb", FILE_BUFFER_SIZE)
+
+    def _write_rows(self, property, rows):
+        rows.append("")
+        self._files[property].write("\n".join(rows))
+
+    def _to_rows(self, item):
+        data = {}
+        for name in self.spec.column_names + self.spec.children.keys():
+            value = item.get(name)
+            if value is not None:
+                data[name] = value
+        return [(None, serializers.dumps(data))]
+
+
+def to_csv_value(value, kind=None):
+    """
+    :param kind: kind of the TableSpec column
+    :returns value as str for the csv module
+    """
+    if value is None:
+        return ""
+    if kind == u"json":
+        return serializers.dumps(value)
+    if kind == u"boolean" or isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    return value
+
+def to_csv_row(spec, record):
+    """
+    :returns list of the column values of record
+    """
+    return [to_csv_value(record.get(column), kind) for column, sql_type, kind in spec.columns]
+
+def iter_collection(col):
+    """
+    generator yielding the property dicts of all pages of a collection,
+    one page is fetched at a time and nothing is hydrated
+    """
+    meta, items = col._fetch_page_data(1)
+    for item in items:
+        yield item
+    for page in xrange(2, meta['total_pages'] + 1):
+        meta, items = col._fetch_page_data(page)
+        for item in items:
+            yield item
+
+def export(source, writer):
+    """
+    writes all items of source and closes the writer
+    :param source: CollectionResource, all its pages are exported with the
+                   current filters, or any iterable of dicts, models or records
+    :param writer: ExportWriter
+    :returns number of items written
+    """
+    if isinstance(source, collection.CollectionAttributesMixin):
+        source = iter_collection(source)
+    with writer:
+        writer.write(source)
+    return writer.rows
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    array backed columns of many documents for reporting
+
+    >>> col = collection.get_collection_instance("invoice")
+    >>> col.add_filter("from", "2013-01-01")
+    >>> invoices = Frame.from_collection(col, columns=("net_total", "gross_total", "client_id", "month"))
+    >>> invoices.group_by("month", ("net_total", "gross_total"))
+    {u'2013-01': {'count': 310, 'net_total': 51230.0, 'gross_total': 60963.7}, ...}
+    >>> items = Frame.from_collection(col, child="line_items", parent_columns=("month",))
+    >>> items.group_by(("month", "product_id"), ("quantity",))
+
+    column types come from the scheme: number and integer properties are
+    kept in numpy arrays when numpy is installed, in array.array otherwise,
+    missing numbers count as 0. strings and dates stay in lists.
+    month is the YYYY-MM of date, columns unknown to the scheme (e.g. the
+    currency of the api) are read as strings.
+    collections are read page by page without hydrating models.
+
+    numpy: pip install salesking[frame], tox -e numpy runs the tests with it
+"""
+import logging
+import operator
+from array import array
+from itertools import izip
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from salesking.mirror import TableSpec
+from salesking.export import iter_collection
+
+
+log = logging.getLogger(__name__)
+
+# array typecodes and numpy dtypes of the numeric kinds
+TYPECODES = {u"number": 'd', u"integer": 'l'}
+DTYPES = {u"number": 'float64', u"integer": 'int64'}
+# max product of the distinct values of the key columns group_by combines
+# into one integer code, above numpy.lexsort is used
+COMBINED_CODES_LIMIT = 1 << 62
+# columns derived from an item, name -> function(item)
+DERIVED_COLUMNS = {
+    u"month": lambda item: (item.get(u"date") or u"")[:7] or None,
+}
+
+
+class Frame(object):
+    """
+    columns of equal length
+    * columns: name -> numpy array, array.array or list
+    * kinds: name -> number, integer or string
+    """
+    def __init__(self, resource_type, columns, kinds):
+        self.resource_type = resource_type
+        self.columns = columns
+        self.kinds = kinds
+        # name -> (distinct values, code of each row) of the key columns
+        self._codes = {}
+
+    @classmethod
+    def from_items(cls, resource_type, items, columns=None, child=None, parent_columns=()):
+        """
+        :param items: iterable of dicts, models or records.Record
+        :param columns: names of the columns to keep, default all scheme
+                        properties which are no objects or arrays
+        :param child: nested array like line_items, the frame gets a row per
+                      nested item plus the _parent_id column
+        :param parent_columns: columns of the parent copied to each child row
+        """
+        parent_spec = spec = TableSpec(resource_type, resource_type)
+        if child is not None:
+            spec = parent_spec.children[child]
+        if columns is None:
+            columns = sorted(column for column, kind in spec.kinds.iteritems() if kind != u"json")
+        builders = [(name, _get_kind(spec.kinds, name)) for name in columns]
+        parents = []
+        if child is not None:
+            parents = [(u"_parent_id", u"string")]
+            parents += [(name, _get_kind(parent_spec.kinds, name)) for name in parent_columns]
+        data = dict((name, array(TYPECODES[kind]) if kind in TYPECODES else [])
+                    for name, kind in builders + parents)
+        getters = [(data[name], _getter(name), kind) for name, kind in builders]
+        parent_getters = [(data[name], _getter(name), kind) for name, kind in parents]
+        for item in items:
+            if child is None:
+                _append(getters, item)
+                continue
+            values = [(column, _get_value(getter, item, kind)) for column, getter, kind in parent_getters]
+            for nested in item.get(child) or []:
+                _append(getters, nested)
+                for column, value in values:
+                    column.append(value)
+        if numpy is not None:
+            for name, kind in builders + parents:
+                if kind in DTYPES:
+                    data[name] = numpy.array(data[name], dtype=DTYPES[kind])
+        return cls(resource_type, data, dict(builders + parents))
+
+    @classmethod
+    def from_collection(cls, col, columns=None, child=None, parent_columns=()):
+        """
+        frame of all pages of a CollectionResource with its current filters
+        see from_items for the parameters
+        """
+        return cls.from_items(col.resource_type, iter_collection(col), columns, child, parent_columns)
+
+    def __len__(self):
+        for column in self.columns.values():
+            return len(column)
+        return 0
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def sum(self, name):
+        """
+        total of a numeric column
+        """
+        column = self.columns[name]
+        if numpy is not None and isinstance(column, numpy.ndarray):
+            return column.sum().item()
+        return sum(column)
+
+    def group_by(self, keys, values=()):
+        """
+        totals of the numeric columns values per distinct key
+        :param keys: column name or tuple of names, e.g. ("client_id", "month")
+        :param values: numeric columns to sum up
+        :returns dict key -> {value name: total, ..., 'count': rows},
+                 keys are tuples when grouped by more than one column
+        """
+        single = isinstance(keys, basestring)
+        names = [keys] if single else keys
+        if numpy is not None:
+            groups, codes = _group_codes_numpy([self._get_codes(name) for name in names])
+        else:
+            groups, codes = _group_codes([self.columns[name] for name in names])
+        if single:
+            groups = [key for key, in groups]
+        size = len(groups)
+        totals = [(name, _sum_by_code(codes, self.columns[name], size)) for name in values]
+        counts = _sum_by_code(codes, None, size)
+        result = {}
+        for code, key in enumerate(groups):
+            row = dict((name, total[code]) for name, total in totals)
+            row['count'] = int(counts[code])
+            result[key] = row
+        return result
+
+    def _get_codes(self, name):
+        """
+        numpy.unique of a key column, computed once per column
+        """
+        codes = self._codes.get(name)
+        if codes is None:
+            column = self.columns[name]
+            if not isinstance(column, numpy.ndarray):
+                # strings become a fixed width array, sorted much faster than
+                # python objects. with None numpy keeps the objects
+                column = numpy.array(column)
+            codes = self._codes[name] = numpy.unique(column, return_inverse=True)
+        return codes
+
+    def __repr__(self):
+        return u"<Frame %s %s rows %s>" % (self.resource_type, len(self), sorted(self.columns.keys()))
+
+
+def _get_kind(kinds, name):
+    kind = kinds.get(name, u"string")
+    if kind not in TYPECODES:
+        return u"string"
+    return kind
+
+def _getter(name):
+    derived = DERIVED_COLUMNS.get(name)
+    if derived is not None:
+        return derived
+    if name == u"_parent_id":
+        name = u"id"
+    return lambda item: item.get(name)
+
+def _get_value(getter, item, kind):
+    value = getter(item)
+    if value is None and kind in TYPECODES:
+        return 0
+    return value
+
+def _append(getters, item):
+    for column, getter, kind in getters:
+        column.append(_get_value(getter, item, kind))
+
+def _group_codes(key_columns):
+    """
+    assigns each distinct key an integer code, one row at a time
+    :returns tuple (keys in the order of their codes, array of the code of each row)
+    """
+    groups = {}
+    codes = array('l')
+    for key in izip(*key_columns):
+        codes.append(groups.setdefault(key, len(groups)))
+    return sorted(groups, key=groups.get), codes
+
+def _group_codes_numpy(column_codes):
+    """
+    same as _group_codes without a python call per row
+    the codes of the key columns are combined into one integer per row,
+    numpy.lexsort finds equal rows if that integer could overflow
+    :param column_codes: numpy.unique(column, return_inverse=True) of each key column
+    """
+    uniques = [unique for unique, inverse in column_codes]
+    inverses = [inverse for unique, inverse in column_codes]
+    rows = len(inverses[0])
+    if rows == 0:
+        return [], numpy.zeros(0, dtype=numpy.intp)
+    if len(inverses) == 1:
+        return [(key,) for key in uniques[0].tolist()], inverses[0]
+    sizes = [len(unique) for unique in uniques]
+    if reduce(operator.mul, sizes, 1) < COMBINED_CODES_LIMIT:
+        combined, codes = numpy.unique(numpy.ravel_multi_index(inverses, sizes), return_inverse=True)
+        positions = numpy.unravel_index(combined, sizes)
+        keys = zip(*[unique[position].tolist() for unique, position in zip(uniques, positions)])
+        return keys, codes
+    # lexsort sorts by the last key first
+    order = numpy.lexsort(inverses[::-1])
+    starts = numpy.ones(rows, dtype=bool)
+    changed = numpy.zeros(rows - 1, dtype=bool)
+    for inverse in inverses:
+        ordered = inverse[order]
+        changed |= ordered[1:] != ordered[:-1]
+    starts[1:] = changed
+    codes = numpy.empty(rows, dtype=numpy.intp)
+    codes[order] = numpy.cumsum(starts) - 1
+    firsts = order[starts]
+    keys = zip(*[unique[inverse[firsts]].tolist() for unique, inverse in zip(uniques, inverses)])
+    return keys, codes
+
+def _sum_by_code(codes, column, size):
+    """
+    :param codes: code of each row, see _group_codes
+    :param column: numbers to add up per code, None counts the rows
+    :returns sequence of the totals per code, integer columns sum up to ints
+    """
+    if numpy is not None:
+        totals = numpy.bincount(codes, weights=column, minlength=size)
+        if column is not None and column.dtype.kind in 'iu':
+            # bincount adds up weights as floats
+            totals = numpy.rint(totals).astype(column.dtype)
+        return totals.tolist()
+    totals = [0] * size
+    if column is None:
+        for code in codes:
+            totals[code] += 1
+    else:
+        for code, value in izip(codes, column):
+            totals[code] += value
+    return totals
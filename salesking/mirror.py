@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    local SQLite mirror of remote resources
+
+    >>> m = Mirror("salesking.db")
+    >>> m.load(collection.get_collection_instance("client"))
+    >>> m.query("client", {"created_at_from": "2013-01-01T00:00:00+01:00"})
+
+    tables are derived from the scheme files:
+    * scalar properties become columns, date-time values are kept in UTC
+      so they compare and index as text
+    * nested arrays (line_items, addresses) become child tables named
+      <type>_<property> with the parent id and the position in the array
+    * other objects and arrays are kept as json text
+    the mirror is a sync.SyncTarget, a SyncEngine keeps it up to date
+"""
+import re
+import sqlite3
+import logging
+import threading
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+import iso8601
+
+from salesking.exceptions import SalesKingException
+from salesking.utils import loaders
+from salesking.sync import SyncTarget
+
+
+log = logging.getLogger(__name__)
+
+SQL_TYPES = {
+        u"string": u"TEXT", u"integer": u"INTEGER", u"number": u"REAL",
+        u"boolean": u"INTEGER",
+}
+# columns indexed when a table has them, the common filter keys
+INDEXED_COLUMNS = (u"number", u"client_id", u"date", u"due_date",
+                   u"created_at", u"updated_at", u"birthday", u"tag_list")
+# columns searched by the q filter
+SEARCH_COLUMNS = (u"number", u"organisation", u"last_name", u"first_name",
+                  u"email", u"title", u"name", u"description")
+# filters taking a comma separated list of values for a column
+LIST_FILTERS = {u"ids": u"id", u"client_ids": u"client_id",
+                u"creator_ids": u"creator_id", u"languages": u"language"}
+# sqlite limits the number of host parameters
+MAX_PARAMS = 500
+# a bare date given to a date-time filter
+DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+# first and last second of the day for a bare date, by filter operator
+DAY_BOUNDS = {u">=": u"T00:00:00+00:00", u"<=": u"T23:59:59+00:00"}
+
+
+def quote(name):
+    return u'"%s"' % name.replace(u'"', u'""')
+
+def to_utc(value):
+    """
+    :param value: iso8601 date-time string
+    :returns the same instant as YYYY-MM-DDThh:mm:ssZ
+    """
+    parsed = iso8601.parse_date(value).astimezone(iso8601.iso8601.UTC)
+    return parsed.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def escape_like(value):
+    """
+    :returns value matched literally by LIKE ... ESCAPE '\\'
+    """
+    return value.replace(u"\\", u"\\\\").replace(u"%", u"\\%").replace(u"_", u"\\_")
+
+
+class TableSpec(object):
+    """
+    table layout derived from the schema of a resource type
+    * columns: list of (column name, sql type, kind), kind is one of
+      string, date-time, integer, number, boolean, json
+    * children: property name -> TableSpec of the nested array items
+    """
+    def __init__(self, name, resource_type, parent=None):
+        self.name = name
+        self.resource_type = resource_type
+        self.parent = parent
+        self.columns = []
+        self.children = {}
+        compiled = loaders.get_compiled_schema(resource_type)
+        for property in sorted(compiled.schema['properties'].keys()):
+            if property.startswith(u"_"):
+                # write only flags like _destroy
+                continue
+            value = compiled.schema['properties'][property]
+            _type = value.get('type')
+            if isinstance(_type, (list, tuple)):
+                _type = [t for t in _type if t != u"null"]
+                _type = _type[0] if len(_type) == 1 else None
+            if _type == u"array" and property in compiled.nested and parent is None:
+                self.children[property] = TableSpec(u"%s_%s" % (name, property),
+                                                    compiled.nested[property], parent=self)
+            elif _type in SQL_TYPES:
+                kind = _type
+                if _type == u"string" and value.get('format') == u"date-time":
+                    kind = u"date-time"
+                self.columns.append((property, SQL_TYPES[_type], kind))
+            else:
+                self.columns.append((property, u"TEXT", u"json"))
+        self.column_names = [column[0] for column in self.columns]
+        self.kinds = dict((column[0], column[2]) for column in self.columns)
+
+    def create_statements(self):
+        if self.parent is None:
+            columns = [u"%s %s%s" % (quote(column), sql_type,
+                                      u" PRIMARY KEY" if column == u"id" else u"")
+                       for column, sql_type, kind in self.columns]
+        else:
+            columns = [u'"_parent_id" TEXT NOT NULL', u'"_index" INTEGER NOT NULL']
+            columns += [u"%s %s" % (quote(column), sql_type)
+                        for column, sql_type, kind in self.columns]
+        statements = [u"CREATE TABLE IF NOT EXISTS %s (%s)" % (quote(self.name), u", ".join(columns))]
+        indexed = [column for column in INDEXED_COLUMNS if column in self.kinds]
+        if self.parent is not None:
+            indexed = [u"_parent_id"]
+        for column in indexed:
+            statements.append(u"CREATE INDEX IF NOT EXISTS %s ON %s (%s)" % (
+                quote(u"ix_%s_%s" % (self.name, column)), quote(self.name), quote(column)))
+        for child in self.children.values():
+            statements.extend(child.create_statements())
+        return statements
+
+    def to_row(self, record):
+        """
+        :param record: dict or model of the resource
+        :returns tuple of the column values
+        """
+        row = []
+        for column, sql_type, kind in self.columns:
+            value = record.get(column)
+            if value is not None:
+                if kind == u"json":
+                    value = json.dumps(value)
+                elif kind == u"date-time":
+                    value = to_utc(value)
+                elif kind == u"boolean":
+                    value = int(value)
+            row.append(value)
+        return tuple(row)
+
+    def from_row(self, row, offset=0):
+        """
+        :returns dict of the non null columns of a row
+        """
+        record = {}
+        for position, (column, sql_type, kind) in enumerate(self.columns):
+            value = row[offset + position]
+            if value is None:
+                continue
+            if kind == u"json":
+                value = json.loads(value)
+            elif kind == u"boolean":
+                value = bool(value)
+            record[column] = value
+        return record
+
+
+class Mirror(SyncTarget):
+    """
+    SQLite mirror, tables are created on first use of a resource type
+    safe to share between threads, writes run in one transaction per call
+    :param path: database file, :memory: keeps it in memory
+    """
+    def __init__(self, path=u":memory:"):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._specs = {}
+
+    def close(self):
+        self.connection.close()
+
+    def get_spec(self, resource_type):
+        """
+        :returns the TableSpec of resource_type, the tables are created if needed
+        """
+        spec = self._specs.get(resource_type)
+        if spec is None:
+            with self._lock:
+                spec = self._specs.get(resource_type)
+                if spec is None:
+                    spec = TableSpec(resource_type, resource_type)
+                    with self.connection:
+                        for statement in spec.create_statements():
+                            self.connection.execute(statement)
+                    self._specs[resource_type] = spec
+        return spec
+
+    def upsert(self, resource_type, items):
+        """
+        inserts or replaces the records, nested arrays replace the child rows
+        :param items: dicts or models of resource_type
+        """
+        spec = self.get_spec(resource_type)
+        items = list(items)
+        if not items:
+            return 0
+        columns = u", ".join(quote(column) for column in spec.column_names)
+        marks = u", ".join(u"?" * len(spec.column_names))
+        with self._lock:
+            with self.connection:
+                self.connection.executemany(
+                    u"INSERT OR REPLACE INTO %s (%s) VALUES (%s)" % (quote(spec.name), columns, marks),
+                    [spec.to_row(item) for item in items])
+                for property, child in spec.children.items():
+                    self._replace_children(child, property, items)
+        return len(items)
+
+    def _replace_children(self, child, property, items):
+        ids = [item.get(u"id") for item in items]
+        for start in xrange(0, len(ids), MAX_PARAMS):
+            chunk = ids[start:start + MAX_PARAMS]
+            self.connection.execute(u'DELETE FROM %s WHERE "_parent_id" IN (%s)' % (
+                quote(child.name), u", ".join(u"?" * len(chunk))), chunk)
+        rows = []
+        for item in items:
+            for index, nested in enumerate(item.get(property) or []):
+                rows.append((item.get(u"id"), index) + child.to_row(nested))
+        if rows:
+            columns = u", ".join([u'"_parent_id"', u'"_index"'] +
+                                 [quote(column) for column in child.column_names])
+            self.connection.executemany(u"INSERT INTO %s (%s) VALUES (%s)" % (
+                quote(child.name), columns, u", ".join(u"?" * len(rows[0]))), rows)
+
+    def get_lock_versions(self, resource_type, ids):
+        spec = self.get_spec(resource_type)
+        versions = {}
+        if u"lock_version" not in spec.kinds:
+            return versions
+        ids = list(ids)
+        with self._lock:
+            for start in xrange(0, len(ids), MAX_PARAMS):
+                chunk = ids[start:start + MAX_PARAMS]
+                cursor = self.connection.execute(u'SELECT "id", "lock_version" FROM %s WHERE "id" IN (%s)' % (
+                    quote(spec.name), u", ".join(u"?" * len(chunk))), chunk)
+                versions.update(cursor.fetchall())
+        return versions
+
+    def load(self, collection, pages=None):
+        """
+        bulk loads the pages of a collection, the current filters apply
+        the records go in without being hydrated
+        :param collection: CollectionResource
+        :param pages: page numbers to load, defaults to all pages
+        :returns number of records loaded
+        """
+        count = 0
+        if pages is None:
+            meta, records = collection._fetch_page_data(1)
+            count += self.upsert(collection.resource_type, records)
+            pages = xrange(2, meta['total_pages'] + 1)
+        for page in pages:
+            meta, records = collection._fetch_page_data(page)
+            count += self.upsert(collection.resource_type, records)
+        return count
+
+    def get(self, resource_type, id):
+        """
+        :returns the record with its nested arrays or None
+        """
+        spec = self.get_spec(resource_type)
+        with self._lock:
+            row = self.connection.execute(u'SELECT * FROM %s WHERE "id" = ?' % quote(spec.name),
+                                          (id,)).fetchone()
+            if row is None:
+                return None
+            record = spec.from_row(row)
+            for property, child in spec.children.items():
+                rows = self.connection.execute(
+                    u'SELECT * FROM %s WHERE "_parent_id" = ? ORDER BY "_index"' % quote(child.name),
+                    (id,)).fetchall()
+                record[property] = [child.from_row(child_row, offset=2) for child_row in rows]
+        return record
+
+    def query(self, resource_type, filters=None, sort_by=None, sort=u"ASC", limit=None, offset=None):
+        """
+        runs the api filters of resource_type against the mirror
+        the values are validated like CollectionResource.validate_filter does
+        :returns list of record dicts, without the nested arrays
+        :raises SalesKingException
+        """
+        spec = self.get_spec(resource_type)
+        where, params = self._build_where(spec, filters or {})
+        sql = u"SELECT * FROM %s" % quote(spec.name)
+        if where:
+            sql += u" WHERE " + u" AND ".join(where)
+        if sort_by is not None:
+            if sort_by not in spec.kinds or sort.upper() not in (u"ASC", u"DESC"):
+                raise SalesKingException("SORT_INVALID", "invalid sorting: %s %s" % (sort_by, sort))
+            sql += u" ORDER BY %s %s" % (quote(sort_by), sort.upper())
+        if limit is not None or offset is not None:
+            sql += u" LIMIT ? OFFSET ?"
+            params += [limit if limit is not None else -1, offset or 0]
+        with self._lock:
+            rows = self.connection.execute(sql, params).fetchall()
+        return [spec.from_row(row) for row in rows]
+
+    def count(self, resource_type, filters=None):
+        spec = self.get_spec(resource_type)
+        where, params = self._build_where(spec, filters or {})
+        sql = u"SELECT COUNT(*) FROM %s" % quote(spec.name)
+        if where:
+            sql += u" WHERE " + u" AND ".join(where)
+        with self._lock:
+            return self.connection.execute(sql, params).fetchone()[0]
+
+    def _build_where(self, spec, filters):
+        checkers = loaders.get_compiled_schema(spec.resource_type).filter_checkers
+        where = []
+        params = []
+        for key in sorted(filters.keys()):
+            value = filters[key]
+            checker = checkers.get(key)
+            if checker is None:
+                raise SalesKingException("FILTER_INVALID",'Invalid filter value: filter:%s value:%s' % (key, value))
+            column, operator = self._filter_column(spec, key)
+            if (column is not None and spec.kinds[column] == u"date-time"
+                    and operator in DAY_BOUNDS and DATE_RE.match(value)):
+                # a bare date covers the whole day, _to keeps the records of that day
+                value += DAY_BOUNDS[operator]
+            if not checker(value):
+                raise SalesKingException("FILTER_INVALID",'Invalid filter value: filter:%s value:%s' % (key, value))
+            if operator == u"q":
+                columns = [name for name in SEARCH_COLUMNS if name in spec.kinds]
+                if not columns:
+                    raise SalesKingException("FILTER_NOTSUPPORTED",
+                                             "filter q can't be run on the mirror of %s" % spec.resource_type)
+                where.append(u"(%s)" % u" OR ".join(u"%s LIKE ? ESCAPE '\\'" % quote(name)
+                                                    for name in columns))
+                params += [u"%%%s%%" % escape_like(value)] * len(columns)
+            elif operator == u"tags":
+                for tag in [tag.strip() for tag in value.split(u",") if tag.strip()]:
+                    where.append(u"(',' || REPLACE(%s, ' ', '') || ',') LIKE ? ESCAPE '\\'" % quote(column))
+                    params.append(u"%%,%s,%%" % escape_like(tag.replace(u" ", u"")))
+            elif operator == u"in":
+                values = [v.strip() for v in value.split(u",") if v.strip()]
+                where.append(u"%s IN (%s)" % (quote(column), u", ".join(u"?" * len(values))))
+                params += values
+            else:
+                if spec.kinds[column] == u"date-time":
+                    value = to_utc(value)
+                where.append(u"%s %s ?" % (quote(column), operator))
+                params.append(value)
+        return where, params
+
+    def _filter_column(self, spec, key):
+        """
+        :returns tuple (column, operator) of a filter
+        :raises SalesKingException if the mirror can't run the filter
+        """
+        if key == u"q":
+            column, operator = None, u"q"
+        elif key == u"tags":
+            column, operator = u"tag_list", u"tags"
+        elif key in LIST_FILTERS:
+            column, operator = LIST_FILTERS[key], u"in"
+        elif key in (u"from", u"to"):
+            column, operator = u"date", u">=" if key == u"from" else u"<="
+        elif key.endswith(u"_from"):
+            column, operator = key[:-5], u">="
+        elif key.endswith(u"_to"):
+            column, operator = key[:-3], u"<="
+        else:
+            column, operator = key, u"="
+        if column is not None and column not in spec.kinds:
+            raise SalesKingException("FILTER_NOTSUPPORTED", "filter %s can't be run on the mirror" % key)
+        return column, operator
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    lightweight read-only records
+
+    records are tuples with one slot per schema property, built without
+    any validation. properties the schema doesn't know are not kept.
+    collections and loads return them with readonly=True
+
+    >>> col = collection.get_collection_instance("client", readonly=True)
+    >>> col.load()
+    >>> col.items[0].organisation
+    >>> col.items[0].as_dict()
+    >>> col.items[0].to_model(col.__api__).save()
+"""
+import threading
+from operator import itemgetter
+from itertools import izip
+
+from salesking.utils import loaders
+
+
+class Record(tuple):
+    """
+    immutable record of a resource type, missing properties are None
+    """
+    __slots__ = ()
+    resource_type = None
+    _fields = ()
+    _index = {}
+
+    def __new__(cls, values=()):
+        return tuple.__new__(cls, values)
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        :param data: property dict as returned by the api, not validated
+        """
+        return tuple.__new__(cls, map(data.get, cls._fields))
+
+    def __getitem__(self, key):
+        if isinstance(key, basestring):
+            return tuple.__getitem__(self, self._index[key])
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        position = self._index.get(key)
+        if position is None:
+            return default
+        value = tuple.__getitem__(self, position)
+        return default if value is None else value
+
+    def keys(self):
+        return list(self._fields)
+
+    def as_dict(self):
+        """
+        :returns dict of the properties which are not None
+        """
+        return dict((field, value) for field, value in izip(self._fields, self)
+                    if value is not None)
+
+    def to_model(self, api=None):
+        """
+        converts the record into a full, validated and loaded model
+        :param api: api client of the model, defaults to the shared client
+        :raises ValueError if the data does not validate
+        """
+        from salesking import resources
+        return resources.hydrate_model(resources.get_model_class(self.resource_type, api=api),
+                                       self.as_dict())
+
+    def __getnewargs__(self):
+        return (tuple(self),)
+
+    def __repr__(self):
+        return u"<%s %s>" % (type(self).__name__, self.get(u"id"))
+
+
+_record_classes = dict()
+_record_classes_lock = threading.Lock()
+
+def get_record_class(resource_type):
+    """
+    returns the Record class of resource_type, generated once per type
+    """
+    cls = _record_classes.get(resource_type)
+    if cls is not None:
+        return cls
+    properties = sorted(loaders.get_compiled_schema(resource_type).schema['properties'].keys())
+    namespace = {
+        '__slots__': (),
+        'resource_type': resource_type,
+        '_fields': tuple(properties),
+        '_index': dict((name, position) for position, name in enumerate(properties)),
+    }
+    for position, name in enumerate(properties):
+        namespace[name] = property(itemgetter(position))
+    cls = type(str("%sRecord" % resource_type.title().replace("_", "")), (Record,), namespace)
+    with _record_classes_lock:
+        return _record_classes.setdefault(resource_type, cls)
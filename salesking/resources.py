@@ -15,24 +15,70 @@ import logging
 from StringIO import StringIO
 import logging
 import copy
-try:
-    import simplejson as json
-except ImportError:
-    import json
+import threading
+from collections import OrderedDict, namedtuple
+from multiprocessing.pool import ThreadPool
 
-from warlock import model_factory
+import jsonschema
 from warlock.model import Model
 from salesking import exceptions
 
-from salesking.utils import loaders, helpers
-from salesking.exceptions import SalesKingException
-from salesking.api import APIClient
+from salesking.utils import loaders, serializers
+from salesking.utils.cache import ObjectCache
+from salesking.records import get_record_class
+from salesking.exceptions import SalesKingException, APIException, ValidationError
 
 
 
 log = logging.getLogger(__name__)
 
 API_BASE_PATH = u'api/'
+# max number of generated model classes kept by get_model_class
+MODEL_CLASS_CACHE_SIZE = 128
+
+
+class Endpoint(namedtuple('Endpoint', 'rel method href url_prefix url_suffix')):
+    """
+    immutable, precompiled link of a schema
+    the url template is split at {id} and already contains
+    base_url and API_BASE_PATH
+    """
+    __slots__ = ()
+
+    def url(self, id=None):
+        """
+        :param id: fills the {id} placeholder
+        :returns the absolute url
+        :raises APIException if the link needs an id
+        """
+        if self.url_suffix is None:
+            return self.url_prefix
+        if id is None:
+            raise APIException("ENDPOINT_IDNOTSET", "endpoint %s needs an id" % self.rel)
+        return u"%s%s%s" % (self.url_prefix, id, self.url_suffix)
+
+
+_endpoint_tables = dict()
+_endpoint_tables_lock = threading.Lock()
+
+def get_endpoint_table(resource_type, base_url):
+    """
+    returns the shared rel -> Endpoint table of a resource type
+    besides the schema links it contains the rel schema (create href + /schema)
+    :param resource_type: json schema name
+    :param base_url: base url of the api client
+    """
+    key = (resource_type, base_url)
+    try:
+        return _endpoint_tables[key]
+    except KeyError:
+        pass
+    endpoints = loaders.get_compiled_schema(resource_type).endpoints
+    url_base = u"%s%s" % (base_url, API_BASE_PATH)
+    table = dict((rel, Endpoint(rel, method, href, url_base + prefix, suffix))
+                 for rel, (method, href, prefix, suffix) in endpoints.iteritems())
+    with _endpoint_tables_lock:
+        return _endpoint_tables.setdefault(key, loaders.ReadOnlyDict(table))
 
 class Resource(Model):
     """
@@ -87,8 +133,8 @@ class Resource(Model):
         """
         loads a remote resource by id
         """
-        self._pre_load(*args, **kwargs)
-        response = self._load(*args, **kwargs)
+        self._pre_load(id, *args, **kwargs)
+        response = self._load(id, *args, **kwargs)
         response = self._post_load(response, *args, **kwargs)
         return response
     
@@ -131,23 +177,66 @@ class BaseResource(Resource):
             pass
         return id
         
-    def get_data(self):
+    def get_data(self, properties=None):
         """
         put the object to json and remove the internal stuff
+        with debug logging the size and encode time go to the stats of the api client
+        :param properties: names of the properties to put, default all
+                           removed ones are sent as null
+        """
+        data = self
+        if properties is not None:
+            data = dict((key, dict.get(self, key)) for key in properties)
+        return serializers.encode_resource(self.schema['title'], data,
+                                           getattr(self.__api__, 'stats', None))
+    
+    def get_changed_properties(self):
+        """
+        names of the properties changed, added or removed since the model
+        was loaded, changes inside nested lists and dicts included
+        models which were not loaded from the api count all their properties
         """
-        data = json.dumps(self)
-        out = u'{"%s":%s}' % (self.schema['title'],data)
-        return out
+        if not self.__dict__.get('loaded'):
+            return sorted(dict.keys(self))
+        original = self.__dict__['__original__']
+        changed = set(key for key, value in dict.iteritems(self)
+                      if key not in original or original[key] != value)
+        changed.update(key for key in original if not dict.__contains__(self, key))
+        return sorted(changed)
+    
+    def get_update_properties(self):
+        """
+        properties an update sends: the changed ones plus the lock_version
+        of the loaded object, so the api rejects concurrent changes
+        :returns list of names or None for all, when the model was not loaded
+        """
+        if not self.__dict__.get('loaded'):
+            return None
+        properties = self.get_changed_properties()
+        if properties and dict.__contains__(self, u'lock_version') \
+                and u'lock_version' not in properties:
+            properties.append(u'lock_version')
+        return properties
     
     def get_endpoint(self, rel=u"self"):
-        schema_loaded = not self.schema is None
-        links_present = "links" in self.schema.keys()
-        if (schema_loaded and links_present):
-             for row in self.schema['links']:
-                  if row['rel'] == rel:
-                      #print "row %s" % row
-                      return row
-        raise APIException("ENDPOINT_NOTFOUND","invalid endpoint")
+        """
+        :returns the shared, read-only link with rel from the schema
+        :raises APIException
+        """
+        try:
+            return loaders.get_compiled_schema(self.schema['title']).links[rel]
+        except KeyError:
+            raise APIException("ENDPOINT_NOTFOUND","invalid endpoint")
+    
+    def get_compiled_endpoint(self, rel=u"self"):
+        """
+        :returns the precompiled Endpoint with rel for the current api
+        :raises APIException
+        """
+        try:
+            return get_endpoint_table(self.schema['title'], self.__api__.base_url)[rel]
+        except KeyError:
+            raise APIException("ENDPOINT_NOTFOUND","invalid endpoint")
     
     
     def get_resource_remote_schema(self):
@@ -165,6 +254,112 @@ class RemoteResource(BaseResource):
     self.delete()
     
     """
+    # assignments only record the change, the schema is checked once
+    # by validate(), which save() calls before anything is sent
+    deferred_validation = True
+    
+    def __init__(self, *args, **kwargs):
+        if not self.deferred_validation:
+            return super(RemoteResource, self).__init__(*args, **kwargs)
+        d = dict(*args, **kwargs)
+        dict.__init__(self, d)
+        self.__dict__['changes'] = {}
+        self.__dict__['__original__'] = serializers.copy_json(d)
+    
+    def __setitem__(self, key, value):
+        if not self.deferred_validation:
+            return super(RemoteResource, self).__setitem__(key, value)
+        dict.__setitem__(self, key, value)
+        self.__dict__['changes'][key] = value
+    
+    def __delitem__(self, key):
+        if not self.deferred_validation:
+            return super(RemoteResource, self).__delitem__(key)
+        dict.__delitem__(self, key)
+    
+    def update(self, other):
+        if not self.deferred_validation:
+            return super(RemoteResource, self).update(other)
+        dict.update(self, other)
+    
+    def validate(self, obj=None):
+        """
+        checks the model against its schema, reporting all errors at once
+        :param obj: dict to check instead, with the single error handling of warlock
+        :raises ValidationError listing every error found
+        """
+        if obj is not None:
+            return super(RemoteResource, self).validate(obj)
+        errors = [u"%s: %s" % (u"/".join(unicode(part) for part in reversed(error.path)) or u"-",
+                               error.message)
+                  for error in get_validator(self.schema).iter_errors(self)]
+        if errors:
+            raise ValidationError("VALIDATION_FAILED", u"invalid %s, %s" % (
+                self.schema['title'], u"; ".join(errors)), errors=errors)
+    
+    def _pre_save(self, *args, **kwargs):
+        """
+        validates the model before it is sent
+        """
+        self.validate()
+    
+    def __getattr__(self, key):
+        try:
+            return super(RemoteResource, self).__getattr__(key)
+        except AttributeError:
+            # properties win, then relations and references of the schema
+            if key.startswith(u"_") or 'schema' not in self.__dict__:
+                raise
+            compiled = loaders.get_compiled_schema(self.schema['title'])
+            if key in compiled.relations:
+                return self.get_related(key)
+            if key in compiled.references:
+                return self.get_reference(key)
+            raise
+    
+    def get_related(self, rel):
+        """
+        collection of the resources behind a relation link of the schema,
+        e.g. client.get_related(u"invoices") or client.invoices
+        the collection is kept for the lifetime of the object but returned
+        unloaded, nothing is requested until the caller loads it, e.g. with
+        load_all() or iter_items()
+        :raises APIException if rel is no relation or the object has no id
+        """
+        resource_type = loaders.get_compiled_schema(self.schema['title']).relations.get(rel)
+        if resource_type is None:
+            raise APIException("RELATION_NOTFOUND", "%s has no relation %s" % (self.schema['title'], rel))
+        related = self.__dict__.setdefault('related', {})
+        # a changed id gets a new collection
+        key = (rel, self.get_id())
+        if key not in related:
+            endpoint = self.get_compiled_endpoint(rel)
+            bound = Endpoint(rel, endpoint.method, endpoint.href, endpoint.url(self.get_id()), None)
+            from salesking import collection
+            related[key] = collection.get_collection_instance(resource_type, self.__api__, endpoint=bound)
+        return related[key]
+    
+    def get_reference(self, name):
+        """
+        lazy proxy of the resource the <name>_id property refers to,
+        e.g. invoice.get_reference(u"client") or invoice.client if the
+        invoice has no client property, loaded on first use
+        :returns ResourceProxy or None if the id is not set
+        :raises APIException if there is no such reference
+        """
+        resource_type = loaders.get_compiled_schema(self.schema['title']).references.get(name)
+        if resource_type is None:
+            raise APIException("REFERENCE_NOTFOUND", "%s has no reference %s" % (self.schema['title'], name))
+        id = dict.get(self, u"%s_id" % name)
+        if id is None:
+            return None
+        related = self.__dict__.setdefault('related', {})
+        # a changed id gets a new proxy
+        key = (name, id)
+        if key not in related:
+            related[key] = ResourceProxy(resource_type, id, self.__api__)
+        return related[key]
+    
     def __repr__(self):
         return u'<RemoteResource %s> %s' %(self.get_id(),self.schema)
     
@@ -173,13 +368,19 @@ class RemoteResource(BaseResource):
         is_update = self.get_id() is not None 
         if is_update:
             call_type='update'
+            if not self.get_changed_properties():
+                log.info("%s %s unchanged, nothing to update" % (self.schema['title'], self.get_id()))
+                return self
         else:
             call_type='create'
         response = self._do_api_call(call_type=call_type, id=self.get_id())
         return response
     
-    def _load(self,id = None):
-        response = self._do_api_call(call_type="load", id=id)
+    def _load(self,id = None, readonly = False):
+        """
+        :param readonly: return a records.Record instead of a model
+        """
+        response = self._do_api_call(call_type="load", id=id, readonly=readonly)
         return response
     
     def _delete(self):
@@ -187,99 +388,429 @@ class RemoteResource(BaseResource):
         return response
     
     
-    def _do_api_call(self, call_type=u'', id=None):
+    def load_async(self, id, readonly=False):
+        """
+        coroutine variant of load, needs an async_api.AsyncAPIClient
+        """
+        from salesking import async_api
+        return async_api.load_resource(self, id, readonly=readonly)
+    
+    def save_async(self):
+        """
+        coroutine variant of save, needs an async_api.AsyncAPIClient
+        """
+        from salesking import async_api
+        return async_api.save_resource(self)
+    
+    def delete_async(self):
+        """
+        coroutine variant of delete, needs an async_api.AsyncAPIClient
+        """
+        from salesking import async_api
+        return async_api.delete_resource(self)
+    
+    def _do_api_call(self, call_type=u'', id=None, readonly=False):
         """
         returns a response if it is a valid call
         otherwise the corresponding error
-        
+        :param readonly: loads return a records.Record
+        """
+        check_sync_api(self.__api__)
+        cached = self._get_cached(call_type, id, readonly)
+        if cached is not None:
+            return cached
+        url, method, payload = self._prepare_api_call(call_type, id)
+        # request raises exceptions if not 200
+        try:
+            response = self.__api__.request(url, method, data=payload)
+            result = self._handle_api_response(call_type, response, readonly)
+            self._update_cache(call_type, id, result)
+            return result
+        except Exception,e:
+            msg ="Exception occoured %s" % e
+            log.error(msg)
+            raise e
+    
+    def get_object_cache(self):
+        """
+        :returns the ObjectCache of the api client or None
+        """
+        cache = getattr(self.__api__, 'object_cache', None)
+        if isinstance(cache, ObjectCache):
+            return cache
+        return None
+    
+    def _get_cached(self, call_type, id, readonly=False):
+        """
+        answers a load from the object cache
+        :returns new object or None if the call has to go to the api
+        """
+        cache = self.get_object_cache()
+        if cache is None or call_type != u'load' or id is None:
+            return None
+        data = cache.get(self.schema['title'], id)
+        if data is None:
+            return None
+        if readonly:
+            return get_record_class(self.schema['title']).from_dict(data)
+        cls = get_model_class(self.schema['title'], api=self.__api__)
+        return build_model(cls, data, self.schema)
+    
+    def _update_cache(self, call_type, id, result):
+        """
+        keeps the object cache in line with a successful call
+        loaded and saved models are stored, deleted ones dropped
+        records are not validated and stay out of the cache
+        """
+        cache = self.get_object_cache()
+        if cache is None:
+            return
+        if call_type == u'delete':
+            cache.invalidate(self.schema['title'], id)
+        elif call_type in (u'load', u'create', u'update') and isinstance(result, Model):
+            id = result.get_id() or id
+            if id is not None:
+                cache.set(self.schema['title'], id, result.__dict__['__original__'])
+    
+    def _prepare_api_call(self, call_type=u'', id=None):
+        """
+        resolves the endpoint of the call
+        :returns tuple (url, method, payload)
+        :raises APIException
         """
-        endpoint = None
-        url = None
         if call_type == u'load':
-            endpoint = self.get_endpoint("self")
+            endpoint = self.get_compiled_endpoint(u"self")
             if id is None:
                 raise APIException("LOAD_IDNOTSET","could not load object")
         elif call_type == u'delete':
-            endpoint = self.get_endpoint("destroy")
+            endpoint = self.get_compiled_endpoint(u"destroy")
             if id is None:
                 raise APIException("DELETE_IDNOTSET","could not delete object")
         elif call_type == u'update':
-            endpoint = self.get_endpoint("update")
+            endpoint = self.get_compiled_endpoint(u"update")
             if id is None:
                 raise APIException("UPDATE_IDNOTSET","could not load object")
         elif call_type == u'create':
-            endpoint = self.get_endpoint("create")
-            url = u"%s%s%s" % (self.__api__.base_url, API_BASE_PATH, endpoint['href'])
+            endpoint = self.get_compiled_endpoint(u"create")
         elif call_type == u'schema':
-            # add schema gethering functionality 
-            # hackisch
-            endpoint = self.get_endpoint("create")
-            url = u"%s%s%s/schema" % (self.__api__.base_url, API_BASE_PATH, endpoint['href'])
-            endpoint['method'] = u'GET'    
-        if id is not None:
-            url = u"%s%s%s" % (self.__api__.base_url, API_BASE_PATH, endpoint['href'].replace(u"{id}",id))
-        ## exceute the api request
-        payload = self.get_data()
-        method = endpoint['method']
-        # request raises exceptions if not 200
-        obj = None
-        try:
-            response = self.__api__.request(url, method, data=payload)
-            #load update create success
-            if ((response.status_code == 200 and 
-                 call_type in ['load','update']) or 
-            (response.status_code == 201 and call_type == 'create')):
-                msg ="call_type: %s successfully completed" % call_type
-                log.info(msg)
-                return self.get_object_from_response(response)
-            elif (response.status_code == 200 and call_type in ['delete']):
-            #delete success
-                msg ="call_type: %s successfully completed" % call_type
-                log.info(msg)
-                return self._try_to_serialize(response)
-            elif 200 <= response.status_code <= 299:
-                return self._try_to_serialize(response)
-        except Exception,e:
-            msg ="Exception occoured %s" % e
-            log.error(msg)
-            raise e
-        
-    def get_object_from_response(self, response):
+            endpoint = self.get_compiled_endpoint(u"schema")
+        else:
+            raise APIException("CALLTYPE_INVALID","invalid call type %s" % call_type)
+        if call_type == u'create':
+            payload = self.get_data()
+        elif call_type == u'update':
+            # only what changed since the load, see get_update_properties
+            payload = self.get_data(self.get_update_properties())
+        else:
+            # load, delete and schema calls have no body
+            payload = None
+        return endpoint.url(id), endpoint.method, payload
+    
+    def _handle_api_response(self, call_type, response, readonly=False):
+        """
+        turns the response of a successful call into the result
+        :param readonly: a load returns a records.Record
+        :returns new object for load, update and create, otherwise the response
+        """
+        #load update create success
+        if ((response.status_code == 200 and 
+             call_type in ['load','update']) or 
+        (response.status_code == 201 and call_type == 'create')):
+            msg ="call_type: %s successfully completed" % call_type
+            log.info(msg)
+            return self.get_object_from_response(response, readonly and call_type == u'load')
+        elif (response.status_code == 200 and call_type in ['delete']):
+        #delete success
+            msg ="call_type: %s successfully completed" % call_type
+            log.info(msg)
+            return self._try_to_serialize(response)
+        elif 200 <= response.status_code <= 299:
+            return self._try_to_serialize(response)
+    
+    def get_object_from_response(self, response, readonly=False):
         """
         transforms the response into a new object
         :param response: valid respone status code 200
+        :param readonly: return a records.Record, nothing is validated
         :returns new instance of current class
         """
         klass = self.schema['title']
+        if readonly:
+            record_cls = get_record_class(klass)
+            def hydrate_record(response):
+                return record_cls.from_dict(serializers.loads_compact(response.content)[klass])
+            # records are immutable and handed out as they are
+            return hydrate_response(response, hydrate_record, lambda record: record, key='records')
         cls = get_model_class(klass, api=self.__api__)
-        jdict = json.loads(response.content, encoding="utf-8")
-        ### check if we have a response
-        properties_dict = jdict[self.schema['title']]
-        new_dict = helpers.remove_properties_containing_None(properties_dict)
-        obj = cls(new_dict)
-        return obj
+        def hydrate(response):
+            # nulls are dropped while decoding
+            return hydrate_model(cls, serializers.loads_compact(response.content)[klass])
+        return hydrate_response(response, hydrate, lambda obj: copy_model(obj, cls))
     
       
 
+_validators = dict()
+_validators_lock = threading.Lock()
+
+def check_sync_api(api):
+    """
+    :raises APIException if the request of api is a coroutine, an
+            async_api.AsyncAPIClient is used with the *_async methods only
+    """
+    # stand-ins like mock.Mock answer any attribute
+    if getattr(api, 'is_async', False) is True:
+        raise APIException("API_ASYNC", "%s needs the *_async methods" % type(api).__name__)
+
+def get_validator(schema):
+    """
+    returns the shared jsonschema validator of a model schema
+    unlike warlock the schema itself is not checked, some of the
+    scheme files are not strict draft 3
+    """
+    key = schema['title']
+    validator = _validators.get(key)
+    if validator is not None:
+        return validator
+    with _validators_lock:
+        return _validators.setdefault(key, jsonschema.Draft3Validator(schema))
+
+def hydrate_model(cls, data):
+    """
+    instance of the model class cls for data sent by the api
+    it is validated once and marked as loaded, so updates only send
+    what changes afterwards
+    """
+    obj = cls(data)
+    obj.validate()
+    obj.__dict__['loaded'] = True
+    return obj
+
+def build_model(cls, data, schema):
+    """
+    loaded instance of the model class cls holding data
+    the data passed validation already, so it is not validated again
+    :param schema: the schema of cls
+    """
+    obj = cls.__new__(cls)
+    # model_factory classes keep the schema on the instance
+    obj.__dict__['schema'] = schema
+    dict.__init__(obj, data)
+    obj.__dict__['changes'] = {}
+    obj.__dict__['__original__'] = serializers.copy_json(data)
+    obj.__dict__['loaded'] = True
+    return obj
+
+def copy_model(obj, cls=None):
+    """
+    new instance holding the data obj was created with, local changes
+    of obj are not taken over
+    :param cls: model class of the copy, defaults to the class of obj
+    """
+    return build_model(cls or type(obj), serializers.copy_json(obj.__dict__['__original__']),
+                       obj.__dict__['schema'])
+
+def hydrate_response(response, hydrate, reuse, key='hydrated'):
+    """
+    parses a response only once
+    the api client answers a 304 with the response stored for the url,
+    the objects parsed from it are handed out again via reuse
+    :param hydrate: hydrate(response) parses the response body
+    :param reuse: reuse(hydrated) returns a fresh copy of a previous result
+    :param key: attribute of the response keeping the result, one per kind
+                of hydration
+    """
+    hydrated = vars(response).get(key)
+    if hydrated is not None:
+        return reuse(hydrated)
+    hydrated = hydrate(response)
+    setattr(response, key, hydrated)
+    return hydrated
+
+
+class ResourceProxy(object):
+    """
+    stands in for the resource of type and id, loading it on first access
+    """
+    def __init__(self, resource_type, id, api, resource=None):
+        """
+        :param resource: the resource if it was loaded already
+        """
+        self._type = resource_type
+        self._id = id
+        self._api = api
+        self._resource = resource
+
+    def __repr__(self):
+        if self._resource is not None:
+            return repr(self._resource)
+        return u"<ResourceProxy %s/%s>" % (self._type, self._id)
+
+    def __getattr__(self, attr):
+        if attr.startswith(u"__"):
+            raise AttributeError(attr)
+        return getattr(self._get(), attr)
+
+    def __getitem__(self, item):
+        return self._get()[item]
+
+    def __contains__(self, attr):
+        return attr in self._get()
+
+    @property
+    def loaded(self):
+        return self._resource is not None
+
+    def _get(self):
+        """
+        loads the resource, only once
+        """
+        if self._resource is None:
+            self._resource = get_model_class(self._type, api=self._api)().load(self._id)
+        return self._resource
+
+
+class BulkResult(object):
+    """
+    outcome of a bulk operation, the lists follow the input order
+    * results: save: the new objects, delete: the responses, None where it failed
+    * errors: the exception of each failed item, None where it succeeded
+    """
+    def __init__(self, resources, results, errors):
+        self.resources = resources
+        self.results = results
+        self.errors = errors
+
+    @property
+    def ok(self):
+        """
+        True if all items succeeded
+        """
+        return not any(error is not None for error in self.errors)
+
+    def failed(self):
+        """
+        :returns list of (index, resource, exception) of the failed items
+        """
+        return [(index, self.resources[index], error)
+                for index, error in enumerate(self.errors) if error is not None]
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+    def __repr__(self):
+        return u"<BulkResult %s items, %s failed>" % (len(self), len(self.failed()))
+
+
+def _run_bulk(call, resources, concurrency):
+    """
+    calls call(resource) for each resource, concurrency calls in parallel
+    an exception only fails its own item
+    """
+    resources = list(resources)
+    def run(resource):
+        try:
+            return call(resource), None
+        except Exception, e:
+            log.error("bulk item failed: %s" % e)
+            return None, e
+    if concurrency > 1 and len(resources) > 1:
+        pool = ThreadPool(min(concurrency, len(resources)))
+        try:
+            outcome = pool.map(run, resources)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        outcome = [run(resource) for resource in resources]
+    return BulkResult(resources,
+                      [result for result, error in outcome],
+                      [error for result, error in outcome])
+
+def bulk_save(resources, concurrency=4):
+    """
+    creates or updates many resources, concurrency requests in parallel
+    the requests share the pooled session of their api client, so keep
+    concurrency below the transport option pool_maxsize
+    :param resources: iterable of RemoteResource
+    :returns BulkResult with the new objects in input order
+    """
+    return _run_bulk(lambda resource: resource.save(), resources, concurrency)
+
+def bulk_delete(resources, concurrency=4):
+    """
+    deletes many resources, concurrency requests in parallel
+    :param resources: iterable of RemoteResource
+    :returns BulkResult with the responses in input order
+    """
+    return _run_bulk(lambda resource: resource.delete(), resources, concurrency)
+
+
+def model_factory(schema, base_class=RemoteResource):
+    """
+    same as warlock.model_factory, but the schema is copied with
+    serializers.copy_json instead of the much slower deepcopy
+    :param schema: schema of the model, it is not changed
+    """
+    schema = serializers.copy_json(schema)
+
+    class Model(base_class):
+        def __init__(self, *args, **kwargs):
+            self.__dict__['schema'] = schema
+            base_class.__init__(self, *args, **kwargs)
+
+    Model.__name__ = str(schema['name'])
+    return Model
+
+
+_model_class_cache = OrderedDict()
+_model_class_cache_lock = threading.Lock()
+
 def get_model_class( klass, api = None, use_request_api = True):
     """
     Generates the Model Class based on the klass 
     loads automatically the corresponding json schema file form schemes folder
+    classes are cached per (klass, api), the least recently used ones
+    are dropped once MODEL_CLASS_CACHE_SIZE is reached
     :param klass: json schema filename
     :param use_request_api: if True autoinitializes request class if api is None
     :param api: the transportation api
-                if none the default settings are taken an instantiated
+                if none the shared default client is used
     """
     if api is None and use_request_api:
-        api = APIClient()
+        # the transport is imported with the first use of the default client
+        from salesking.api import get_default_client
+        api = get_default_client()
     _type = klass
     if isinstance(klass, dict):
         _type = klass['type']
+    key = (_type, api)
+    with _model_class_cache_lock:
+        model_cls = _model_class_cache.pop(key, None)
+        if model_cls is not None:
+            # most recently used goes to the end
+            _model_class_cache[key] = model_cls
+            return model_cls
     schema = loaders.load_schema_raw(_type)
     model_cls = model_factory(schema, base_class = RemoteResource)
     model_cls.__api__ = api
+    with _model_class_cache_lock:
+        model_cls = _model_class_cache.setdefault(key, model_cls)
+        while len(_model_class_cache) > MODEL_CLASS_CACHE_SIZE:
+            _model_class_cache.popitem(last=False)
     return model_cls
 
+def clear_model_class_cache():
+    """
+    drops all cached model classes
+    """
+    with _model_class_cache_lock:
+        _model_class_cache.clear()
+    with _validators_lock:
+        _validators.clear()
+
 
 
     
@@ -349,45 +880,6 @@ def get_model_class( klass, api = None, use_request_api = True):
 
 
 
-#class ResourceProxy(object):
-#    """Proxy object to a resource
-#
-#    It lazily fetches data.
-#    """
-#
-#    def __init__(self, url, service, api):
-#        self._url = url
-#        self._service = service
-#        self._api = api
-#        self._type, id = self._service.parse_resource_url(self._url)
-#        self._id = int(id)
-#        self._resource = None
-#
-#    def __repr__(self):
-#        if self._resource:
-#            return repr(self._resource)
-#        else:
-#            return '<ResourceProxy %s/%s>' % (self._type, self._id)
-#
-#    def __getattr__(self, attr):
-#        return getattr(self._get(), attr)
-#
-#    def __getitem__(self, item):
-#        return self._get()[item]
-#
-#    def __contains__(self, attr):
-#        return attr in self._get()
-#
-#    def _get(self):
-#        """Load the resource
-#        
-#        Do nothing if already loaded.
-#        """
-#        if not self._resource:
-#            self._resource = self._api(self._type, self._id)
-#        return self._resource
-#
-#
 #class Resource(object):
 #    """A fetched resource"""
 #
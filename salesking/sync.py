@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    incremental sync of remote collections into a local target
+
+    >>> engine = SyncEngine(MemoryTarget(), JsonCheckpointStore("sync.json"))
+    >>> engine.sync("invoice")
+    <SyncResult invoice inserted=120 updated=0 skipped=0 pages=2>
+    >>> engine.sync("invoice")
+    <SyncResult invoice inserted=0 updated=1 skipped=0 pages=1>
+
+    the api has no filter on updated_at, so the delta is read newest first
+    (sort_by=updated_at, sort=DESC) and paging stops at the first record
+    older than the checkpoint. records whose lock_version matches the one
+    of the target are not hydrated again.
+"""
+import os
+import logging
+import threading
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+import iso8601
+
+from salesking import collection, resources
+
+
+log = logging.getLogger(__name__)
+
+SYNC_SORT_BY = u"updated_at"
+
+
+def parse_timestamp(value):
+    """
+    :param value: iso8601 string like the updated_at of the records
+    :returns timezone aware datetime
+    """
+    return iso8601.parse_date(value)
+
+
+class CheckpointStore(object):
+    """
+    persists the checkpoint, the newest updated_at synced, per resource type
+    """
+    def get(self, resource_type):
+        """
+        :returns the checkpoint or None if the type was never synced
+        """
+        raise NotImplementedError()
+
+    def set(self, resource_type, checkpoint):
+        raise NotImplementedError()
+
+
+class MemoryCheckpointStore(CheckpointStore):
+
+    def __init__(self):
+        self._checkpoints = dict()
+
+    def get(self, resource_type):
+        return self._checkpoints.get(resource_type)
+
+    def set(self, resource_type, checkpoint):
+        self._checkpoints[resource_type] = checkpoint
+
+
+class JsonCheckpointStore(CheckpointStore):
+    """
+    keeps the checkpoints in a json file, written atomically
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def get(self, resource_type):
+        with self._lock:
+            return self._read().get(resource_type)
+
+    def set(self, resource_type, checkpoint):
+        with self._lock:
+            checkpoints = self._read()
+            checkpoints[resource_type] = checkpoint
+            tmp = u"%s.tmp" % self.path
+            with open(tmp, "w") as f:
+                json.dump(checkpoints, f)
+            os.rename(tmp, self.path)
+
+
+class SyncTarget(object):
+    """
+    local store the records are synced into
+    """
+    def get_lock_versions(self, resource_type, ids):
+        """
+        :returns dict id -> lock_version of the ids already stored
+        """
+        raise NotImplementedError()
+
+    def upsert(self, resource_type, items):
+        """
+        inserts or replaces the hydrated items
+        """
+        raise NotImplementedError()
+
+
+class MemoryTarget(SyncTarget):
+    """
+    keeps the synced items in resource type -> id -> item dicts
+    """
+    def __init__(self):
+        self.items = dict()
+
+    def get_lock_versions(self, resource_type, ids):
+        stored = self.items.get(resource_type, {})
+        return dict((id, stored[id].get(u"lock_version")) for id in ids if id in stored)
+
+    def upsert(self, resource_type, items):
+        stored = self.items.setdefault(resource_type, {})
+        for item in items:
+            stored[item.id] = item
+
+
+class SyncResult(object):
+    """
+    counters of a sync run
+    """
+    def __init__(self, resource_type, checkpoint=None):
+        self.resource_type = resource_type
+        self.checkpoint = checkpoint
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self.pages = 0
+        self.incremental = False
+
+    def __repr__(self):
+        return u"<SyncResult %s inserted=%s updated=%s skipped=%s pages=%s>" % (
+            self.resource_type, self.inserted, self.updated, self.skipped, self.pages)
+
+
+class SyncEngine(object):
+    """
+    syncs resource types into a SyncTarget, the checkpoint is only
+    stored once a run completed
+
+    :param target: SyncTarget receiving the records
+    :param checkpoints: CheckpointStore, defaults to a MemoryCheckpointStore
+    :param api_client: api client, defaults to the shared default client
+    """
+    def __init__(self, target, checkpoints=None, api_client=None, per_page=100):
+        self.target = target
+        self.checkpoints = checkpoints if checkpoints is not None else MemoryCheckpointStore()
+        self.api_client = api_client
+        self.per_page = per_page
+
+    def get_collection(self, resource_type):
+        col = collection.get_collection_instance(resource_type, self.api_client)
+        col.per_page = self.per_page
+        return col
+
+    def supports_delta(self, col):
+        """
+        True if the api sorts the collection by updated_at
+        """
+        sort_by = col.get_list_endpoint().get('properties', {}).get('sort_by', {})
+        return SYNC_SORT_BY in sort_by.get('enum', [])
+
+    def sync(self, resource_type, full=False):
+        """
+        fetches the records changed since the last run
+        :param full: ignore the checkpoint and scan all records, unchanged
+                     ones are still skipped by their lock_version
+        :returns SyncResult
+        """
+        col = self.get_collection(resource_type)
+        checkpoint = None if full else self.checkpoints.get(resource_type)
+        result = SyncResult(resource_type, checkpoint)
+        since = None
+        if self.supports_delta(col):
+            col.sort_by = SYNC_SORT_BY
+            col.sort = u"DESC"
+            if checkpoint is not None:
+                since = parse_timestamp(checkpoint)
+                result.incremental = True
+        newest = parse_timestamp(checkpoint) if checkpoint is not None else None
+        page = 1
+        while True:
+            meta, records = col._fetch_page_data(page)
+            result.pages += 1
+            changed = []
+            for record in records:
+                updated_at = record.get(u"updated_at")
+                if updated_at is None:
+                    changed.append(record)
+                    continue
+                updated_at = parse_timestamp(updated_at)
+                if since is not None and updated_at < since:
+                    # sorted newest first, the rest was synced before
+                    meta = dict(meta, total_pages=page)
+                    break
+                changed.append(record)
+                if newest is None or updated_at > newest:
+                    newest = updated_at
+                    result.checkpoint = record[u"updated_at"]
+            self._apply(col, changed, result)
+            if page >= meta['total_pages']:
+                break
+            page += 1
+        if result.checkpoint is not None:
+            self.checkpoints.set(resource_type, result.checkpoint)
+        log.info("sync %s" % result)
+        return result
+
+    def _apply(self, col, records, result):
+        """
+        hydrates and upserts the records with a new lock_version
+        """
+        if not records:
+            return
+        known = self.target.get_lock_versions(col.resource_type,
+                                              [record.get(u"id") for record in records])
+        item_cls = resources.get_model_class(col.resource_type, api=col.__api__)
+        items = []
+        for record in records:
+            id = record.get(u"id")
+            lock_version = record.get(u"lock_version")
+            if id in known:
+                if lock_version is not None and known[id] == lock_version:
+                    result.skipped += 1
+                    continue
+                result.updated += 1
+            else:
+                result.inserted += 1
+            items.append(col._hydrate_item(record, item_cls))
+        if items:
+            self.target.upsert(col.resource_type, items)
@@ -5,6 +5,13 @@ from salesking.tests.utils import *
 from salesking.tests.api import *
 from salesking.tests.resources import *
 from salesking.tests.collection import *
+from salesking.tests.async_api import *
+from salesking.tests.sync import *
+from salesking.tests.mirror import *
+from salesking.tests.records import *
+from salesking.tests.export import *
+from salesking.tests.frame import *
+from salesking.tests.imports import *
 
 # live tests
 from salesking.tests.live_resources import *
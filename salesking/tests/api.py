@@ -1,8 +1,20 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from salesking import api    
+import time
+import json
+import urlparse
+
+import requests
+from mock import patch
+
+from salesking import api, resources, collection
+from salesking import exceptions
+from salesking.exceptions import SalesKingException
 from salesking.tests.base import SalesKingBaseTestCase
+from salesking.tests.server import StandInServer, page_content
+from salesking.utils import serializers
+from salesking.utils.cache import LRUCache
 
 
 class SKApiTestCase(SalesKingBaseTestCase):
@@ -20,3 +32,251 @@ class SKApiTestCase(SalesKingBaseTestCase):
         self.assertEquals(response.status_code,200)
         msg ="response: %s" % response.text
         self.assertEquals(response.text.find("error"),-1,msg)
+
+
+class SKTransportTestCase(SalesKingBaseTestCase):
+
+    def setUp(self):
+        self.options = api.get_transport_options()
+        self.server = StandInServer(self.respond).start()
+        self.delay = 0
+        # statuses answered before the regular 200, one per request
+        self.failures = []
+        self.cookie = None
+
+    def tearDown(self):
+        api.configure_transport(**self.options)
+        self.server.stop()
+
+    def respond(self, method, path, headers, body):
+        time.sleep(self.delay)
+        if self.failures:
+            status, response_headers = self.failures.pop(0)
+            return status, response_headers, '{"error":"failed"}'
+        response_headers = {"Content-Type": "application/json"}
+        if self.cookie:
+            response_headers["Set-Cookie"] = "%s; Path=/" % self.cookie
+        return 200, response_headers, '{"ok":true}'
+
+    def get_client(self):
+        clnt = api.APIClient()
+        clnt.base_url = self.server.base_url
+        return clnt
+
+    def test_clients_share_session_per_base_url(self):
+        first = api.APIClient()
+        second = api.APIClient()
+        self.assertTrue(first._get_session() is second._get_session())
+        self.assertTrue(api.get_session(u"https://other.example/") is not first._get_session())
+
+    def test_shared_session_keeps_no_cookies(self):
+        self.cookie = "session=user1"
+        first = self.get_client()
+        second = self.get_client()
+        second.sk_user = u"other"
+        first.request(u"api/clients")
+        second.request(u"api/clients")
+        self.assertEquals([headers.get("cookie") for method, path, headers, body in self.server.requests],
+                          [None, None])
+        self.assertEquals(len(first._get_session().cookies), 0)
+
+    def test_default_client_used_by_resources_and_collection(self):
+        default = api.get_default_client()
+        self.assertTrue(default is api.get_default_client())
+        model = resources.get_model_class("client")
+        self.assertTrue(model.__api__ is default)
+        self.assertTrue(model is resources.get_model_class("client"))
+        self.assertTrue(collection.get_collection_instance("client").__api__ is default)
+
+    def test_configure_transport(self):
+        api.configure_transport(pool_maxsize=3, pool_connections=2)
+        adapter = api.get_session(u"https://sk.example/").get_adapter(u"https://sk.example/")
+        self.assertEquals(adapter._pool_maxsize, 3)
+        self.assertEquals(adapter._pool_connections, 2)
+        self.failUnlessRaises(SalesKingException, api.configure_transport, notexisting=1)
+
+    def test_keep_alive_connection_reused(self):
+        clnt = api.APIClient()
+        clnt.base_url = self.server.base_url
+        for x in xrange(5):
+            self.assertEquals(clnt.request(u"api/clients").status_code, 200)
+        self.assertEquals(len(self.server.connections), 1)
+
+    def test_keep_alive_off(self):
+        api.configure_transport(keep_alive=False)
+        clnt = api.APIClient()
+        clnt.base_url = self.server.base_url
+        for x in xrange(3):
+            clnt.request(u"api/clients")
+        self.assertEquals(len(self.server.connections), 3)
+
+    def test_timeout(self):
+        api.configure_transport(timeout=0.1, max_retries=0)
+        self.delay = 0.5
+        clnt = api.APIClient()
+        clnt.base_url = self.server.base_url
+        self.failUnlessRaises(requests.exceptions.Timeout, clnt.request, u"api/clients")
+
+    def test_retry_server_errors_for_idempotent_methods(self):
+        api.configure_transport(backoff_factor=0.01)
+        self.failures = [(503, {}), (502, {})]
+        clnt = self.get_client()
+        self.assertEquals(clnt.request(u"api/clients").status_code, 200)
+        self.assertEquals(clnt.stats.retries, 2)
+        self.assertEquals(clnt.stats.requests, 3)
+        self.assertTrue(clnt.stats.backoff_time > 0)
+
+    def test_no_retry_for_post_server_error(self):
+        api.configure_transport(backoff_factor=0.01)
+        self.failures = [(503, {})]
+        clnt = self.get_client()
+        try:
+            clnt.request(u"api/clients", u"POST", data=u"{}")
+            self.fail("ServerError expected")
+        except exceptions.ServerError, e:
+            self.assertEquals(e.response.status_code, 503)
+        self.assertEquals(clnt.stats.retries, 0)
+
+    def test_retry_after_honored_for_429(self):
+        self.failures = [(429, {"Retry-After": "0"})]
+        clnt = self.get_client()
+        self.assertEquals(clnt.request(u"api/clients", u"POST", data=u"{}").status_code, 200)
+        self.assertEquals(clnt.stats.retries, 1)
+
+    def test_retries_exhausted(self):
+        api.configure_transport(max_retries=1, backoff_factor=0.01)
+        self.failures = [(429, {"Retry-After": "0"})] * 2
+        clnt = self.get_client()
+        self.failUnlessRaises(exceptions.TooManyRequests, clnt.request, u"api/clients")
+        self.assertEquals(clnt.stats.retries, 1)
+
+    def test_rate_limit_shared_across_clients(self):
+        api.configure_transport(rate_limit=20, rate_burst=1)
+        clients = [self.get_client() for x in xrange(2)]
+        self.assertTrue(api.get_rate_limiter(self.server.base_url) is
+                        api.get_rate_limiter(clients[1].base_url))
+        start = time.time()
+        for x in xrange(3):
+            for clnt in clients:
+                clnt.request(u"api/clients")
+        self.assertTrue(time.time() - start >= 0.2)
+        self.assertTrue(sum(clnt.stats.throttled_time for clnt in clients) > 0)
+
+
+class SKConditionalRequestTestCase(SalesKingBaseTestCase):
+
+    def setUp(self):
+        self.options = api.get_transport_options()
+        self.server = StandInServer(self.respond).start()
+        self.version = 1
+        self.validator = u"ETag"
+        self.pages = 1
+
+    def tearDown(self):
+        api.configure_transport(**self.options)
+        self.server.stop()
+
+    def respond(self, method, path, headers, body):
+        if self.validator == u"ETag":
+            value = '"v%s"' % self.version
+            unchanged = headers.get("If-None-Match") == value
+        else:
+            value = "Wed, 0%s Jan 2014 10:00:00 GMT" % self.version
+            unchanged = headers.get("If-Modified-Since") == value
+        response_headers = {"Content-Type": "application/json", self.validator: value}
+        if method != "GET":
+            return 200, {}, "{}"
+        if unchanged:
+            return 304, response_headers, ""
+        client = lambda x: {"id": "c%s" % x, "organisation": "version %s" % self.version}
+        if path.startswith("/api/clients/"):
+            return 200, response_headers, json.dumps({"client": client(1)})
+        # one client per page
+        page = int(urlparse.parse_qs(urlparse.urlparse(path).query).get('page', ['1'])[0])
+        return 200, response_headers, page_content("clients", [client(page)], page=page,
+                                                   per_page=1, total_entries=self.pages)
+
+    def get_model(self):
+        clnt = api.APIClient()
+        clnt.base_url = self.server.base_url
+        return resources.get_model_class("client", api=clnt)
+
+    def sent_headers(self, header):
+        return [headers.get(header.lower()) for method, path, headers, body in self.server.requests]
+
+    def test_etag_not_modified_reuses_parsed_object(self):
+        model = self.get_model()
+        first = model().load(u"c1")
+        with patch.object(serializers, "loads_compact") as loads_mock:
+            second = model().load(u"c1")
+            self.assertFalse(loads_mock.called)
+        self.assertEquals(self.sent_headers(u"If-None-Match"), [None, '"v1"'])
+        self.assertEquals(model.__api__.stats.not_modified, 1)
+        self.assertEquals(second, first)
+        self.assertTrue(second is not first)
+        second.organisation = u"changed"
+        self.assertEquals(model().load(u"c1").organisation, u"version 1")
+
+    def test_last_modified(self):
+        self.validator = u"Last-Modified"
+        model = self.get_model()
+        model().load(u"c1")
+        model().load(u"c1")
+        self.assertEquals(self.sent_headers(u"If-Modified-Since"),
+                          [None, "Wed, 01 Jan 2014 10:00:00 GMT"])
+        self.assertEquals(model.__api__.stats.not_modified, 1)
+
+    def test_changed_representation_replaced(self):
+        model = self.get_model()
+        model().load(u"c1")
+        self.version = 2
+        self.assertEquals(model().load(u"c1").organisation, u"version 2")
+        self.assertEquals(model().load(u"c1").organisation, u"version 2")
+        self.assertEquals(self.sent_headers(u"If-None-Match"), [None, '"v1"', '"v2"'])
+        self.assertEquals(model.__api__.stats.not_modified, 1)
+
+    def test_write_drops_representation(self):
+        model = self.get_model()
+        obj = model().load(u"c1")
+        obj.delete()
+        model().load(u"c1")
+        self.assertEquals(self.sent_headers(u"If-None-Match"), [None, None, None])
+
+    def test_collection_page_not_modified(self):
+        clnt = api.APIClient()
+        clnt.base_url = self.server.base_url
+        col = collection.get_collection_instance("client", clnt)
+        col.load()
+        first = col.items[0]
+        col.items = []
+        col.load()
+        self.assertEquals(clnt.stats.not_modified, 1)
+        self.assertEquals(col.items, [first])
+        self.assertTrue(col.items[0] is not first)
+
+    def test_load_all_not_modified_keeps_pages(self):
+        self.pages = 3
+        clnt = api.APIClient()
+        clnt.base_url = self.server.base_url
+        for readonly in (False, True):
+            for x in xrange(2):
+                col = collection.get_collection_instance("client", clnt, readonly=readonly)
+                ids = [item["id"] for item in col.load_all(concurrency=1).items]
+                self.assertEquals(ids, [u"c1", u"c2", u"c3"])
+                self.assertEquals([[item["id"] for item in items] for items in col.iter_pages()],
+                                  [[u"c1"], [u"c2"], [u"c3"]])
+        self.assertEquals(clnt.stats.not_modified, 21)
+
+    def test_bounded_and_disabled(self):
+        api.configure_transport(conditional_cache_size=2)
+        model = self.get_model()
+        for id in (u"a", u"b", u"c"):
+            model().load(id)
+        cache = api.get_conditional_cache(self.server.base_url)
+        self.assertTrue(isinstance(cache, LRUCache))
+        self.assertEquals(len(cache), 2)
+        api.configure_transport(conditional_cache_size=0)
+        self.assertEquals(api.get_conditional_cache(self.server.base_url), None)
+        model().load(u"c1")
+        model().load(u"c1")
+        self.assertEquals(model.__api__.stats.not_modified, 0)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+import urlparse
+
+try:
+    import trollius
+except ImportError:
+    trollius = None
+
+from salesking import api, resources, collection, exceptions
+from salesking.tests.resources import ResourceBaseTestCase
+from salesking.tests.collection import page_clients
+from salesking.tests.server import StandInServer, page_content
+if trollius is not None:
+    from salesking import async_api
+
+
+def client_responder(method, path, headers, body):
+    parts = urlparse.urlparse(path)
+    content = ResourceBaseTestCase.mock_response.content.encode("utf-8")
+    if parts.path == "/api/clients" and method == "GET":
+        page = int(urlparse.parse_qs(parts.query).get('page', ['1'])[0])
+        return 200, {}, page_content("clients", page_clients(page), page=page, per_page=2, total_pages=3)
+    if parts.path == "/api/clients" and method == "POST":
+        return 201, {}, content
+    if parts.path == "/api/clients/a8Ts8KsGar4OMPabxfpGMl":
+        if method == "DELETE":
+            return 200, {}, "{}"
+        return 200, {}, content
+    return 404, {}, "{}"
+
+
+@unittest.skipIf(trollius is None, "trollius is not installed")
+class AsyncAPIClientTestCase(ResourceBaseTestCase):
+
+    def setUp(self):
+        self.server = StandInServer(client_responder).start()
+        self.loop = trollius.new_event_loop()
+        self.clnt = async_api.AsyncAPIClient(loop=self.loop)
+        self.clnt.base_url = self.server.base_url
+
+    def tearDown(self):
+        self.clnt.close()
+        self.run_async(trollius.sleep(0, loop=self.loop))
+        self.loop.close()
+        self.server.stop()
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def test_request_pipeline(self):
+        response = self.run_async(self.clnt.request(u"api/clients/a8Ts8KsGar4OMPabxfpGMl"))
+        self.assertEquals(response.status_code, 200)
+        self.assertTrue(response.text.find(u"K-2012-012") > 0)
+        method, path, headers, body = self.server.requests[-1]
+        self.assertEquals(path, "/api/clients/a8Ts8KsGar4OMPabxfpGMl")
+        self.assertEquals(headers['content-type'], "application/json")
+        self.assertTrue(headers['authorization'].startswith("Basic "))
+
+    def test_blocking_calls_refused(self):
+        model = resources.get_model_class("client", api=self.clnt)
+        client = self.run_async(model().load_async(u"a8Ts8KsGar4OMPabxfpGMl"))
+        sent = len(self.server.requests)
+        calls = [lambda: model().load(u"a8Ts8KsGar4OMPabxfpGMl"),
+                 lambda: resources.ResourceProxy("client", u"a8Ts8KsGar4OMPabxfpGMl", self.clnt).number,
+                 lambda: client.get_related(u"invoices").load(),
+                 lambda: collection.get_collection_instance("client", self.clnt).load_all()]
+        for call in calls:
+            try:
+                call()
+                self.fail("blocking call accepted")
+            except exceptions.APIException, e:
+                self.assertEquals(e.code, "API_ASYNC")
+        self.assertEquals(len(self.server.requests), sent)
+
+    def test_error_mapping(self):
+        self.failUnlessRaises(exceptions.NotFound, self.run_async,
+                              self.clnt.request(u"api/clients/notexisting"))
+
+    def test_resource_load_save_delete(self):
+        model = resources.get_model_class("client", api=self.clnt)
+        client = self.run_async(model().load_async(u"a8Ts8KsGar4OMPabxfpGMl"))
+        self.assertEquals(client.number, self.mock_response.mock_number)
+        created = self.run_async(model(self.valid_data).save_async())
+        self.assertEquals(created.get_id(), self.mock_response.mock_id)
+        self.assertEquals(self.server.requests[-1][0], "POST")
+        response = self.run_async(created.delete_async())
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(self.server.requests[-1][0], "DELETE")
+
+    def test_concurrent_loads_share_connections(self):
+        model = resources.get_model_class("client", api=self.clnt)
+        loads = [model().load_async(u"a8Ts8KsGar4OMPabxfpGMl") for x in xrange(40)]
+        clients = self.run_async(trollius.gather(*loads, loop=self.loop))
+        self.assertEquals(len(clients), 40)
+        self.assertTrue(all(c.number == self.mock_response.mock_number for c in clients))
+        idle = sum(len(connections) for connections in self.clnt.pool._idle.values())
+        self.assertTrue(0 < idle <= self.clnt.max_connections_per_host)
+
+    def test_collection_load_autoload(self):
+        col = collection.get_collection_instance("client", self.clnt)
+        col.autoload = True
+        self.run_async(col.load_async())
+        self.assertEquals(len(col.items), 6)
+        self.assertEquals(sorted(item.number for item in col.items)[-1], u"K-3-1")
+
+    def test_retry_server_error(self):
+        failures = [503]
+        def responder(method, path, headers, body):
+            if failures:
+                return failures.pop(), {}, "{}"
+            return client_responder(method, path, headers, body)
+        self.server.responder = responder
+        options = api.get_transport_options()
+        api.configure_transport(backoff_factor=0.01)
+        try:
+            response = self.run_async(self.clnt.request(u"api/clients/a8Ts8KsGar4OMPabxfpGMl"))
+        finally:
+            api.configure_transport(**options)
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(self.clnt.stats.retries, 1)
+
+    def test_collection_prefetch(self):
+        from salesking.tests.collection import PrefetchApiMock
+        mock_api = PrefetchApiMock()
+        def responder(method, path, headers, body):
+            response = mock_api.request(u"http://stand-in%s" % path)
+            return response.status_code, {}, response.content
+        self.server.responder = responder
+        col = collection.get_collection_instance("payment_reminder", self.clnt)
+        col.prefetch_related(u"invoice")
+        self.run_async(col.load_async())
+        self.assertEquals(len(mock_api.paths), 2)
+        self.assertEquals(mock_api.paths[1], (u"/api/invoices", u"i0,i1,i2"))
+        self.assertEquals(col.items[5].get_reference(u"invoice").client_id, u"c0")
+        # clients have no filter[ids], each distinct id is loaded once
+        col = collection.get_collection_instance("invoice", self.clnt)
+        col.prefetch_related(u"client")
+        self.run_async(col.load_async())
+        self.assertEquals(sorted(mock_api.paths[3:]), [(u"/api/clients/c0", None), (u"/api/clients/c1", None)])
+        self.assertEquals(col.items[3].get_reference(u"client").id, u"c1")
+        self.assertEquals(len(mock_api.paths), 5)
@@ -1,7 +1,21 @@
+import threading
+import time
+import urlparse
+
 from salesking.tests.base import SalesKingBaseTestCase
+from salesking.tests.server import page_response, resource_response
 from salesking import api, resources, collection
-from salesking.exceptions import SalesKingException
+from salesking.exceptions import SalesKingException, APIException
 from mock import Mock
+
+
+def page_clients(page, per_page=2):
+    """
+    per_page generated clients numbered K-<page>-<x>
+    """
+    return [{"id": "id-%s-%s" % (page, x), "number": "K-%s-%s" % (page, x),
+             "organisation": "org %s" % x, "email": None, "lock_version": 0}
+            for x in xrange(per_page)]
     
     
 class CollectionBaseTestCase(SalesKingBaseTestCase):
@@ -69,6 +83,39 @@ class CollectionBaseTestCase(SalesKingBaseTestCase):
                 "collection":{"current_page":1,"per_page":50,"total_entries":5,"total_pages":1}
                 }'''.replace(u"\n",u"").replace(u"\t",u"")
     mock_response = MockCollectionResponse()
+    
+    class MockPagedApi(object):
+        """
+        api stand-in answering collection requests by the page= query parameter
+        """
+        base_url = u"https://sk.example/"
+        
+        def __init__(self, total_pages, per_page=2, fail_page=None, delay=0):
+            self.total_pages = total_pages
+            self.per_page = per_page
+            self.fail_page = fail_page
+            self.delay = delay
+            self.requested = []
+            self.in_flight = 0
+            self.max_in_flight = 0
+            self.lock = threading.Lock()
+        
+        def request(self, url, method=u"get", data=None, headers=None, **kwargs):
+            query = urlparse.parse_qs(urlparse.urlparse(url).query)
+            page = int(query.get('page', ['1'])[0])
+            with self.lock:
+                self.requested.append(page)
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                time.sleep(self.delay)
+                if page == self.fail_page:
+                    raise SalesKingException("LOAD_ERROR", "page %s failed" % page)
+                return page_response("clients", page_clients(page, self.per_page), page=page,
+                                     per_page=self.per_page, total_pages=self.total_pages)
+            finally:
+                with self.lock:
+                    self.in_flight -= 1
 
 
 
@@ -90,6 +137,21 @@ class CollectionTestCase(CollectionBaseTestCase):
         self.assertEquals(col.items[1].organisation,u"king")
         self.assertEquals(col.items[3].organisation,u"Werbeagentur Gl\u00fcck")
         
+    def test_load_items_share_model_class_and_api(self):
+        col=collection.get_collection_instance("client",self.api_mock)
+        col.load(page=1)
+        classes = set([item.__class__ for item in col.items])
+        self.assertEquals(len(classes), 1)
+        self.assertTrue(col.items[0].__api__ is self.api_mock)
+
+    def test_pre_load_url(self):
+        self.api_mock.base_url = u"https://sk.example/"
+        col=collection.get_collection_instance("client",self.api_mock)
+        col.add_filter("number","K-1")
+        url = col._pre_load(page=2)
+        self.assertEquals(url, u"https://sk.example/api/clients?filter%5Bnumber%5D=K-1&sort=ASC&per_page=100&page=2")
+        self.assertEquals(col.get_list_endpoint()['href'], u"clients")
+
     def test_validate_filters(self):
         col=collection.get_collection_instance("client",self.api_mock)
         #date-time germany
@@ -102,6 +164,30 @@ class CollectionTestCase(CollectionBaseTestCase):
         self.assertFalse(col.validate_filter("birthday_to","1999-13-01"));
         self.assertTrue(col.validate_filter("birthday_to","1999-01-01"));
     
+    def test_validate_filters_datetime_and_types(self):
+        col=collection.get_collection_instance("invoice",self.api_mock)
+        self.assertTrue(col.validate_filter("from","2012-01-01"))
+        self.assertFalse(col.validate_filter("from",20120101))
+        col.set_resource_type("client")
+        self.assertTrue(col.validate_filter("created_at_from","2012-12-19T00:39:49+01:00"))
+        self.assertFalse(col.validate_filter("created_at_from","yesterday"))
+        self.assertFalse(col.validate_filter("from","2012-01-01"))
+
+    def test_validate_filters_concurrently(self):
+        col=collection.get_collection_instance("client",self.api_mock)
+        results = []
+        def validate():
+            for x in xrange(200):
+                results.append(col.validate_filter("birthday_to","1999-01-01") and
+                               not col.validate_filter("birthday_to","1999-13-01"))
+        threads = [threading.Thread(target=validate) for x in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(len(results), 800)
+        self.assertTrue(all(results))
+
     def test_set_filters(self):
         valid_filters = {"q":"salesking", "number":"K-123-0001"}
         col=collection.get_collection_instance("client",self.api_mock)
@@ -113,3 +199,150 @@ class CollectionTestCase(CollectionBaseTestCase):
         self.assertTrue(col.add_filter("number","astrstring"))
         self.failUnlessRaises(SalesKingException,col.add_filter,"notexisting","string")
     
+
+
+class CollectionIteratorTestCase(CollectionBaseTestCase):
+    
+    def test_iter_pages(self):
+        paged_api = self.MockPagedApi(total_pages=3)
+        col=collection.get_collection_instance("client",paged_api)
+        pages = list(col.iter_pages())
+        self.assertEquals([len(items) for items in pages], [2, 2, 2])
+        self.assertEquals(pages[2][1].number, u"K-3-1")
+        self.assertEquals(paged_api.requested, [1, 2, 3])
+        self.assertEquals(col.items, [])
+        self.assertEquals(col.current_page, 3)
+    
+    def test_iter_items_read_ahead(self):
+        paged_api = self.MockPagedApi(total_pages=5, per_page=3)
+        col=collection.get_collection_instance("client",paged_api)
+        numbers = [item.number for item in col.iter_items(read_ahead=2)]
+        self.assertEquals(len(numbers), 15)
+        self.assertEquals(numbers[0], u"K-1-0")
+        self.assertEquals(numbers[-1], u"K-5-2")
+        self.assertEquals(sorted(paged_api.requested), [1, 2, 3, 4, 5])
+    
+    def test_iter_items_read_ahead_is_bounded(self):
+        paged_api = self.MockPagedApi(total_pages=20)
+        col=collection.get_collection_instance("client",paged_api)
+        pages = col.iter_pages(read_ahead=1)
+        pages.next()
+        pages.next()
+        time.sleep(0.2)
+        # current page, one buffered page, one page waiting to be buffered
+        self.assertTrue(len(paged_api.requested) <= 4, paged_api.requested)
+        pages.close()
+    
+    def test_iter_items_read_ahead_raises(self):
+        paged_api = self.MockPagedApi(total_pages=4, fail_page=3)
+        col=collection.get_collection_instance("client",paged_api)
+        pages = col.iter_pages(read_ahead=2)
+        pages.next()
+        pages.next()
+        self.failUnlessRaises(SalesKingException, pages.next)
+
+
+class CollectionLoadAllTestCase(CollectionBaseTestCase):
+    
+    def test_load_all_keeps_page_order(self):
+        paged_api = self.MockPagedApi(total_pages=8, delay=0.02)
+        col=collection.get_collection_instance("client",paged_api)
+        col.load_all(concurrency=4)
+        self.assertEquals(len(col.items), 16)
+        self.assertEquals([item.number for item in col.items[::2]],
+                          [u"K-%s-0" % page for page in xrange(1, 9)])
+        self.assertEquals(sorted(col.page_latencies.keys()), range(1, 9))
+        self.assertTrue(paged_api.max_in_flight > 1)
+        self.assertTrue(paged_api.max_in_flight <= 4)
+        self.assertEquals(col.current_page, 8)
+    
+    def test_load_all_single_page(self):
+        paged_api = self.MockPagedApi(total_pages=1)
+        col=collection.get_collection_instance("client",paged_api)
+        col.load_all(concurrency=4)
+        self.assertEquals(len(col.items), 2)
+        self.assertEquals(paged_api.requested, [1])
+    
+    def test_load_all_sequential_and_failure(self):
+        paged_api = self.MockPagedApi(total_pages=3)
+        col=collection.get_collection_instance("client",paged_api)
+        col.load_all(concurrency=1)
+        self.assertEquals(paged_api.requested, [1, 2, 3])
+        paged_api = self.MockPagedApi(total_pages=5, fail_page=4)
+        col=collection.get_collection_instance("client",paged_api)
+        self.failUnlessRaises(SalesKingException, col.load_all, concurrency=3)
+    
+    def test_autoload_fetches_all_pages(self):
+        paged_api = self.MockPagedApi(total_pages=3)
+        col=collection.get_collection_instance("client",paged_api)
+        col.autoload = True
+        col.load()
+        self.assertEquals(paged_api.requested, [1, 2, 3])
+        self.assertEquals(len(col.items), 6)
+
+
+class PrefetchApiMock(object):
+    """
+    api stand-in for invoices, payment reminders and clients
+    """
+    base_url = u"https://sk.example/"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.paths = []
+
+    def request(self, url, method=u"GET", data=None, **kwargs):
+        parts = urlparse.urlparse(url)
+        query = dict((key, value[0]) for key, value in urlparse.parse_qs(parts.query).items())
+        with self.lock:
+            self.paths.append((parts.path, query.get('filter[ids]')))
+        if parts.path == u"/api/invoices":
+            ids = query['filter[ids]'].split(u",") if 'filter[ids]' in query else \
+                [u"i%s" % x for x in xrange(6)]
+            return page_response("invoices", [{"id": id, "client_id": u"c%s" % (int(id[1:]) % 2)}
+                                              for id in ids])
+        if parts.path == u"/api/payment_reminders":
+            return page_response("payment_reminders", [{"id": u"p%s" % x, "invoice_id": u"i%s" % (x % 3)}
+                                                       for x in xrange(6)])
+        return resource_response("client", {"id": parts.path.split(u"/")[-1], "organisation": u"org"})
+
+
+class CollectionPrefetchTestCase(SalesKingBaseTestCase):
+
+    def setUp(self):
+        self.api_mock = PrefetchApiMock()
+
+    def test_prefetch_with_ids_filter(self):
+        col = collection.get_collection_instance("payment_reminder", self.api_mock)
+        self.assertTrue(col.prefetch_related(u"invoice") is col)
+        col.load()
+        self.assertEquals(self.api_mock.paths, [(u"/api/payment_reminders", None),
+                                                (u"/api/invoices", u"i0,i1,i2")])
+        invoice = col.items[4].get_reference(u"invoice")
+        self.assertTrue(invoice.loaded)
+        self.assertEquals(invoice.id, u"i1")
+        self.assertEquals(len(self.api_mock.paths), 2)
+
+    def test_prefetch_loads_distinct_ids(self):
+        col = collection.get_collection_instance("invoice", self.api_mock)
+        col.prefetch_related(u"client")
+        col.load_all()
+        self.assertEquals(sorted(self.api_mock.paths[1:]), [(u"/api/clients/c0", None),
+                                                            (u"/api/clients/c1", None)])
+        self.assertEquals([item.get_reference(u"client").id for item in col.items],
+                          [u"c0", u"c1"] * 3)
+        self.assertEquals(len(self.api_mock.paths), 3)
+
+    def test_prefetch_batches(self):
+        col = collection.get_collection_instance("payment_reminder", self.api_mock)
+        col.prefetch_related(u"invoice")
+        self.assertEquals(col._get_prefetch_batches(u"invoice", [u"i%s" % x for x in xrange(250)]),
+                          [[u"i%s" % x for x in xrange(y, min(y + 100, 250))] for y in (0, 100, 200)])
+        self.assertEquals(collection.get_collection_instance("invoice", self.api_mock)
+                          ._get_prefetch_batches(u"client", [u"c1"]), None)
+
+    def test_prefetch_invalid(self):
+        col = collection.get_collection_instance("invoice", self.api_mock)
+        self.failUnlessRaises(APIException, col.prefetch_related, u"notexisting")
+        col = collection.get_collection_instance("invoice", self.api_mock, readonly=True)
+        self.failUnlessRaises(APIException, col.prefetch_related, u"client")
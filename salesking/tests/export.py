@@ -0,0 +1,71 @@
+import os
+import csv
+import shutil
+import tempfile
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from salesking.tests.base import SalesKingBaseTestCase
+from salesking.tests.mirror import make_invoice
+from salesking.tests.sync import MockSortedApi
+from salesking import export, collection, records
+
+
+class ExportTestCase(SalesKingBaseTestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.invoices = [make_invoice(x) for x in xrange(5)]
+        self.invoices[1]["title"] = u"Gl\u00fcck, \"quoted\""
+        self.invoices[2]["line_items"] = []
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read_csv(self, name):
+        with open(os.path.join(self.dir, name), "rb") as f:
+            return list(csv.DictReader(f))
+
+    def test_csv_with_child_files(self):
+        writer = export.CsvWriter("invoice", os.path.join(self.dir, "invoices.csv"), batch_size=2)
+        self.assertEquals(export.export(self.invoices, writer), 5)
+        rows = self.read_csv("invoices.csv")
+        self.assertEquals([row["number"] for row in rows], [u"R-%03d" % x for x in xrange(5)])
+        self.assertEquals(rows[1]["title"].decode("utf-8"), u"Gl\u00fcck, \"quoted\"")
+        self.assertEquals(rows[0]["notes_before"], "")
+        self.assertEquals(json.loads(rows[0]["client"]), {"id": u"c0", "organisation": u"org"})
+        self.assertFalse("line_items" in rows[0])
+        items = self.read_csv("invoices_line_items.csv")
+        self.assertEquals(len(items), 8)
+        self.assertEquals((items[0]["_parent_id"], items[0]["_index"], items[0]["name"]), ("i0", "0", "item 0"))
+        self.assertEquals(items[0]["use_product"], "true")
+        self.assertEquals(items[1]["quantity"], "1.5")
+        self.assertEquals(sorted(os.listdir(self.dir)), ["invoices.csv", "invoices_line_items.csv"])
+
+    def test_ndjson(self):
+        path = os.path.join(self.dir, "invoices.ndjson")
+        invoice = dict(self.invoices[0], unknown=1, notes_before=None)
+        export.export([invoice], export.NdjsonWriter("invoice", path))
+        with open(path, "rb") as f:
+            lines = f.read().split("\n")
+        self.assertEquals(lines[1:], [""])
+        data = json.loads(lines[0])
+        self.assertFalse("unknown" in data or "notes_before" in data)
+        self.assertEquals(data["line_items"], invoice["line_items"])
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "invoices_line_items.ndjson")))
+
+    def test_export_collection_and_records(self):
+        api_mock = MockSortedApi([{"id": u"c%s" % x, "organisation": u"org %s" % x,
+                                   "addresses": [{"city": u"Berlin"}]} for x in xrange(7)])
+        col = collection.get_collection_instance("client", api_mock)
+        col.per_page = 3
+        path = os.path.join(self.dir, "clients.csv")
+        self.assertEquals(export.export(col, export.CsvWriter("client", path)), 7)
+        self.assertEquals(api_mock.pages, [1, 2, 3])
+        self.assertEquals(len(self.read_csv("clients_addresses.csv")), 7)
+        record_cls = records.get_record_class("client")
+        export.export([record_cls.from_dict({"id": u"r1", "organisation": u"rec"})],
+                      export.CsvWriter("client", path))
+        self.assertEquals([row["organisation"] for row in self.read_csv("clients.csv")], ["rec"])
@@ -0,0 +1,95 @@
+import unittest
+
+from salesking.tests.base import SalesKingBaseTestCase
+from salesking.tests.mirror import make_invoice
+from salesking.tests.sync import MockSortedApi
+from salesking import frame, collection
+
+
+class FrameTestCase(SalesKingBaseTestCase):
+
+    def setUp(self):
+        self.invoices = [make_invoice(x, net_total=10.0 * x, status=u"open" if x % 2 else u"closed",
+                                      date=u"2013-%02d-01" % (x % 2 + 1)) for x in xrange(6)]
+        self.invoices[0]["net_total"] = None
+        self.invoices[1]["currency"] = u"USD"
+        self.frame = frame.Frame.from_items("invoice", self.invoices,
+                                            columns=("id", "client_id", "status", "month",
+                                                     "net_total", "lock_version", "currency"))
+
+    def test_typed_columns(self):
+        self.assertEquals(len(self.frame), 6)
+        self.assertEquals(self.frame.kinds["net_total"], u"number")
+        self.assertEquals(self.frame.kinds["lock_version"], u"integer")
+        self.assertEquals(self.frame.kinds["currency"], u"string")
+        self.assertEquals(list(self.frame["net_total"]), [0.0, 10.0, 20.0, 30.0, 40.0, 50.0])
+        self.assertEquals(self.frame["month"], [u"2013-01", u"2013-02"] * 3)
+        self.assertEquals(self.frame["currency"][:2], [None, u"USD"])
+        self.assertEquals(self.frame.sum("net_total"), 150.0)
+
+    def test_group_by(self):
+        by_month = self.frame.group_by("month", ("net_total",))
+        self.assertEquals(by_month, {u"2013-01": {"net_total": 60.0, "count": 3},
+                                     u"2013-02": {"net_total": 90.0, "count": 3}})
+        by_client = self.frame.group_by(("client_id", "status"), ("net_total", "lock_version"))
+        self.assertEquals(by_client[(u"c1", u"open")], {"net_total": 10.0, "lock_version": 0, "count": 1})
+        self.assertEquals(len(by_client), 6)
+        self.assertEquals(sorted(by_client.keys())[0], (u"c0", u"closed"))
+        self.assertEquals(frame.Frame.from_items("invoice", []).group_by("status", ("net_total",)), {})
+
+    def test_line_items(self):
+        items = frame.Frame.from_items("invoice", self.invoices, child="line_items",
+                                       parent_columns=("month", "client_id"))
+        self.assertEquals(len(items), 12)
+        self.assertEquals(items["_parent_id"][:3], [u"i0", u"i0", u"i1"])
+        self.assertEquals(items.kinds["quantity"], u"number")
+        totals = items.group_by(("month", "client_id"), ("quantity",))
+        self.assertEquals(totals[(u"2013-02", u"c1")], {"quantity": 3.0, "count": 2})
+
+    def test_without_numpy(self):
+        numpy, frame.numpy = frame.numpy, None
+        try:
+            invoices = frame.Frame.from_items("invoice", self.invoices, columns=("status", "net_total"))
+            self.assertEquals(invoices["net_total"].typecode, 'd')
+            self.assertEquals(invoices.group_by("status", ("net_total",))[u"open"],
+                              {"net_total": 90.0, "count": 3})
+        finally:
+            frame.numpy = numpy
+
+    @unittest.skipIf(frame.numpy is None, "numpy is not installed")
+    def test_numpy_matches_loop(self):
+        self.invoices[2]["status"] = None
+        keys = [("month",), ("client_id", "status"), ("status", "lock_version", "month")]
+        values = ("net_total", "lock_version")
+        columns = ("client_id", "status", "month", "net_total", "lock_version")
+        with_numpy = frame.Frame.from_items("invoice", self.invoices, columns=columns)
+        self.assertTrue(isinstance(with_numpy["net_total"], frame.numpy.ndarray))
+        numpy, frame.numpy = frame.numpy, None
+        try:
+            without_numpy = frame.Frame.from_items("invoice", self.invoices, columns=columns)
+            expected = [without_numpy.group_by(key if len(key) > 1 else key[0], values) for key in keys]
+        finally:
+            frame.numpy = numpy
+        for key, groups in zip(keys, expected):
+            result = with_numpy.group_by(key if len(key) > 1 else key[0], values)
+            self.assertEquals(result, groups)
+            for totals in result.values():
+                self.assertTrue(type(totals["lock_version"]) in (int, long))
+                self.assertTrue(type(totals["net_total"]) is float)
+        self.assertEquals(expected[1][(u"c2", None)], {"net_total": 20.0, "lock_version": 0, "count": 1})
+        # keys with too many combinations are grouped via lexsort
+        limit, frame.COMBINED_CODES_LIMIT = frame.COMBINED_CODES_LIMIT, 0
+        try:
+            self.assertEquals(with_numpy.group_by(keys[2], values), expected[2])
+        finally:
+            frame.COMBINED_CODES_LIMIT = limit
+
+    def test_from_collection(self):
+        api_mock = MockSortedApi([{"id": u"c%s" % x, "organisation": u"org", "lock_version": x}
+                                  for x in xrange(5)])
+        col = collection.get_collection_instance("client", api_mock)
+        col.per_page = 2
+        clients = frame.Frame.from_collection(col, columns=("organisation", "lock_version"))
+        self.assertEquals(clients.group_by("organisation", ("lock_version",)),
+                          {u"org": {"lock_version": 10, "count": 5}})
+        self.assertEquals(api_mock.pages, [1, 2, 3])
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import subprocess
+
+from salesking.tests.base import SalesKingBaseTestCase
+from salesking.conf import SK_ROOT
+
+# seconds the import of a module may take in a fresh process, generous
+# enough for slow machines, importing requests along would exceed them
+IMPORT_BUDGETS = {"salesking": 0.005, "salesking.resources": 0.15}
+# imported with the transport or the models only
+HEAVY_MODULES = ("requests", "oauth_hook", "warlock", "jsonschema", "validictory",
+                 "iso8601", "salesking.conf.settings", "salesking.conf.local_settings")
+# imported with the transport only
+TRANSPORT_MODULES = ("requests", "oauth_hook", "validictory",
+                     "salesking.conf.settings", "salesking.conf.local_settings")
+
+CHILD = '''
+import sys, time, json
+# the local settings are missing
+sys.modules["salesking.conf.local_settings"] = None
+start = time.time()
+import %(module)s
+elapsed = time.time() - start
+%(code)s
+print json.dumps({"elapsed": elapsed,
+                  "modules": [name for name in %(heavy)r if sys.modules.get(name) is not None]})
+'''
+
+
+def import_in_child(module, code=""):
+    """
+    imports module in a fresh interpreter
+    :param code: run after the import
+    :returns dict with the seconds of the import and the heavy modules loaded
+    """
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(SK_ROOT))
+    child = CHILD % {'module': module, 'code': code, 'heavy': HEAVY_MODULES}
+    return json.loads(subprocess.check_output([sys.executable, "-c", child], env=env))
+
+
+class ImportTestCase(SalesKingBaseTestCase):
+
+    def test_import_budget(self):
+        for module, budget in sorted(IMPORT_BUDGETS.items()):
+            # best of three, the first import may have to compile the package
+            elapsed = min(import_in_child(module)["elapsed"] for x in xrange(3))
+            self.assertTrue(elapsed < budget, "import %s took %.1fms" % (module, elapsed * 1000))
+
+    def test_models_import_no_transport(self):
+        for module in ("salesking.resources", "salesking.collection"):
+            loaded = import_in_child(module)["modules"]
+            self.assertEquals([name for name in TRANSPORT_MODULES if name in loaded], [],
+                              "import %s loads %s" % (module, loaded))
+
+    def test_schemas_without_settings(self):
+        result = import_in_child("salesking.utils.loaders", code='''
+compiled = salesking.utils.loaders.get_compiled_schema(u"invoice")
+assert compiled.filter_checkers[u"number"](u"R-1")
+assert not compiled.filter_checkers[u"from"](u"2012-13-01")
+''')
+        self.assertEquals(result["modules"], [])
+
+    def test_records_to_models_without_transport(self):
+        result = import_in_child("salesking.records", code='''
+from mock import Mock
+salesking.records.get_record_class(u"client").from_dict({}).to_model(Mock())
+''')
+        self.assertEquals(result["modules"], ["warlock", "jsonschema"])
@@ -0,0 +1,115 @@
+from salesking.tests.base import SalesKingBaseTestCase
+from salesking.tests.sync import MockSortedApi
+from salesking import mirror, sync, collection
+from salesking.exceptions import SalesKingException
+
+
+def make_invoice(x, **kwargs):
+    invoice = {"id": u"i%s" % x, "number": u"R-%03d" % x, "client_id": u"c%s" % (x % 3),
+               "date": u"2013-01-%02d" % (x + 1), "lock_version": 0, "tag_list": u"",
+               "created_at": u"2013-01-%02dT10:00:00+01:00" % (x + 1),
+               "updated_at": u"2013-01-%02dT10:00:00+01:00" % (x + 1),
+               "line_items": [{"id": u"l%s-%s" % (x, y), "name": u"item %s" % y,
+                               "position": y, "quantity": 1.5, "use_product": y == 0}
+                              for y in xrange(2)],
+               "client": {"id": u"c%s" % (x % 3), "organisation": u"org"}}
+    invoice.update(kwargs)
+    return invoice
+
+
+class MirrorTestCase(SalesKingBaseTestCase):
+
+    def setUp(self):
+        self.mirror = mirror.Mirror()
+        invoices = [make_invoice(x) for x in xrange(10)]
+        invoices[1]["tag_list"] = u"vip, paid"
+        invoices[2]["tag_list"] = u"paid"
+        invoices[3]["title"] = u"Consulting January"
+        self.mirror.upsert("invoice", invoices)
+
+    def tearDown(self):
+        self.mirror.close()
+
+    def test_tables_from_schema(self):
+        spec = self.mirror.get_spec("invoice")
+        self.assertEquals(spec.kinds["number"], u"string")
+        self.assertEquals(spec.kinds["created_at"], u"date-time")
+        self.assertEquals(spec.kinds["price_total"], u"number")
+        self.assertEquals(spec.kinds["client"], u"json")
+        self.assertEquals(spec.children.keys(), [u"line_items"])
+        self.assertEquals(spec.children["line_items"].name, u"invoice_line_items")
+        self.assertFalse("_destroy" in spec.children["line_items"].kinds)
+        indexes = [row[0] for row in self.mirror.connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'invoice'")]
+        self.assertTrue(u"ix_invoice_number" in indexes)
+        self.assertTrue(u"ix_invoice_client_id" in indexes)
+
+    def test_get_with_children(self):
+        invoice = self.mirror.get("invoice", u"i4")
+        self.assertEquals(invoice["number"], u"R-004")
+        self.assertEquals(invoice["created_at"], u"2013-01-05T09:00:00Z")
+        self.assertEquals(invoice["client"], {"id": u"c1", "organisation": u"org"})
+        self.assertEquals([item["name"] for item in invoice["line_items"]], [u"item 0", u"item 1"])
+        self.assertEquals(invoice["line_items"][0]["use_product"], True)
+        self.assertEquals(self.mirror.get("invoice", u"missing"), None)
+
+    def test_upsert_replaces_children(self):
+        self.mirror.upsert("invoice", [make_invoice(4, number=u"R-NEW", line_items=[])])
+        invoice = self.mirror.get("invoice", u"i4")
+        self.assertEquals(invoice["number"], u"R-NEW")
+        self.assertEquals(invoice["line_items"], [])
+        self.assertEquals(self.mirror.count("invoice"), 10)
+
+    def test_query_filters(self):
+        ids = lambda filters: [r["id"] for r in self.mirror.query("invoice", filters, sort_by="number")]
+        self.assertEquals(ids({"number": u"R-005"}), [u"i5"])
+        self.assertEquals(ids({"client_ids": u"c1,c2", "from": u"2013-01-06"}), [u"i5", u"i7", u"i8"])
+        self.assertEquals(ids({"to": u"2013-01-02"}), [u"i0", u"i1"])
+        self.assertEquals(ids({"tags": u"paid"}), [u"i1", u"i2"])
+        self.assertEquals(ids({"tags": u"paid,vip"}), [u"i1"])
+        self.assertEquals(ids({"q": u"consulting"}), [u"i3"])
+        self.assertEquals(ids({"ids": u"i9, i0"}), [u"i0", u"i9"])
+        self.assertEquals(self.mirror.count("invoice", {"client_ids": u"c0"}), 4)
+        self.assertEquals(len(self.mirror.query("invoice", limit=3, offset=8)), 2)
+
+    def test_query_date_time_filters_in_utc(self):
+        m = self.mirror
+        m.upsert("client", [{"id": u"c1", "organisation": u"a", "created_at": u"2013-01-01T00:30:00+01:00"},
+                            {"id": u"c2", "organisation": u"b", "created_at": u"2013-01-01T00:30:00+00:00"}])
+        found = m.query("client", {"created_at_from": u"2013-01-01T00:00:00+00:00"})
+        self.assertEquals([r["id"] for r in found], [u"c2"])
+        found = m.query("client", {"created_at_to": u"2012-12-31"})
+        self.assertEquals([r["id"] for r in found], [u"c1"])
+        found = m.query("client", {"created_at_from": u"2013-01-01", "created_at_to": u"2013-01-01"})
+        self.assertEquals([r["id"] for r in found], [u"c2"])
+
+    def test_query_like_filters_escaped(self):
+        self.mirror.upsert("invoice", [make_invoice(10, title=u"100% done", tag_list=u"a_b"),
+                                       make_invoice(11, title=u"1000 done", tag_list=u"axb")])
+        ids = lambda filters: [r["id"] for r in self.mirror.query("invoice", filters, sort_by="number")]
+        self.assertEquals(ids({"q": u"0% d"}), [u"i10"])
+        self.assertEquals(ids({"q": u"%"}), [u"i10"])
+        self.assertEquals(ids({"tags": u"a_b"}), [u"i10"])
+
+    def test_invalid_filters(self):
+        self.failUnlessRaises(SalesKingException, self.mirror.query, "invoice", {"notexisting": u"x"})
+        self.failUnlessRaises(SalesKingException, self.mirror.query, "invoice", {"from": u"string"})
+        self.failUnlessRaises(SalesKingException, self.mirror.query, "invoice", {"creator_ids": u"u1"})
+        self.failUnlessRaises(SalesKingException, self.mirror.query, "invoice", sort_by="notexisting")
+        # payments have no column the q filter could search
+        self.failUnlessRaises(SalesKingException, self.mirror.query, "payment", {"q": u"x"})
+
+    def test_load_collection_and_sync_target(self):
+        api_mock = MockSortedApi([{"id": u"c%s" % x, "organisation": u"org %s" % x, "lock_version": 0,
+                                   "updated_at": u"2013-01-%02dT10:00:00+01:00" % (x + 1),
+                                   "addresses": [{"city": u"Berlin", "order": 1}]}
+                                  for x in xrange(7)])
+        col = collection.get_collection_instance("client", api_mock)
+        col.per_page = 3
+        self.assertEquals(self.mirror.load(col), 7)
+        self.assertEquals(api_mock.pages, [1, 2, 3])
+        self.assertEquals(self.mirror.get("client", u"c6")["addresses"], [{"city": u"Berlin", "order": 1}])
+        self.assertEquals(self.mirror.get_lock_versions("client", [u"c1", u"x"]), {u"c1": 0})
+        api_mock.clients[0]["lock_version"] = 1
+        result = sync.SyncEngine(self.mirror, api_client=api_mock).sync("client")
+        self.assertEquals((result.inserted, result.updated, result.skipped), (0, 1, 6))
@@ -0,0 +1,90 @@
+from salesking.tests.base import SalesKingBaseTestCase
+from salesking.tests.collection import CollectionBaseTestCase
+from salesking.tests.resources import ResourceBaseTestCase
+from salesking import records, resources, collection
+from salesking.utils.cache import ObjectCache
+from mock import Mock
+
+
+class RecordTestCase(SalesKingBaseTestCase):
+
+    def setUp(self):
+        self.cls = records.get_record_class("client")
+        self.record = self.cls.from_dict({"id": u"c1", "organisation": u"salesking",
+                                          "addresses": [{"city": u"Berlin"}], "unknown": 1})
+
+    def test_record_class_per_type(self):
+        self.assertTrue(self.cls is records.get_record_class("client"))
+        self.assertEquals(self.cls.__name__, "ClientRecord")
+        self.assertEquals(records.get_record_class("line_item").__name__, "LineItemRecord")
+        self.assertEquals(self.cls.resource_type, "client")
+
+    def test_access(self):
+        self.assertEquals(self.record.organisation, u"salesking")
+        self.assertEquals(self.record["organisation"], u"salesking")
+        self.assertEquals(self.record.last_name, None)
+        self.assertEquals(self.record.get("last_name", u"-"), u"-")
+        self.assertEquals(self.record.get("unknown"), None)
+        self.assertEquals(self.record.addresses[0]["city"], u"Berlin")
+        self.failUnlessRaises(KeyError, self.record.__getitem__, "unknown")
+        self.failUnlessRaises(AttributeError, getattr, self.record, "unknown")
+
+    def test_read_only(self):
+        self.failUnlessRaises(AttributeError, setattr, self.record, "organisation", u"x")
+        self.failUnlessRaises(AttributeError, setattr, self.record, "unknown", u"x")
+
+    def test_as_dict_and_to_model(self):
+        self.assertEquals(self.record.as_dict(), {"id": u"c1", "organisation": u"salesking",
+                                                  "addresses": [{"city": u"Berlin"}]})
+        api_mock = Mock()
+        model = self.record.to_model(api_mock)
+        self.assertTrue(isinstance(model, resources.get_model_class("client", api=api_mock)))
+        self.assertEquals(model.organisation, u"salesking")
+        invalid = self.cls.from_dict({"organisation": 1})
+        self.failUnlessRaises(ValueError, invalid.to_model, api_mock)
+
+
+class ReadonlyCollectionTestCase(CollectionBaseTestCase):
+
+    def setUp(self):
+        self.api_mock = Mock()
+        self.api_mock.request.return_value = self.mock_response
+
+    def test_readonly_collection(self):
+        col = collection.get_collection_instance("client", self.api_mock, readonly=True)
+        col.load(page=1)
+        self.assertEquals(len(col.items), 5)
+        self.assertTrue(isinstance(col.items[0], records.get_record_class("client")))
+        self.assertEquals(col.items[0].number, u"K-2012-001")
+        self.assertEquals(col.items[3].organisation, u"Werbeagentur Gl\u00fcck")
+        self.assertEquals(col.items[0].gender, u"male")
+        self.assertEquals(col.items[0].notes, None)
+
+
+class ReadonlyLoadTestCase(ResourceBaseTestCase):
+
+    def setUp(self):
+        self.api_mock = Mock()
+        self.api_mock.base_url = u"https://sk.example/"
+        self.api_mock.request.side_effect = lambda *args, **kwargs: Mock(
+            status_code=200, content=self.MockResponse().content)
+        self.model = resources.get_model_class("client", api=self.api_mock)
+
+    def test_load_readonly(self):
+        record = self.model().load(self.MockResponse.mock_id, readonly=True)
+        self.assertTrue(isinstance(record, records.Record))
+        self.assertEquals(record.number, self.MockResponse.mock_number)
+        model = self.model().load(self.MockResponse.mock_id)
+        # properties unknown to the schema are not kept by records
+        self.assertEquals(model.currency, u"EUR")
+        self.assertEquals(dict(record.to_model(self.api_mock)),
+                          dict((key, value) for key, value in model.iteritems() if key != u"currency"))
+
+    def test_readonly_from_object_cache(self):
+        self.api_mock.object_cache = ObjectCache()
+        self.model().load(self.MockResponse.mock_id, readonly=True)
+        self.assertEquals(self.api_mock.object_cache.stats.sets, 0)
+        self.model().load(self.MockResponse.mock_id)
+        record = self.model().load(self.MockResponse.mock_id, readonly=True)
+        self.assertEquals(self.api_mock.request.call_count, 2)
+        self.assertEquals(record.first_name, self.MockResponse.mock_first_name)
@@ -1,5 +1,14 @@
+import json
+import time
+import threading
+
 from salesking.tests.base import SalesKingBaseTestCase
+from salesking.tests.server import page_response, resource_response
 from salesking import api, resources
+from salesking.utils import loaders
+from salesking.exceptions import APIException, BadRequest, ValidationError
+from salesking.utils.cache import ObjectCache, MemoryBackend
+from mock import Mock
 
 class ResourceBaseTestCase(SalesKingBaseTestCase):
 
@@ -124,6 +133,66 @@ class ResourceFactoryTestCase(ResourceBaseTestCase):
         msg = "data is: %s" % (client.get_data())
         self.assertTrue(client.get_data().find(u"Duisburg")>0,msg)
         
+
+    def test_model_class_cached_per_type_and_api(self):
+        clnt = api.APIClient()
+        model = resources.get_model_class("client", api=clnt)
+        self.assertTrue(model is resources.get_model_class("client", api=clnt))
+        self.assertTrue(model.__api__ is clnt)
+        other = resources.get_model_class("client", api=api.APIClient())
+        self.assertFalse(model is other)
+        self.assertFalse(model is resources.get_model_class("address", api=clnt))
+
+    def test_model_class_cache_is_bounded(self):
+        size = resources.MODEL_CLASS_CACHE_SIZE
+        resources.MODEL_CLASS_CACHE_SIZE = 2
+        try:
+            resources.clear_model_class_cache()
+            clnt = api.APIClient()
+            first = resources.get_model_class("client", api=clnt)
+            resources.get_model_class("address", api=clnt)
+            resources.get_model_class("product", api=clnt)
+            self.assertFalse(first is resources.get_model_class("client", api=clnt))
+        finally:
+            resources.MODEL_CLASS_CACHE_SIZE = size
+
+    def test_endpoint_table_shared_and_compiled(self):
+        base_url = u"https://sk.example/"
+        table = resources.get_endpoint_table("client", base_url)
+        self.assertTrue(table is resources.get_endpoint_table("client", base_url))
+        self.assertEquals(table['update'].method, u"PUT")
+        self.assertEquals(table['self'].method, u"GET")
+        self.assertEquals(table['update'].url(u"abc"), u"https://sk.example/api/clients/abc")
+        self.assertEquals(table['create'].url(), u"https://sk.example/api/clients")
+        self.assertEquals(table['schema'].url(), u"https://sk.example/api/clients/schema")
+        self.failUnlessRaises(APIException, table['self'].url)
+        self.failUnlessRaises(TypeError, table.__setitem__, 'self', None)
+
+    def test_do_api_call_urls_and_methods(self):
+        api_mock = Mock()
+        api_mock.base_url = u"https://sk.example/"
+        api_mock.request.return_value = Mock(status_code=204)
+        model = resources.get_model_class("client", api=api_mock)
+        client = model(self.valid_data)
+        client._do_api_call(call_type=u"schema")
+        self.assertEquals(api_mock.request.call_args[0], (u"https://sk.example/api/clients/schema", u"GET"))
+        client._do_api_call(call_type=u"delete", id=u"abc")
+        self.assertEquals(api_mock.request.call_args[0], (u"https://sk.example/api/clients/abc", u"DELETE"))
+        # the schema call must not change the shared create link
+        self.assertEquals(client.get_endpoint("create")['method'], u"POST")
+        self.failUnlessRaises(APIException, client._do_api_call, call_type=u"load")
+        self.failUnlessRaises(APIException, client.get_endpoint, "notexisting")
+
+    def test_payload_only_for_create_and_update(self):
+        api_mock = Mock()
+        api_mock.base_url = u"https://sk.example/"
+        client = resources.get_model_class("client", api=api_mock)(self.valid_data)
+        self.assertEquals(client._prepare_api_call(u"load", u"abc")[2], None)
+        self.assertEquals(client._prepare_api_call(u"delete", u"abc")[2], None)
+        self.assertEquals(client._prepare_api_call(u"schema")[2], None)
+        payload = client._prepare_api_call(u"create")[2]
+        self.assertEquals(json.loads(payload), {"client": self.valid_data})
+        self.assertEquals(client._prepare_api_call(u"update", u"abc")[2], payload)
          
 #    def test_client_resource_schema_get_success(self):
 #        clnt = api.APIClient()
@@ -133,3 +202,316 @@ class ResourceFactoryTestCase(ResourceBaseTestCase):
 #        msg ="body:%s" % (resp.content)
 #        self.assertEquals(resp.status_code, 200, msg)
         
+
+
+class BulkApiMock(object):
+    """
+    api stand-in echoing saved clients with an id, organisation fail is rejected
+    """
+    base_url = u"https://sk.example/"
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.methods = []
+
+    def request(self, url, method=u"get", data=None, **kwargs):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.methods.append(method)
+        try:
+            time.sleep(self.delay)
+            if method == u"DELETE":
+                return Mock(status_code=200)
+            client = json.loads(data)["client"]
+            if client["organisation"] == u"fail":
+                raise BadRequest("BAD_REQUEST", "Bad Request")
+            client.setdefault("id", u"id-%s" % client["organisation"])
+            return resource_response("client", client, status_code=201 if method == u"POST" else 200)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+class BulkTestCase(SalesKingBaseTestCase):
+
+    def setUp(self):
+        self.api_mock = BulkApiMock()
+        self.model = resources.get_model_class("client", api=self.api_mock)
+
+    def test_bulk_save_in_input_order(self):
+        clients = [self.model({"organisation": u"org %s" % x}) for x in xrange(12)]
+        clients.append(self.model({"organisation": u"org update", "id": u"existing"}))
+        result = resources.bulk_save(clients, concurrency=4)
+        self.assertTrue(result.ok)
+        self.assertEquals(len(result), 13)
+        self.assertEquals([c.id for c in result][:3], [u"id-org 0", u"id-org 1", u"id-org 2"])
+        self.assertEquals(result.results[-1].id, u"existing")
+        self.assertTrue(1 < self.api_mock.max_in_flight <= 4)
+        self.assertEquals(self.api_mock.methods.count(u"PUT"), 1)
+
+    def test_bulk_save_collects_errors(self):
+        clients = [self.model({"organisation": name}) for name in (u"a", u"fail", u"b")]
+        result = resources.bulk_save(clients, concurrency=2)
+        self.assertFalse(result.ok)
+        self.assertEquals(result.results[0].id, u"id-a")
+        self.assertEquals(result.results[1], None)
+        self.assertEquals(result.results[2].id, u"id-b")
+        failed = result.failed()
+        self.assertEquals(len(failed), 1)
+        self.assertEquals(failed[0][0], 1)
+        self.assertTrue(isinstance(failed[0][2], BadRequest))
+
+    def test_bulk_delete(self):
+        clients = [self.model({"organisation": u"x", "id": u"id-%s" % x}) for x in xrange(3)]
+        clients.append(self.model({"organisation": u"no id"}))
+        result = resources.bulk_delete(clients, concurrency=1)
+        self.assertEquals([r.status_code for r in result.results[:3]], [200, 200, 200])
+        self.assertTrue(isinstance(result.errors[3], APIException))
+        self.assertEquals(self.api_mock.methods, [u"DELETE"] * 3)
+
+
+class ObjectCacheTestCase(ResourceBaseTestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.cache = ObjectCache(MemoryBackend(clock=lambda: self.now), ttl=10, ttls={"client": 60})
+        self.api_mock = Mock()
+        self.api_mock.base_url = u"https://sk.example/"
+        self.api_mock.object_cache = self.cache
+        self.api_mock.request.side_effect = self.request
+        self.model = resources.get_model_class("client", api=self.api_mock)
+        self.client_id = self.MockResponse.mock_id
+
+    def request(self, url, method, data=None):
+        if method == u"GET":
+            return Mock(status_code=200, content=self.MockResponse().content)
+        if method == u"PUT":
+            return Mock(status_code=200, content=data)
+        return Mock(status_code=200)
+
+    def test_load_read_through(self):
+        first = self.model().load(self.client_id)
+        second = self.model().load(self.client_id)
+        self.assertEquals(self.api_mock.request.call_count, 1)
+        self.assertEquals(second, first)
+        self.assertTrue(second is not first)
+        self.assertEquals(self.cache.stats.as_dict(),
+                          {"hits": 1, "misses": 1, "sets": 1, "invalidations": 0})
+        second.first_name = u"changed"
+        self.assertEquals(self.model().load(self.client_id).first_name, u"Dow")
+
+    def test_ttl_per_type(self):
+        self.model().load(self.client_id)
+        self.now += 30
+        self.model().load(self.client_id)
+        self.assertEquals(self.api_mock.request.call_count, 1)
+        self.now += 31
+        self.model().load(self.client_id)
+        self.assertEquals(self.api_mock.request.call_count, 2)
+
+    def test_save_refreshes_and_delete_invalidates(self):
+        obj = self.model().load(self.client_id)
+        obj.first_name = u"Updated"
+        obj.save()
+        self.assertEquals(self.model().load(self.client_id).first_name, u"Updated")
+        self.assertEquals(self.api_mock.request.call_count, 2)
+        obj.delete()
+        self.model().load(self.client_id)
+        self.assertEquals(self.api_mock.request.call_count, 4)
+        self.assertEquals(self.cache.stats.invalidations, 1)
+
+    def test_bounded_backend(self):
+        backend = MemoryBackend(maxsize=2)
+        for x in xrange(3):
+            backend.set(u"client:%s" % x, {"id": x})
+        self.assertEquals(len(backend), 2)
+        self.assertEquals(backend.get(u"client:0"), None)
+        self.assertEquals(backend.get(u"client:2"), {"id": 2})
+
+    def test_apis_without_cache(self):
+        api_mock = Mock()
+        api_mock.base_url = u"https://sk.example/"
+        api_mock.request.side_effect = self.request
+        model = resources.get_model_class("client", api=api_mock)
+        model().load(self.client_id)
+        model().load(self.client_id)
+        self.assertEquals(api_mock.request.call_count, 2)
+
+
+class DeferredValidationTestCase(ResourceBaseTestCase):
+
+    def setUp(self):
+        self.api_mock = Mock()
+        self.api_mock.base_url = u"https://sk.example/"
+        self.api_mock.request.return_value = Mock(status_code=201, content=self.MockResponse().content)
+        self.model = resources.get_model_class("client", api=self.api_mock)
+
+    def test_assignments_not_validated(self):
+        client = self.model({"organisation": 1})
+        client.gender = u"none"
+        client.email = 5
+        self.assertEquals(client.changes, {"gender": u"none", "email": 5})
+        del client.email
+        self.assertFalse("email" in client)
+
+    def test_validate_reports_all_errors(self):
+        client = self.model(self.valid_data)
+        client.validate()
+        client.organisation = 1
+        client.gender = u"none"
+        try:
+            client.validate()
+            self.fail("no ValidationError")
+        except ValidationError, ex:
+            self.assertEquals(len(ex.errors), 2)
+            self.assertTrue(any(error.startswith(u"organisation:") for error in ex.errors))
+            self.assertTrue(any(error.startswith(u"gender:") for error in ex.errors))
+            self.assertTrue(isinstance(ex, ValueError))
+
+    def test_save_validates_before_request(self):
+        client = self.model(self.valid_data)
+        client.organisation = 1
+        self.failUnlessRaises(ValidationError, client.save)
+        self.assertFalse(self.api_mock.request.called)
+        client.organisation = u"salesking"
+        obj = client.save()
+        self.assertEquals(obj.number, self.MockResponse.mock_number)
+        self.assertEquals(self.api_mock.request.call_count, 1)
+
+    def test_eager_validation(self):
+        class EagerClient(self.model):
+            deferred_validation = False
+        self.failUnlessRaises(ValueError, EagerClient, {"organisation": 1})
+        client = EagerClient(self.valid_data)
+        self.failUnlessRaises(Exception, setattr, client, "organisation", 1)
+        self.assertEquals(client.organisation, u"salesking")
+
+    def test_responses_validated(self):
+        client = self.model()
+        response = Mock(status_code=200, content=json.dumps({"client": {"organisation": 1}}))
+        self.failUnlessRaises(ValidationError, client.get_object_from_response, response)
+
+    def test_responses_drop_nested_nulls(self):
+        invoice = resources.get_model_class("invoice", api=self.api_mock)()
+        response = Mock(status_code=200, content=json.dumps({"invoice": {
+            "id": u"i1", "notes_before": None, "client": {"id": u"c1", "notes": None},
+            "links": [{"rel": u"self", "href": u"invoices/i1"}]}}))
+        obj = invoice.get_object_from_response(response)
+        self.assertEquals(dict(obj), {"id": u"i1", "client": {"id": u"c1"}})
+
+    def test_validate_nested_objects(self):
+        invoice = resources.get_model_class("invoice", api=self.api_mock)(
+            {"title": u"x", "client": {"organisation": 1, "addresses": [{"city": u"Berlin"}]}})
+        try:
+            invoice.validate()
+            self.fail("no ValidationError")
+        except ValidationError, ex:
+            self.assertEquals(ex.errors, [u"client/organisation: 1 is not of type u'string'"])
+
+
+class MinimalUpdateTestCase(ResourceBaseTestCase):
+
+    def setUp(self):
+        self.api_mock = Mock()
+        self.api_mock.base_url = u"https://sk.example/"
+        self.api_mock.request.side_effect = lambda *args, **kwargs: Mock(
+            status_code=200, content=self.MockResponse().content)
+        self.model = resources.get_model_class("client", api=self.api_mock)
+        self.client = self.model().load(self.MockResponse.mock_id)
+        self.api_mock.request.reset_mock()
+
+    def sent(self):
+        return json.loads(self.api_mock.request.call_args[1]['data'])["client"]
+
+    def test_changed_properties(self):
+        self.assertEquals(self.client.get_changed_properties(), [])
+        self.client.first_name = u"honey"
+        self.client.addresses.append({"city": u"Hamburg"})
+        del self.client.email
+        self.assertEquals(self.client.get_changed_properties(), [u"addresses", u"email", u"first_name"])
+        self.assertEquals(sorted(self.model(self.valid_data).get_changed_properties()),
+                          sorted(self.valid_data.keys()))
+
+    def test_update_sends_changes_and_lock_version(self):
+        self.client.first_name = u"honey"
+        self.client.save()
+        self.assertEquals(self.api_mock.request.call_args[0][1], u"PUT")
+        self.assertEquals(self.sent(), {"first_name": u"honey", "lock_version": 0})
+
+    def test_unchanged_not_saved(self):
+        self.assertTrue(self.client.save() is self.client)
+        self.assertFalse(self.api_mock.request.called)
+        self.client.first_name = self.client.first_name
+        self.client.save()
+        self.assertFalse(self.api_mock.request.called)
+
+    def test_not_loaded_sends_everything(self):
+        client = self.model(dict(self.valid_data, id=u"abc"))
+        client.save()
+        self.assertEquals(self.sent(), dict(self.valid_data, id=u"abc"))
+
+
+class RelatedApiMock(object):
+    """
+    api stand-in serving the invoices of client c1 and clients by id
+    """
+    base_url = u"https://sk.example/"
+
+    def __init__(self):
+        self.urls = []
+
+    def request(self, url, method=u"GET", data=None, **kwargs):
+        self.urls.append(url)
+        path = url[len(self.base_url):].split(u"?")[0]
+        if path == u"api/clients/c1/invoices":
+            return page_response("invoices", [{"id": u"i%s" % x, "client_id": u"c1"} for x in xrange(2)])
+        return resource_response("client", {"id": path.split(u"/")[-1], "organisation": u"org"})
+
+
+class RelatedTestCase(SalesKingBaseTestCase):
+
+    def setUp(self):
+        self.api_mock = RelatedApiMock()
+        self.client = resources.build_model(resources.get_model_class("client", api=self.api_mock),
+                                            {"id": u"c1", "organisation": u"org"},
+                                            loaders.load_schema_raw("client"))
+
+    def test_related_collection(self):
+        # probing the attribute does not request anything
+        self.assertTrue(hasattr(self.client, u"invoices"))
+        invoices = self.client.invoices
+        self.assertEquals(self.api_mock.urls, [])
+        self.assertTrue(self.client.get_related(u"invoices") is invoices)
+        self.client.invoices.load_all()
+        self.assertEquals(self.api_mock.urls, [u"https://sk.example/api/clients/c1/invoices?sort=ASC&per_page=100&page=1"])
+        self.assertEquals([invoice.id for invoice in self.client.invoices.items], [u"i0", u"i1"])
+        self.assertEquals([invoice.id for invoice in self.client.invoices.iter_items()], [u"i0", u"i1"])
+        self.assertEquals(len(self.api_mock.urls), 2)
+        self.failUnlessRaises(APIException, self.client.get_related, u"update")
+        self.failUnlessRaises(AttributeError, getattr, self.client, u"notexisting")
+        # document.json nests schemes which don't exist
+        self.failUnlessRaises(APIException, self.client.get_related, u"documents")
+        self.failUnlessRaises(AttributeError, getattr, self.client, u"documents")
+
+    def test_reference_proxy(self):
+        invoices = self.client.invoices
+        invoices.load_all()
+        invoice = invoices.items[0]
+        proxy = invoice.client
+        self.assertTrue(isinstance(proxy, resources.ResourceProxy))
+        self.assertFalse(proxy.loaded)
+        self.assertEquals(len(self.api_mock.urls), 1)
+        self.assertEquals(proxy.organisation, u"org")
+        self.assertEquals(proxy["id"], u"c1")
+        self.assertEquals(self.api_mock.urls[-1], u"https://sk.example/api/clients/c1")
+        self.assertTrue(invoice.get_reference(u"client") is proxy)
+        invoice.client_id = u"c2"
+        self.assertEquals(invoice.client.id, u"c2")
+        invoice.client = {"id": u"c3"}
+        self.assertEquals(invoice.client, {"id": u"c3"})
+        del invoice.client_id
+        self.assertEquals(invoice.get_reference(u"client"), None)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    local stand-in for the SalesKing api
+
+    >>> server = StandInServer(responder)
+    >>> server.start()
+    >>> server.base_url
+    'http://127.0.0.1:54321/'
+    >>> server.stop()
+
+    responder(method, path, headers, body) returns (status, headers, body)
+
+    page_content and page_response build the collection pages for the
+    server and the api client stand-ins of the tests
+"""
+import threading
+import BaseHTTPServer
+import SocketServer
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from mock import Mock
+
+
+def page_content(key, items, page=1, per_page=100, total_entries=None, total_pages=None):
+    """
+    json body of a collection page
+    :param key: plural name of the resource type, e.g. clients
+    :param items: property dicts of the page, wrapped with the singular name
+    :param total_entries: defaults to the items of a single page
+    :param total_pages: defaults to the pages of total_entries
+    """
+    if total_entries is None:
+        total_entries = len(items)
+    if total_pages is None:
+        total_pages = max(1, (total_entries + per_page - 1) // per_page)
+    return json.dumps({key: [{key[:-1]: item} for item in items],
+                       "collection": {"current_page": page, "per_page": per_page,
+                                      "total_entries": total_entries, "total_pages": total_pages}})
+
+def page_response(key, items, **kwargs):
+    """
+    response of a collection page as returned by APIClient.request
+    :param kwargs: see page_content
+    """
+    return Mock(status_code=200, content=page_content(key, items, **kwargs))
+
+def resource_response(key, obj, status_code=200):
+    """
+    response of a single resource as returned by APIClient.request
+    """
+    return Mock(status_code=status_code, content=json.dumps({key: obj}))
+
+
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, client_address):
+        # clients giving up early (timeouts) are expected
+        pass
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _handle(self):
+        length = int(self.headers.get('content-length') or 0)
+        body = self.rfile.read(length) if length else ""
+        server = self.server.stand_in
+        with server.lock:
+            server.requests.append((self.command, self.path, dict(self.headers), body))
+            server.connections.add(self.client_address)
+        status, headers, content = server.responder(self.command, self.path, self.headers, body)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(object):
+    """
+    threaded keep-alive http server on a free local port
+    requests keeps (method, path, headers, body) of every request,
+    connections the client addresses seen
+    """
+    def __init__(self, responder):
+        self.responder = responder
+        self.requests = []
+        self.connections = set()
+        self.lock = threading.Lock()
+        self._server = _ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.stand_in = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return u"http://127.0.0.1:%s/" % self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,))
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import urlparse
+
+from salesking.tests.base import SalesKingBaseTestCase
+from salesking.tests.server import page_response
+from salesking import sync
+
+
+class MockSortedApi(object):
+    """
+    api stand-in paging clients sorted by sort_by
+    """
+    base_url = u"https://sk.example/"
+
+    def __init__(self, clients):
+        self.clients = clients
+        self.pages = []
+
+    def request(self, url, *args, **kwargs):
+        query = dict((key, value[0]) for key, value in
+                     urlparse.parse_qs(urlparse.urlparse(url).query).items())
+        page = int(query.get('page', 1))
+        per_page = int(query['per_page'])
+        self.pages.append(page)
+        clients = list(self.clients)
+        if query.get('sort_by'):
+            clients.sort(key=lambda c: c[query['sort_by']], reverse=query.get('sort') == u"DESC")
+        return page_response("clients", clients[(page - 1) * per_page:page * per_page],
+                             page=page, per_page=per_page, total_entries=len(clients))
+
+
+def make_client(x, updated_at, lock_version=0):
+    return {"id": u"c%s" % x, "organisation": u"org %s" % x, "lock_version": lock_version,
+            "updated_at": updated_at, "created_at": u"2013-01-01T10:00:00+01:00"}
+
+
+class SyncEngineTestCase(SalesKingBaseTestCase):
+
+    def setUp(self):
+        self.api_mock = MockSortedApi([make_client(x, u"2013-01-%02dT10:00:00+01:00" % (x + 1))
+                                       for x in xrange(10)])
+        self.target = sync.MemoryTarget()
+        self.engine = sync.SyncEngine(self.target, api_client=self.api_mock, per_page=3)
+
+    def test_first_run_inserts_all(self):
+        result = self.engine.sync("client")
+        self.assertEquals((result.inserted, result.updated, result.skipped), (10, 0, 0))
+        self.assertEquals(result.pages, 4)
+        self.assertFalse(result.incremental)
+        self.assertEquals(len(self.target.items["client"]), 10)
+        self.assertEquals(self.engine.checkpoints.get("client"), u"2013-01-10T10:00:00+01:00")
+
+    def test_delta_fetches_changed_records_only(self):
+        self.engine.sync("client")
+        self.api_mock.pages = []
+        self.api_mock.clients[2] = dict(self.api_mock.clients[2], organisation=u"changed",
+                                        updated_at=u"2013-02-01T10:00:00+01:00", lock_version=1)
+        self.api_mock.clients.append(make_client(10, u"2013-02-01T11:00:00+01:00"))
+        result = self.engine.sync("client")
+        self.assertTrue(result.incremental)
+        # page 2 starts with the first record older than the checkpoint
+        self.assertEquals(self.api_mock.pages, [1, 2])
+        # the record of the checkpoint itself comes again with an unchanged lock_version
+        self.assertEquals((result.inserted, result.updated, result.skipped), (1, 1, 1))
+        self.assertEquals(self.target.items["client"][u"c2"].organisation, u"changed")
+        self.assertEquals(self.engine.checkpoints.get("client"), u"2013-02-01T11:00:00+01:00")
+
+    def test_no_changes(self):
+        self.engine.sync("client")
+        result = self.engine.sync("client")
+        self.assertEquals((result.inserted, result.updated, result.skipped), (0, 0, 1))
+        self.assertEquals(result.pages, 1)
+
+    def test_full_scan_skips_unchanged_lock_versions(self):
+        self.engine.sync("client")
+        self.api_mock.clients[0] = dict(self.api_mock.clients[0], lock_version=3)
+        hydrated = []
+        upsert = self.target.upsert
+        self.target.upsert = lambda resource_type, items: (hydrated.extend(items),
+                                                           upsert(resource_type, items))
+        result = self.engine.sync("client", full=True)
+        self.assertEquals((result.inserted, result.updated, result.skipped), (0, 1, 9))
+        self.assertEquals([item.id for item in hydrated], [u"c0"])
+
+    def test_json_checkpoint_store(self):
+        path = tempfile.mkdtemp()
+        try:
+            store = sync.JsonCheckpointStore(os.path.join(path, "checkpoints.json"))
+            self.assertEquals(store.get("client"), None)
+            store.set("client", u"2013-01-01T10:00:00+01:00")
+            store.set("invoice", u"2013-01-02T10:00:00+01:00")
+            store = sync.JsonCheckpointStore(os.path.join(path, "checkpoints.json"))
+            self.assertEquals(store.get("client"), u"2013-01-01T10:00:00+01:00")
+            self.assertEquals(store.get("invoice"), u"2013-01-02T10:00:00+01:00")
+        finally:
+            shutil.rmtree(path)
@@ -1,7 +1,15 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from salesking.utils import loaders, helpers, validators 
+import os
+import imp
+import copy
+import json
+import shutil
+import logging
+import tempfile
+
+from salesking.utils import loaders, helpers, validators, retry, serializers, codegen
 from salesking.tests.base import SalesKingBaseTestCase
 from salesking.exceptions import SalesKingException
 
@@ -24,9 +32,211 @@ class SKUtilsTestCase(SalesKingBaseTestCase):
     def test_pluralize(self):
         self.assertEquals("clients", helpers.pluralize("client"));
         self.assertEquals("companies", helpers.pluralize("company"));
+        self.assertEquals("company", helpers.singularize("companies"))
+        self.assertEquals("payment_reminder", helpers.singularize("payment_reminders"))
         
     def test_json_schema_validation_datetime_pass(self):
         schema = {u'format': u'date-time'}
         self.assertEquals(None, validators.json_schema_validation_format(u"2012-12-19T00:39:49+01:00", schema));
         self.assertEquals(None, validators.json_schema_validation_format(u"2012-12-19T00:39:49", schema));
 
+    def test_json_schema_validation_keeps_global_format_validators(self):
+        from validictory.validator import DEFAULT_FORMAT_VALIDATORS
+        before = DEFAULT_FORMAT_VALIDATORS['date-time']
+        validators.json_schema_validation_format(u"2012-12-19T00:39:49+01:00", {u'format': u'date-time'})
+        self.assertTrue(DEFAULT_FORMAT_VALIDATORS['date-time'] is before)
+
+    def test_compile_filter_checker(self):
+        check = validators.compile_filter_checker({u"type": u"string", u"format": u"date-time"})
+        self.assertTrue(check(u"2012-12-19T00:39:49+01:00"))
+        self.assertFalse(check(u"2012"))
+        self.assertFalse(check(12))
+        check = validators.compile_filter_checker({u"type": u"number"})
+        self.assertTrue(check(12))
+        self.assertTrue(check(1.5))
+        self.assertFalse(check(True))
+        check = validators.compile_filter_checker({u"type": u"date"})
+        self.assertTrue(check(u"2012-01-01"))
+        self.assertFalse(check(u"2012-01-32"))
+        check = validators.compile_filter_checker({u"title": u"untyped"})
+        self.assertTrue(check(u"anything"))
+
+    def test_schema_registry_returns_shared_schema(self):
+        first = loaders.load_schema_raw(u"invoice")
+        second = loaders.load_schema_raw(u"invoice")
+        self.assertTrue(first is second)
+        self.assertEquals(first['title'], u"invoice")
+        # resolved nested line items
+        self.assertTrue('quantity' in first['properties']['line_items']['properties'])
+
+    def test_schema_registry_is_read_only(self):
+        schema = loaders.load_schema_raw(u"client")
+        self.failUnlessRaises(TypeError, schema.__setitem__, 'title', u"foo")
+        self.failUnlessRaises(TypeError, schema['links'].append, {})
+        self.failUnlessRaises(TypeError, schema['links'][0].__setitem__, 'method', u"GET")
+        # copy on write
+        copied = copy.deepcopy(schema)
+        copied['links'][0]['method'] = u"GET"
+        self.assertEquals(type(copied), dict)
+        self.assertFalse('method' in schema['links'][0])
+
+    def test_schema_registry_derived_tables(self):
+        compiled = loaders.get_compiled_schema(u"invoice")
+        self.assertEquals(compiled.links['update']['method'], u"PUT")
+        self.assertEquals(compiled.filters['from']['format'], u"date")
+        self.assertFalse('page' in compiled.filters)
+        self.assertEquals(compiled.nested['line_items'], u"line_item")
+        self.assertEquals(compiled.nested['client'], u"client")
+        self.assertEquals(compiled.relations['payment_reminders'], u"payment_reminder")
+        self.assertFalse('print' in compiled.relations)
+        self.assertEquals(dict(compiled.references), {u"client": u"client"})
+        # document.json nests line_items.json, which doesn't exist
+        self.assertFalse(loaders.schema_resolves(u"document"))
+        self.assertTrue(loaders.schema_resolves(u"invoice"))
+        self.assertFalse('documents' in loaders.get_compiled_schema(u"client").relations)
+
+    def test_schema_registry_reads_file_once(self):
+        loaders.clear_schema_registry()
+        calls = []
+        original = loaders.import_schema_to_json
+        def counting_import(name):
+            calls.append(name)
+            return original(name)
+        loaders.import_schema_to_json = counting_import
+        generated = loaders._generated
+        loaders._generated = None
+        try:
+            loaders.load_schema_raw(u"client")
+            first = list(calls)
+            for x in xrange(2):
+                loaders.load_schema_raw(u"client")
+        finally:
+            loaders.import_schema_to_json = original
+            loaders._generated = generated
+            loaders.clear_schema_registry()
+        self.assertEquals(calls, first)
+        # followed by the checks of the relation types
+        self.assertEquals(first[:2], [u"client", u"address"])
+
+    def test_parse_retry_after(self):
+        self.assertEquals(retry.parse_retry_after("5"), 5.0)
+        self.assertEquals(retry.parse_retry_after(None), None)
+        self.assertEquals(retry.parse_retry_after("soon"), None)
+        self.assertEquals(retry.parse_retry_after("Thu, 01 Jan 1970 00:00:10 GMT", now=4), 6.0)
+
+    def test_retry_policy(self):
+        class Response(object):
+            def __init__(self, status_code, headers=None):
+                self.status_code = status_code
+                self.headers = headers or {}
+        policy = retry.RetryPolicy(max_retries=3, backoff_factor=0.5, max_backoff=1.5, jitter=False)
+        self.assertEquals(policy.get_delay(u"get", 0, Response(503)), 0.5)
+        self.assertEquals(policy.get_delay(u"GET", 1, Response(502)), 1.0)
+        self.assertEquals(policy.get_delay(u"GET", 2), 1.5)
+        self.assertEquals(policy.get_delay(u"GET", 3, Response(503)), None)
+        self.assertEquals(policy.get_delay(u"POST", 0, Response(503)), None)
+        self.assertEquals(policy.get_delay(u"POST", 0), None)
+        self.assertEquals(policy.get_delay(u"GET", 0, Response(404)), None)
+        self.assertEquals(policy.get_delay(u"POST", 0, Response(429, {"Retry-After": "1"})), 1.0)
+        self.assertEquals(policy.get_delay(u"GET", 0, Response(429, {"Retry-After": "60"})), 1.5)
+
+    def test_token_bucket(self):
+        now = [100.0]
+        bucket = retry.TokenBucket(rate=2, capacity=2, clock=lambda: now[0])
+        self.assertEquals(bucket.reserve(), 0)
+        self.assertEquals(bucket.reserve(), 0)
+        self.assertEquals(bucket.reserve(), 0.5)
+        self.assertEquals(bucket.reserve(), 1.0)
+        now[0] += 1.0
+        self.assertEquals(bucket.reserve(), 0.5)
+
+    def test_encode_resource(self):
+        data = {"organisation": u"salesking", "addresses": [{"city": u"K\u00f6ln"}]}
+        payload = serializers.encode_resource("client", data)
+        self.assertEquals(json.loads(payload), {"client": data})
+        self.assertEquals(payload.find(": "), -1)
+
+    def test_encode_resource_debug_stats(self):
+        stats = retry.RequestStats()
+        serializers.encode_resource("client", {"organisation": u"salesking"}, stats)
+        self.assertEquals(stats.payload_bytes, 0)
+        log = logging.getLogger(serializers.__name__)
+        level = log.level
+        log.setLevel(logging.DEBUG)
+        try:
+            payload = serializers.encode_resource("client", {"organisation": u"salesking"}, stats)
+        finally:
+            log.setLevel(level)
+        self.assertEquals(stats.payload_bytes, len(payload))
+        self.assertTrue(stats.encode_time > 0)
+
+    def test_loads_compact(self):
+        content = json.dumps({"clients": [{"client": {"id": u"c1", "notes": None,
+                                                      "addresses": [{"city": u"K\u00f6ln", "zip": None}]},
+                                           "links": [{"rel": u"self"}]}],
+                              "links": [], "collection": {"total_pages": 1}})
+        self.assertEquals(serializers.loads_compact(content),
+                          {"clients": [{"client": {"id": u"c1", "addresses": [{"city": u"K\u00f6ln"}]}}],
+                           "collection": {"total_pages": 1}})
+        self.assertEquals(serializers.loads_compact(content.decode("utf-8"))["collection"],
+                          {"total_pages": 1})
+
+    def test_copy_json(self):
+        data = {"id": u"c1", "addresses": [{"city": u"Berlin"}], "order": (1, 2)}
+        copied = serializers.copy_json(data)
+        self.assertEquals(copied, data)
+        self.assertFalse(copied["addresses"] is data["addresses"])
+        self.assertFalse(copied["addresses"][0] is data["addresses"][0])
+
+
+class CodegenTestCase(SalesKingBaseTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(self.tmp_dir, "compiled_schemes.py")
+        self.assertEquals(codegen.generate(path, names=[u"invoice", u"client", u"document"]),
+                          [u"invoice", u"client"])
+        self.module = imp.load_source("compiled_schemes_test", path)
+        self.generated = loaders._generated
+        self.original = loaders.import_schema_to_json
+        self.calls = []
+        def counting_import(name):
+            self.calls.append(name)
+            return self.original(name)
+        loaders.import_schema_to_json = counting_import
+        loaders._generated = self.module
+        loaders.clear_schema_registry()
+
+    def tearDown(self):
+        loaders.import_schema_to_json = self.original
+        loaders._generated = self.generated
+        loaders.clear_schema_registry()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_generated_module(self):
+        self.assertEquals(self.module.FORMAT, loaders.GENERATED_FORMAT)
+        self.assertEquals(self.module.SOURCES[u"invoice"],
+                          (u"invoice", u"client", u"address", u"attachment", u"line_item"))
+        self.assertEquals(sorted(self.module.SCHEMES.keys()), [u"client", u"invoice"])
+
+    def test_prefers_generated_module(self):
+        generated = loaders.get_compiled_schema(u"invoice")
+        self.assertEquals(self.calls, [])
+        schema, tables = loaders.compile_schema(u"invoice")
+        self.assertEquals(generated.schema, schema)
+        for table in loaders.TABLES:
+            self.assertEquals(getattr(generated, table), tables[table])
+        self.assertEquals(generated.endpoints[u"schema"],
+                          (u"GET", u"invoices/schema", u"invoices/schema", None))
+        self.assertEquals(generated.endpoints[u"payment_reminders"][2:],
+                          (u"invoices/", u"/payment_reminders"))
+        self.failUnlessRaises(TypeError, generated.schema['properties'].__setitem__, 'x', 1)
+        self.assertTrue(generated.filter_checkers[u"from"](u"2012-01-01"))
+
+    def test_falls_back_to_newer_scheme_files(self):
+        self.module.GENERATED_AT = os.path.getmtime(loaders.get_schema_path(u"client")) - 1
+        loaders.get_compiled_schema(u"invoice")
+        self.assertEquals(self.calls[0], u"invoice")
+        self.calls[:] = []
+        loaders.get_compiled_schema(u"estimate")
+        self.assertEquals(self.calls[0], u"estimate")
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    bounded caches shared by the api clients
+"""
+import time
+import copy
+import threading
+from collections import OrderedDict
+
+from salesking.utils.retry import RequestStats
+
+
+class LRUCache(object):
+    """
+    thread safe mapping keeping the maxsize most recently used entries
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                return default
+            self._data[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def keys(self):
+        with self._lock:
+            return self._data.keys()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def __repr__(self):
+        return u"<LRUCache %s/%s>" % (len(self), self.maxsize)
+
+
+class CacheBackend(object):
+    """
+    storage of an ObjectCache
+    keys are strings, values plain json like data, so a shared store
+    (memcached, redis, ...) can implement it
+    """
+    def get(self, key):
+        """
+        :returns the value or None if missing or expired
+        """
+        raise NotImplementedError()
+
+    def set(self, key, value, ttl=None):
+        """
+        :param ttl: seconds the value is valid, None keeps it until dropped
+        """
+        raise NotImplementedError()
+
+    def delete(self, key):
+        raise NotImplementedError()
+
+    def clear(self):
+        raise NotImplementedError()
+
+
+class MemoryBackend(CacheBackend):
+    """
+    in process backend keeping the maxsize most recently used values
+    """
+    def __init__(self, maxsize=1024, clock=time.time):
+        self._entries = LRUCache(maxsize)
+        self._clock = clock
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires is not None and expires <= self._clock():
+            self._entries.pop(key)
+            return None
+        return value
+
+    def set(self, key, value, ttl=None):
+        expires = self._clock() + ttl if ttl is not None else None
+        self._entries.set(key, (expires, value))
+
+    def delete(self, key):
+        self._entries.pop(key)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CacheStats(RequestStats):
+    """
+    thread safe object cache counters
+    """
+    FIELDS = (u"hits", u"misses", u"sets", u"invalidations")
+
+
+class ObjectCache(object):
+    """
+    read-through cache of loaded resources keyed by (resource type, id)
+    assign it to api_client.object_cache, loads through that client are
+    answered from the cache, successful saves refresh and deletes drop
+    the cached data
+
+    :param backend: CacheBackend, defaults to a MemoryBackend
+    :param ttl: default seconds an entry is valid, None never expires
+    :param ttls: resource type -> ttl overriding the default
+    """
+    def __init__(self, backend=None, ttl=60, ttls=None):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.ttls = dict(ttls or {})
+        self.stats = CacheStats()
+
+    def get_key(self, resource_type, id):
+        return u"%s:%s" % (resource_type, id)
+
+    def get(self, resource_type, id):
+        """
+        :returns a copy of the cached data or None
+        """
+        value = self.backend.get(self.get_key(resource_type, id))
+        if value is None:
+            self.stats.incr(u"misses")
+            return None
+        self.stats.incr(u"hits")
+        return copy.deepcopy(value)
+
+    def set(self, resource_type, id, data):
+        self.stats.incr(u"sets")
+        self.backend.set(self.get_key(resource_type, id), copy.deepcopy(data),
+                         self.ttls.get(resource_type, self.ttl))
+
+    def invalidate(self, resource_type, id):
+        self.stats.incr(u"invalidations")
+        self.backend.delete(self.get_key(resource_type, id))
+
+    def clear(self):
+        self.backend.clear()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    ahead of time compilation of the scheme files
+
+    python -m salesking.utils.codegen [path]
+
+    writes the resolved schemas and the lookup tables of loaders.CompiledSchema
+    of all scheme files as python literals into salesking/utils/compiled_schemes.py.
+    loaders.get_compiled_schema takes them from there instead of reading and
+    resolving the json files, unless a scheme file changed after the module
+    was generated. python setup.py build generates it as well.
+"""
+import os
+import sys
+import time
+import logging
+import py_compile
+
+from salesking.exceptions import SalesKingException
+from salesking.utils import loaders
+
+
+log = logging.getLogger(__name__)
+
+GENERATED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "compiled_schemes.py")
+
+HEADER = u'''# -*- coding: utf-8 -*-
+# generated by python -m salesking.utils.codegen from salesking/schemes
+# do not edit, scheme files changed afterwards are read instead
+from salesking.utils.loaders import ReadOnlyDict as D, ReadOnlyList as L
+
+FORMAT = %(format)r
+GENERATED_AT = %(generated_at)r
+
+'''
+
+
+def list_schemes():
+    """
+    :returns sorted names of the scheme files
+    """
+    return sorted(name[:-5] for name in os.listdir(loaders.SCHEMA_ROOT)
+                  if name.endswith(u".json"))
+
+def get_sources(name, seen=()):
+    """
+    :returns names of the scheme files name is resolved from, its own first
+    """
+    sources = [name]
+    for value in loaders.import_schema_to_json(name)['properties'].itervalues():
+        sub = value.get('properties')
+        if isinstance(sub, dict) and '$ref' in sub:
+            ref_name = loaders._ref_schema_name(sub['$ref'])
+            if ref_name in seen + (name,) or ref_name in sources:
+                continue
+            sources.extend(source for source in get_sources(ref_name, seen + (name,))
+                           if source not in sources)
+    return sources
+
+def to_source(obj):
+    """
+    python source of json data, dicts and lists become the read-only
+    containers of the schema registry, keys are sorted
+    """
+    if isinstance(obj, dict):
+        return u"D({%s})" % u", ".join(u"%s: %s" % (to_source(key), to_source(obj[key]))
+                                       for key in sorted(obj))
+    if isinstance(obj, list):
+        return u"L([%s])" % u", ".join(to_source(value) for value in obj)
+    if isinstance(obj, tuple):
+        return u"(%s)" % u"".join(u"%s, " % to_source(value) for value in obj)
+    if isinstance(obj, str):
+        obj = obj.decode("utf-8")
+    return unicode(repr(obj))
+
+def generate(path=GENERATED_PATH, names=None):
+    """
+    compiles the scheme files into the module at path
+    scheme files which can't be resolved are left out and stay with the
+    json loading
+    :param names: scheme names, default all
+    :returns names of the compiled schemes
+    """
+    generated_at = time.time()
+    lines = [HEADER % {'format': loaders.GENERATED_FORMAT, 'generated_at': generated_at}]
+    compiled = []
+    sources = []
+    for name in names or list_schemes():
+        try:
+            schema, tables = loaders.compile_schema(name)
+            sources.append(u"    %s: %s,\n" % (to_source(name), to_source(tuple(get_sources(name)))))
+        except SalesKingException, e:
+            log.warning(u"skipped scheme %s: %s" % (name, e.msg))
+            continue
+        lines.append(u"_%s = (\n    %s,\n    %s,\n)\n\n" % (name, to_source(schema), to_source(tables)))
+        compiled.append(name)
+    # name -> scheme files the entry was compiled from
+    lines.append(u"SOURCES = {\n%s}\n\n" % u"".join(sources))
+    # name -> (schema, tables) for loaders.CompiledSchema
+    lines.append(u"SCHEMES = {\n%s}\n" % u"".join(u"    %s: _%s,\n" % (to_source(name), name)
+                                                   for name in compiled))
+    tmp_path = u"%s.tmp" % path
+    with open(tmp_path, "wb") as out:
+        out.write(u"".join(lines).encode("utf-8"))
+    os.rename(tmp_path, path)
+    # byte compiled right away, compiling the large literals on import would
+    # take longer than reading the json files
+    py_compile.compile(path, doraise=True)
+    log.info(u"compiled %s schemes into %s" % (len(compiled), path))
+    return compiled
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    generate(*sys.argv[1:2])
@@ -20,6 +20,20 @@ def pluralize(data_type):
         return known[data_type]
     else:
         return u"%ss" % data_type
+
+def singularize(plural):
+    """
+    reverse of pluralize, addresses -> address
+    """
+    known = {
+             u"addresses": u"address",
+             u"companies": u"company"
+    }
+    if plural in known:
+        return known[plural]
+    if plural.endswith(u"s"):
+        return plural[:-1]
+    return plural
     
 def remove_properties_containing_None(properties_dict):
     """
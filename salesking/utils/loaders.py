@@ -2,6 +2,7 @@ import copy
 import sys
 import os
 import logging
+import threading
 
 try:
     import simplejson as json
@@ -11,7 +12,8 @@ except ImportError:
 from StringIO import StringIO
 
 from salesking.exceptions import SalesKingException
-from salesking.conf.settings import SCHEMA_ROOT
+from salesking.utils import validators, helpers
+from salesking.conf import SCHEMA_ROOT
 
 
 log = logging.getLogger(__name__)
@@ -31,11 +33,17 @@ def import_schema_to_json(name):
     schema = json.loads(schema_file)
     return copy.deepcopy(schema)
 
+def _ref_schema_name(ref_schema_uri):
+    """
+    ./line_item.json#properties -> line_item
+    """
+    return ref_schema_uri.split("/")[1].split("#")[0].split(".")[0]
+
 def load_ref_schema(ref_schema_uri):
     """
     loads a referenced schema
     """
-    sub_schema = ref_schema_uri.split("/")[1].split("#")[0].split(".")[0]
+    sub_schema = _ref_schema_name(ref_schema_uri)
     return import_schema_to_json(sub_schema)
 
 def load_schema(name):
@@ -43,7 +51,35 @@ def load_schema(name):
     loads the schema by name
     :param name name of the model
     """
-    schema = import_schema_to_json(name)
+    return resolve_schema(import_schema_to_json(name))
+
+def _resolve_properties(properties, seen=()):
+    """
+    inlines the referenced schemas of nested arrays and objects, their own
+    references included, and patches the required flags
+    :param seen: names of the schemas already inlined above, to stop cycles
+    """
+    for property, value in properties.iteritems():
+        sub = value.get('properties')
+        # arrays and objects may contain the nesting
+        if value.get('type') in ('array', 'object') and isinstance(sub, dict) and '$ref' in sub:
+            ref_name = _ref_schema_name(sub['$ref'])
+            if ref_name in seen:
+                value['properties'] = {}
+            else:
+                value['properties'] = copy.deepcopy(load_ref_schema(sub['$ref'])['properties'])
+                _resolve_properties(value['properties'], seen + (ref_name,))
+        #ignore the required properties auto validation
+        #otherwise the json instnaciation breaks
+        if value.get('required') == True:
+            log.debug("patched required validation to False - asllowing auto schema validation")
+            value['required'] = False
+
+def resolve_schema(schema):
+    """
+    applies the salesking specific patches and resolves the nested schemas
+    :param schema: schema dict as read from the scheme file, changed in place
+    """
     #salesking specific swap
     #//set link relation as key name to make it easier to call these
     for item in schema['links']:
@@ -61,19 +97,7 @@ def load_schema(name):
         del item
     ## sk use nesting of schema
     ## dynamically loading
-    for property in schema['properties']:
-        value = schema['properties'][property]
-        # arrays may contain the nesting
-        if (value['type'] == 'array'):
-            if '$ref' in value['properties'].keys():
-                ref_schema_uri=value['properties']['$ref']
-                sub_schema = load_ref_schema(ref_schema_uri)
-                schema['properties'][property]['properties'] = copy.deepcopy(sub_schema['properties'])
-        #ignore the required properties auto validation
-        #otherwise the json instnaciation breaks
-        if 'required' in value.keys() and value['required'] == True:
-            log.debug("patched required validation to False - asllowing auto schema validation")
-            schema['properties'][property]['required'] = False
+    _resolve_properties(schema['properties'])
         #ignore the readonly properties auto validation
         #if 'readonly' in value.keys() and value['readonly'] == True:
         #    log.debug("patched required validation to none required")
@@ -84,10 +108,273 @@ def load_schema(name):
     return schema
 
 
+class ReadOnlyDict(dict):
+    """
+    dict handed out by the schema registry
+    deepcopy returns a plain (mutable) dict, so it is copy on write
+    """
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("schema registry entries are read-only, deepcopy first")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __deepcopy__(self, memo):
+        return dict((k, copy.deepcopy(v, memo)) for k, v in dict.iteritems(self))
+
+    def __copy__(self):
+        return dict(self)
+
+
+class ReadOnlyList(list):
+    """
+    list handed out by the schema registry
+    """
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("schema registry entries are read-only, deepcopy first")
+
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = _readonly
+    __iadd__ = __imul__ = _readonly
+    append = extend = insert = pop = remove = reverse = sort = _readonly
+
+    def __deepcopy__(self, memo):
+        return [copy.deepcopy(v, memo) for v in list.__iter__(self)]
+
+    def __copy__(self):
+        return list(self)
+
+
+def freeze(obj):
+    """
+    recursively converts dicts and lists into their read-only counterparts
+    """
+    if isinstance(obj, dict):
+        return ReadOnlyDict((k, freeze(v)) for k, v in obj.iteritems())
+    if isinstance(obj, list):
+        return ReadOnlyList(freeze(v) for v in obj)
+    return obj
+
+
+# names of the lookup tables of CompiledSchema
+TABLES = (u"links", u"filters", u"nested", u"relations", u"references", u"endpoints")
+
+
+def compile_tables(schema, raw_schema):
+    """
+    derives the lookup tables of CompiledSchema
+    :param schema: the resolved schema
+    :param raw_schema: the schema as read from the scheme file
+    :returns dict table name -> dict
+    """
+    links = dict()
+    filters = dict()
+    for link in schema.get('links', []):
+        # first link wins, same as the former linear lookups
+        links.setdefault(link['rel'], link)
+        if link['rel'] == u'instances':
+            for key, value in link.get('properties', {}).iteritems():
+                if key.startswith(u"filter[") and key.endswith(u"]"):
+                    filters[key[7:-1]] = value
+    nested = dict()
+    for property, value in raw_schema['properties'].iteritems():
+        sub = value.get('properties')
+        if isinstance(sub, dict) and '$ref' in sub:
+            nested[property] = _ref_schema_name(sub['$ref'])
+    relations = dict()
+    for rel, link in links.iteritems():
+        if rel in CRUD_RELS or link.get('method', u"GET") != u"GET" \
+                or u"{id}/" not in link['href']:
+            continue
+        # documents.json nests schemes which don't exist, such types are left out
+        if schema_resolves(helpers.singularize(rel)):
+            relations[rel] = helpers.singularize(rel)
+    references = dict()
+    for property in schema['properties']:
+        if property.endswith(u"_id") and schema_resolves(property[:-3]):
+            references[property[:-3]] = property[:-3]
+    endpoints = dict()
+    for rel, link in links.iteritems():
+        endpoints[rel] = split_href(link.get('method', u"GET"), link['href'])
+    if u"create" in links and u"schema" not in endpoints:
+        endpoints[u"schema"] = split_href(u"GET", u"%s/schema" % links[u"create"]['href'])
+    return {u"links": links, u"filters": filters, u"nested": nested,
+            u"relations": relations, u"references": references, u"endpoints": endpoints}
+
+def split_href(method, href):
+    """
+    clients/{id}/invoices -> (method, href, u"clients/", u"/invoices")
+    the suffix is None for hrefs without {id}
+    """
+    prefix, sep, suffix = href.partition(u"{id}")
+    return (method, href, prefix, suffix if sep else None)
+
+
+class CompiledSchema(object):
+    """
+    a loaded and resolved schema plus the lookup tables derived from it
+    
+    * schema: the read-only schema as returned by load_schema
+    * links: rel -> link
+    * filters: filter name (without the filter[] wrapping) -> property schema
+    * filter_checkers: filter name -> precompiled checker(value)
+    * nested: property name -> name of the referenced schema
+    * relations: rel of a sub-collection link -> resource type of its items,
+                 clients/{id}/invoices -> invoice
+    * references: name of a <name>_id property -> resource type it refers to,
+                  client_id -> client
+    * endpoints: rel -> (method, href, prefix, suffix), the href split at {id},
+                 rel schema included, see resources.get_endpoint_table
+    """
+    def __init__(self, name, schema, tables):
+        """
+        :param schema: the resolved schema
+        :param tables: dict as returned by compile_tables
+        schema and tables are frozen unless they are read-only already
+        """
+        self.name = name
+        self.schema = schema if isinstance(schema, ReadOnlyDict) else freeze(schema)
+        for table in TABLES:
+            value = tables[table]
+            setattr(self, table, value if isinstance(value, ReadOnlyDict) else freeze(value))
+        self.filter_checkers = ReadOnlyDict(
+            validators.compile_filter_checkers(self.filters))
+
+    def __repr__(self):
+        return u"<CompiledSchema %s>" % self.name
+
+
+# rels of the links every resource has, all others are relations
+CRUD_RELS = (u"self", u"instances", u"destroy", u"update", u"create", u"schema")
+
+def get_schema_path(name):
+    """
+    path of the scheme file of name
+    """
+    return os.path.join(SCHEMA_ROOT, u"%s.json" % name)
+
+def schema_exists(name):
+    """
+    True if there is a scheme file for name
+    """
+    return os.path.isfile(get_schema_path(name))
+
+# name -> names of the schemas nested by its scheme file, None if there is no file
+_nested_names = dict()
+
+def _get_nested_names(name):
+    """
+    names of the schemas load_schema(name) inlines directly, read once
+    """
+    if name not in _nested_names:
+        names = None
+        if schema_exists(name):
+            names = [_ref_schema_name(value['properties']['$ref'])
+                     for value in import_schema_to_json(name)['properties'].itervalues()
+                     if value.get('type') in ('array', 'object')
+                     and isinstance(value.get('properties'), dict) and '$ref' in value['properties']]
+        _nested_names[name] = names
+    return _nested_names[name]
+
+def schema_resolves(name, seen=()):
+    """
+    True if there are scheme files for name and all schemas it nests,
+    so load_schema(name) succeeds
+    """
+    names = _get_nested_names(name)
+    if names is None:
+        return False
+    return all(schema_resolves(ref_name, seen + (name,))
+               for ref_name in names if ref_name not in seen + (name,))
+
+
+# module written by salesking.utils.codegen
+GENERATED_MODULE = "salesking.utils.compiled_schemes"
+# bumped whenever the layout of the generated module changes
+GENERATED_FORMAT = 2
+# the generated module, False until it was looked for, None if there is none
+_generated = False
+
+def get_generated_module():
+    """
+    returns the module generated by codegen, None if it was not generated
+    or generated by another version of the code generator
+    """
+    global _generated
+    if _generated is False:
+        try:
+            module = __import__(GENERATED_MODULE, fromlist=["SCHEMES"])
+        except ImportError:
+            module = None
+        if module is not None and getattr(module, 'FORMAT', None) != GENERATED_FORMAT:
+            log.warning(u"ignoring %s, generated with another format" % GENERATED_MODULE)
+            module = None
+        _generated = module
+    return _generated
+
+def load_generated(name):
+    """
+    :returns (schema, tables) of name from the generated module, None if the
+             module has no entry for it or one of its scheme files changed
+             after the module was generated
+    """
+    module = get_generated_module()
+    if module is None or name not in module.SCHEMES:
+        return None
+    for source in module.SOURCES[name]:
+        try:
+            if os.path.getmtime(get_schema_path(source)) > module.GENERATED_AT:
+                log.debug(u"%s.json is newer than %s" % (source, GENERATED_MODULE))
+                return None
+        except OSError:
+            return None
+    return module.SCHEMES[name]
+
+def compile_schema(name):
+    """
+    reads and resolves the scheme file of name
+    :returns (schema, tables)
+    """
+    raw_schema = import_schema_to_json(name)
+    schema = resolve_schema(copy.deepcopy(raw_schema))
+    return schema, compile_tables(schema, raw_schema)
+
+
+_registry = dict()
+_registry_lock = threading.Lock()
+
+
+def get_compiled_schema(name):
+    """
+    returns the CompiledSchema for name from the process wide registry
+    it is taken from the module generated by codegen if that is up to date,
+    otherwise the scheme file is read and resolved, on first access only
+    """
+    try:
+        return _registry[name]
+    except KeyError:
+        pass
+    with _registry_lock:
+        if name not in _registry:
+            compiled = load_generated(name)
+            if compiled is None:
+                compiled = compile_schema(name)
+            _registry[name] = CompiledSchema(name, *compiled)
+        return _registry[name]
+
+
+def clear_schema_registry():
+    """
+    drops all compiled schemas, the next lookup reads the files again
+    """
+    with _registry_lock:
+        _registry.clear()
+        _nested_names.clear()
+
+
 def load_schema_raw(name):
     """
     loads the json schema and all referenced schemas 
     then converts to dict 
+    the returned schema is shared and read-only, deepcopy it before changing
     """
-    json_obj = load_schema(name)
-    return json_obj
\ No newline at end of file
+    return get_compiled_schema(name).schema
\ No newline at end of file
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    retry policy, client side rate limiting and the request counters
+    used by the api clients
+"""
+import time
+import random
+import threading
+from email.utils import parsedate_tz, mktime_tz
+
+
+IDEMPOTENT_METHODS = frozenset([u"GET", u"HEAD", u"OPTIONS", u"PUT", u"DELETE"])
+# statuses worth another try
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+def parse_retry_after(value, now=None):
+    """
+    :param value: Retry-After header, delta seconds or a http date
+    :returns seconds to wait or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    now = time.time() if now is None else now
+    return max(0.0, mktime_tz(parsed) - now)
+
+
+class RetryPolicy(object):
+    """
+    decides if and when a failed request is sent again
+
+    * 5xx and connection errors are retried for idempotent methods only
+    * 429 is retried for all methods, the request was not processed
+    * the delay is exponential with full jitter, capped by max_backoff
+      a Retry-After header of the response takes precedence
+    """
+    def __init__(self, max_retries=3, backoff_factor=0.5, max_backoff=30,
+                 methods=IDEMPOTENT_METHODS, statuses=RETRY_STATUSES, jitter=True):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.methods = frozenset(m.upper() for m in methods)
+        self.statuses = frozenset(statuses)
+        self.jitter = jitter
+
+    def is_retryable(self, method, status=None):
+        """
+        :param status: response status or None for connection errors
+        """
+        if status == 429:
+            return True
+        if status is not None and status not in self.statuses:
+            return False
+        return method.upper() in self.methods
+
+    def backoff(self, attempt):
+        """
+        :param attempt: number of retries done so far, starting with 0
+        """
+        delay = min(self.max_backoff, self.backoff_factor * (2 ** attempt))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def get_delay(self, method, attempt, response=None):
+        """
+        :param attempt: number of retries done so far
+        :param response: the failed response, None for connection errors
+        :returns seconds to wait before the next try, None to give up
+        """
+        if attempt >= self.max_retries:
+            return None
+        status = response.status_code if response is not None else None
+        if not self.is_retryable(method, status):
+            return None
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return min(retry_after, self.max_backoff)
+        return self.backoff(attempt)
+
+
+class TokenBucket(object):
+    """
+    thread safe token bucket
+    rate tokens are added per second up to capacity, every request takes one
+    """
+    def __init__(self, rate, capacity=1, clock=time.time):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        takes a token, possibly one that is only available in the future
+        :returns seconds the caller has to wait before using it
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        """
+        blocks until a token is available
+        :returns seconds waited
+        """
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class RequestStats(object):
+    """
+    thread safe request counters
+
+    * requests: requests sent, retries included
+    * retries: requests sent again
+    * throttled_time: seconds waited for the rate limiter or on 429 responses
+    * backoff_time: seconds waited before retrying other failures
+    * not_modified: conditional requests answered with 304
+    * payload_bytes, encode_time: size and seconds spent encoding request
+      bodies, only counted with debug logging of salesking.utils.serializers
+    """
+    FIELDS = (u"requests", u"retries", u"throttled_time", u"backoff_time", u"not_modified",
+              u"payload_bytes", u"encode_time")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._values = dict((field, 0) for field in self.FIELDS)
+
+    def incr(self, field, value=1):
+        with self._lock:
+            self._values[field] += value
+
+    def incr_many(self, *pairs):
+        """
+        :param pairs: (field, value) tuples added under a single lock
+        """
+        with self._lock:
+            for field, value in pairs:
+                self._values[field] += value
+
+    def __getattr__(self, field):
+        if field in self.FIELDS:
+            return self._values[field]
+        raise AttributeError(field)
+
+    def as_dict(self):
+        with self._lock:
+            return dict(self._values)
+
+    def __repr__(self):
+        return u"<RequestStats %s>" % self.as_dict()
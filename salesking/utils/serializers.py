@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    json encoding of request payloads and decoding of responses
+    ujson is used when installed, otherwise simplejson or the stdlib json
+"""
+import time
+import logging
+try:
+    import ujson as fast_json
+except ImportError:
+    fast_json = None
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+
+log = logging.getLogger(__name__)
+
+_encoder = json.JSONEncoder(separators=(',', ':'))
+
+
+def _compact_object(obj):
+    # nulls would fail the schema validation and the links of the
+    # objects are not used, neither are kept
+    if u"links" in obj:
+        del obj[u"links"]
+    if None in obj.itervalues():
+        for key in [key for key, value in obj.iteritems() if value is None]:
+            del obj[key]
+    return obj
+
+_compact_decoder = json.JSONDecoder(object_hook=_compact_object)
+
+
+def dumps(obj):
+    """
+    compact json of obj with the fastest codec available
+    """
+    if fast_json is not None:
+        return fast_json.dumps(obj)
+    return _encoder.encode(obj)
+
+def loads_compact(content):
+    """
+    decodes a response body in one pass, dropping null properties and
+    links of every object while it is parsed
+    :param content: json str (utf-8) or unicode
+    """
+    if isinstance(content, str):
+        content = content.decode("utf-8")
+    return _compact_decoder.decode(content)
+
+def copy_json(obj):
+    """
+    deep copy of json data, much cheaper than copy.deepcopy
+    dicts (models included) and lists are copied as plain dicts and lists,
+    everything else is kept as immutable
+    """
+    if isinstance(obj, dict):
+        return dict((key, copy_json(value)) for key, value in dict.iteritems(obj))
+    if isinstance(obj, list):
+        return [copy_json(value) for value in obj]
+    return obj
+
+def encode_resource(resource_type, data, stats=None):
+    """
+    :param data: dict (or model) of the resource properties
+    :param stats: RequestStats, with debug logging enabled the payload
+                  size and encode time are logged and added to it
+    :returns the payload {"<resource_type>": data}
+    """
+    if not log.isEnabledFor(logging.DEBUG):
+        # dict() takes the properties without the deep copies of the model
+        return dumps({resource_type: dict(data)})
+    start = time.time()
+    payload = dumps({resource_type: dict(data)})
+    elapsed = time.time() - start
+    log.debug("encoded %s: %s bytes in %.3fms", resource_type, len(payload), elapsed * 1000)
+    if stats is not None:
+        stats.incr_many((u"payload_bytes", len(payload)), (u"encode_time", elapsed))
+    return payload
@@ -1,10 +1,19 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import iso8601
-import validictory
-from validictory.validator import DEFAULT_FORMAT_VALIDATORS
-    
+from datetime import datetime
+
+
+# json schema type -> python types
+JSON_TYPES = {
+        "array" : list, "boolean" : bool, "integer" : int, "null" : type(None),
+        "number" : (int, float), "object" : dict, "string" : basestring,
+
+}
+
+# errors raised by the format checks on invalid values
+FORMAT_ERRORS = (ValueError, TypeError)
+
 
 def validate_format_iso8601(validator, fieldname, value, format_option):
     """
@@ -12,17 +21,101 @@ def validate_format_iso8601(validator, fieldname, value, format_option):
     raises value error if the value for fieldname does not match the format
     is iso8601 eg #"2007-06-20T12:34:40+03:00"
     """
+    from validictory.validator import ValidationError
     try:
-        iso8601.parse_date(value)
-    except ValueError:
+        _check_date_time(value)
+    except FORMAT_ERRORS:
         raise ValidationError(
             "Value %(value)r of field '%(fieldname)s' is not in "
             "'iso8601 YYYY-MM-DDThh:mm:ss(+/-)hh:mm' format" % locals())
 
+# validictory defaults plus iso8601 date-time, the global defaults stay untouched
+# built on first use, so validictory is only imported when needed
+_format_validators = None
+
+def get_format_validators():
+    global _format_validators
+    if _format_validators is None:
+        from validictory.validator import DEFAULT_FORMAT_VALIDATORS
+        format_validators = dict(DEFAULT_FORMAT_VALIDATORS)
+        format_validators['date-time'] = validate_format_iso8601
+        _format_validators = format_validators
+    return _format_validators
+
 def json_schema_validation_format(value, schema_validation_type):
     """
     adds iso8601 to the datetimevalidator
     raises SchemaError if validation fails
     """
-    DEFAULT_FORMAT_VALIDATORS['date-time'] = validate_format_iso8601
-    validictory.validate(value, schema_validation_type, format_validators=DEFAULT_FORMAT_VALIDATORS)
+    import validictory
+    validictory.validate(value, schema_validation_type, format_validators=get_format_validators())
+
+
+def _check_date(value):
+    datetime.strptime(value, '%Y-%m-%d')
+
+def _check_time(value):
+    datetime.strptime(value, '%H:%M:%S')
+
+def _check_date_time(value):
+    # iso8601 is imported on the first date-time check
+    import iso8601
+    try:
+        iso8601.parse_date(value)
+    except iso8601.ParseError, e:
+        raise ValueError(str(e))
+
+# format -> callable raising one of FORMAT_ERRORS on invalid values
+FORMAT_CHECKERS = {
+        u"date": _check_date,
+        u"time": _check_time,
+        u"date-time": _check_date_time,
+}
+
+
+def compile_filter_checker(property_schema, types=JSON_TYPES):
+    """
+    compiles the schema of a single filter property into a checker
+    :param property_schema: the filter entry of the instances link
+    :param types: json schema type -> python type mapping
+    :returns checker(value) returning True if value is a valid filter value
+    """
+    _type = property_schema.get('type')
+    string_format = property_schema.get('format')
+    if _type == u"date":
+        # some schemes use type date instead of string with format date
+        _type, string_format = u"string", u"date"
+    if _type is None:
+        # untyped filters accept anything
+        return lambda value: True
+    if _type not in types:
+        return lambda value: False
+    python_type = types[_type]
+    if not isinstance(python_type, tuple):
+        python_type = (python_type,)
+    # bool inherits from int, so ensure bools aren't reported as integers
+    reject_bool = int in python_type and bool not in python_type
+    format_checker = None
+    if _type == u"string" and string_format is not None:
+        format_checker = FORMAT_CHECKERS.get(string_format)
+
+    def checker(value):
+        if not isinstance(value, python_type):
+            return False
+        if reject_bool and isinstance(value, bool):
+            return False
+        if format_checker is not None:
+            try:
+                format_checker(value)
+            except FORMAT_ERRORS:
+                return False
+        return True
+    return checker
+
+def compile_filter_checkers(filters, types=JSON_TYPES):
+    """
+    :param filters: filter name -> filter property schema
+    :returns filter name -> checker(value)
+    """
+    return dict((key, compile_filter_checker(value, types))
+                for key, value in filters.iteritems())
@@ -1,4 +1,7 @@
+import os
+import logging
 from setuptools import setup, find_packages
+from setuptools.command.build_py import build_py
 
 CLASSIFIERS = [
     'Development Status :: 4 - Beta',
@@ -13,6 +16,22 @@ CLASSIFIERS = [
 ]
 
 
+class build_py_with_schemes(build_py):
+    """
+    compiles the scheme files into salesking/utils/compiled_schemes.py
+    of the build, see salesking.utils.codegen
+    """
+    def run(self):
+        build_py.run(self)
+        try:
+            from salesking.utils import codegen
+        except ImportError, e:
+            logging.warning("schemes not compiled: %s" % e)
+            return
+        path = os.path.join(self.build_lib, "salesking", "utils", "compiled_schemes.py")
+        codegen.generate(path)
+
+
 setup(
     name='salesking',
     version='0.0.1',
@@ -37,9 +56,18 @@ setup(
     dependency_links = [
         'https://github.com/bcwaldon/warlock/tarball/0.8.0#egg=warlock-0.8.0',
     ],             
+    extras_require={
+        # asyncio transport salesking.async_api
+        'async': ['trollius'],
+        # faster json encoding of request payloads
+        'speedups': ['ujson'],
+        # array columns and vectorised group_by of salesking.frame
+        'frame': ['numpy'],
+    },
     tests_require=[
         'mock==1.0.1',
     ],
+    cmdclass={'build_py': build_py_with_schemes},
     include_package_data=True,
     zip_safe = False,
     #test_suite = 'runtests.main',